@@ -0,0 +1,137 @@
+from __future__ import annotations
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Tuple
+
+from paged import PagedBTree, PageFault
+
+
+# An asyncio front-end for PagedBTree. Every operation runs the synchronous
+# tree code on the event loop with blocking reads turned into PageFaults: the
+# missing page is read on a bounded thread pool while the loop serves other
+# requests, then the operation is retried. Concurrent faults on one page share
+# a single read. Writes first fault in the path to their key with a lookup and
+# then run as one synchronous step, so no change is ever left half done; the
+# siblings a split or rebalance touches are read synchronously if not resident.
+class AsyncBTree:
+    def __init__(self, tree: PagedBTree, max_workers: int = 4):
+        self.tree = tree
+        self.store = tree.store
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='btree-io')
+        self._reads: Dict[int, asyncio.Future] = {}
+        self.faults = 0
+
+    @classmethod
+    def open(cls, path: str, m: int = None, page_size: int = 4096, pool_pages: int = None,
+             max_workers: int = 4) -> AsyncBTree:
+        return cls(PagedBTree(path, m, page_size, pool_pages), max_workers)
+
+    async def _run(self, operation: Callable):
+        while True:
+            self.store.raise_faults = True
+            try:
+                return operation()
+            except PageFault as fault:
+                page_id = fault.page_id
+            finally:
+                self.store.raise_faults = False
+            await self._fetch(page_id)
+
+    async def _fetch(self, page_id: int):
+        self.faults += 1
+        read = self._reads.get(page_id)
+        if read is None:
+            read = asyncio.ensure_future(self._read(page_id))
+            self._reads[page_id] = read
+        await read
+
+    # The read leaves _reads as soon as it is done, not in a done callback
+    # that runs later: its data may be gone by the time the waiters retry,
+    # thrown away after a write or evicted again, and a retry that got the
+    # finished read once more would spin without ever yielding to the loop.
+    async def _read(self, page_id: int):
+        try:
+            writes = self.tree.file.writes
+            data = await asyncio.get_running_loop().run_in_executor(self.executor, self.tree.file.read, page_id)
+            # a page written while it was read may be torn, the retry faults again
+            if self.tree.file.writes == writes:
+                self.store.prefetched[page_id] = data
+        finally:
+            self._reads.pop(page_id, None)
+
+    async def get(self, key, default=None):
+        return await self._run(lambda: self.tree.get(key, default))
+
+    async def contains(self, key) -> bool:
+        return await self._run(lambda: key in self.tree)
+
+    async def insert(self, key, value=None):
+        await self._run(lambda: self.tree.search(key))
+        self.tree.insert(key, value)
+
+    async def put(self, key, value):
+        await self._run(lambda: self.tree.search(key))
+        self.tree.put(key, value)
+
+    async def delete(self, key):
+        await self._run(lambda: self.tree.search(key))
+        self.tree.delete(key)
+
+    async def insert_many(self, keys: Iterable[int], values: Iterable[Any] = None):
+        keys = list(keys)
+        for key in keys:
+            await self._run(lambda: self.tree.search(key))
+        self.tree.insert_many(keys, values)
+
+    async def delete_many(self, keys: Iterable[int]) -> int:
+        keys = list(keys)
+        for key in keys:
+            await self._run(lambda: self.tree.search(key))
+        return self.tree.delete_many(keys)
+
+    # yields (key, value) with lo <= key < hi, a fault restarts the scan after
+    # the last key it produced
+    async def items(self, lo=None, hi=None) -> AsyncIterator[Tuple[int, Any]]:
+        iterator = None
+        last = None
+        while True:
+            self.store.raise_faults = True
+            try:
+                if iterator is None:
+                    iterator = self.tree.items(lo if last is None else last, hi)
+                item = next(iterator)
+                if last is not None and item[0] == last:
+                    item = next(iterator)
+            except StopIteration:
+                return
+            except PageFault as fault:
+                iterator = None
+                page_id = fault.page_id
+            else:
+                page_id = None
+            finally:
+                self.store.raise_faults = False
+            if page_id is not None:
+                await self._fetch(page_id)
+                continue
+            last = item[0]
+            yield item
+
+    async def range(self, lo=None, hi=None) -> AsyncIterator[int]:
+        async for key, _ in self.items(lo, hi):
+            yield key
+
+    # dirty pages are copied into the map on the loop, only the sync blocks
+    async def flush(self):
+        self.store.flush(sync=False)
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.tree.file.sync)
+
+    async def close(self):
+        self.tree.close()
+        self.executor.shutdown()
+
+    async def __aenter__(self) -> AsyncBTree:
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -0,0 +1,668 @@
+from __future__ import annotations
+import argparse
+import copy
+import gc
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from array import array
+from typing import Callable, List, Tuple
+
+from bloom import BloomBTree
+from btree import BPlusNode, CompactNode, Node
+from cow import CowBTree
+from latching import ConcurrentBTree
+import jsonpickle
+
+from paged import PagedBTree
+from sharded import ShardedBTree
+from static import StaticBTree
+from stats import TreeStats
+from tuning import RightBiasedSplit, TreeConfig, fill_report
+from wal import LoggedBTree
+
+ORDERS = [4, 8, 16, 32, 64, 128, 256, 512]
+WORKLOADS = ["sequential", "random", "zipfian", "mixed"]
+
+
+def insert_each(btree: Node, keys: List[int]) -> Node:
+    for key in keys:
+        btree = btree.insert(key)
+    return btree
+
+
+def delete_each(btree: Node, keys) -> Node:
+    for key in keys:
+        btree.delete(key)
+    return btree
+
+
+def build_tree(m: int, keys: List[int]) -> Node:
+    return insert_each(Node(m, [], is_leaf=True), keys)
+
+
+# the pre-bisect descent: one comparison per key, one frame per level
+def linear_search(node: Node, search_key) -> Tuple[bool, Node]:
+    for i, key in enumerate(node.keys):
+        if search_key == node.keys[i]:
+            return True, node
+        if search_key < node.keys[i] and not node.is_leaf:
+            return linear_search(node.children[i], search_key)
+    if not node.is_leaf:
+        return linear_search(node.children[-1], search_key)
+    return False, node
+
+
+# the pre-bisect sibling lookup: a node finds itself by comparing key lists
+# with every child of its parent and merges rebuild the children list
+class ScanNode(Node):
+    def _siblings(self) -> Tuple[Node, Node, int]:
+        for i, child in enumerate(self.parent.children):
+            if child.keys == self.keys:
+                if i != 0:
+                    return self.parent.children[i - 1], None, i - 1
+                if i != len(self.parent.children) - 1:
+                    return None, self.parent.children[i + 1], i
+        return None, None, None
+
+    def _remove_child(self, index: int) -> Node:
+        removed = self.children[index]
+        self.children = [child for child in self.children if child.keys != removed.keys]
+        return removed
+
+
+# runs fn with the cyclic gc paused, parent pointers make every tree a big cycle
+def timed(fn: Callable) -> Tuple[float, object]:
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        result = fn()
+        return time.perf_counter() - start, result
+    finally:
+        gc.enable()
+
+
+# the times of repeat runs of fn, sorted
+def timed_runs(fn: Callable, repeat: int) -> List[float]:
+    return sorted(timed(fn)[0] for _ in range(repeat))
+
+
+# the median rate of count operations over times, with the slowest and fastest run
+def rate_spread(count: int, times: List[float]) -> str:
+    return "%.0f (%.0f-%.0f)" % (count / times[len(times) // 2], count / times[-1], count / times[0])
+
+
+def time_lookups(search: Callable, btree: Node, probes: List[int]) -> float:
+    def run():
+        for probe in probes:
+            search(btree, probe)
+    return timed(run)[0]
+
+
+def bench_lookup(args):
+    rng = random.Random(args.seed)
+    keys = list(range(0, 2 * args.size, 2))
+    rng.shuffle(keys)
+    # half hits, half misses
+    probes = [rng.randrange(2 * args.size) for _ in range(args.probes)]
+    print("%6s %12s %12s %8s" % ("m", "linear/s", "bisect/s", "speedup"))
+    for m in args.orders:
+        btree = build_tree(m, keys)
+        linear = time_lookups(linear_search, btree, probes)
+        binary = time_lookups(Node.search, btree, probes)
+        print("%6d %12.0f %12.0f %7.2fx" % (m, len(probes) / linear, len(probes) / binary, linear / binary))
+
+
+def bench_batch(args):
+    rng = random.Random(args.seed)
+    base = list(range(0, 4 * args.size, 4))
+    batch = [rng.randrange(4 * args.size) for _ in range(args.batch)]
+    print("%6s %14s %14s %14s %14s" % ("m", "insert/s", "insert_many/s", "delete/s", "delete_many/s"))
+    for m in args.orders:
+        rates = []
+        for batched in (False, True):
+            btree = Node.bulk_load(m, base)
+            if batched:
+                inserted, btree = timed(lambda: btree.insert_many(batch))
+                deleted, _ = timed(lambda: btree.delete_many(batch))
+            else:
+                inserted, btree = timed(lambda: insert_each(btree, batch))
+                deleted, _ = timed(lambda: delete_each(btree, set(batch)))
+            rates.append((len(batch) / inserted, len(batch) / deleted))
+        print("%6d %14.0f %14.0f %14.0f %14.0f" % (m, rates[0][0], rates[1][0], rates[0][1], rates[1][1]))
+
+
+# The two delete runs take turns on fresh trees, so that a slow stretch of the
+# machine hits both; the speedup is the median of the paired runs
+def bench_delete(args):
+    rng = random.Random(args.seed)
+    keys = range(args.size)
+    deletes = rng.sample(keys, min(args.deletes, args.size))
+    print("median (min-max) of %d runs" % args.repeat)
+    print("%6s %26s %26s %22s" % ("m", "scan/s", "bisect/s", "speedup"))
+    for m in args.orders:
+        times = {ScanNode: [], Node: []}
+        for _ in range(args.repeat):
+            for cls in (ScanNode, Node):
+                btree = cls.bulk_load(m, keys, args.fill_factor)
+                times[cls].append(timed(lambda: delete_each(btree, deletes))[0])
+                del btree
+        speedups = sorted(scan / bisected for scan, bisected in zip(times[ScanNode], times[Node]))
+        print("%6d %26s %26s %22s" % (m, rate_spread(len(deletes), sorted(times[ScanNode])),
+                                      rate_spread(len(deletes), sorted(times[Node])),
+                                      "%.2fx (%.2f-%.2f)" % (speedups[len(speedups) // 2], speedups[0], speedups[-1])))
+
+
+def bench_vector(args):
+    import numpy as np
+    rng = np.random.default_rng(args.seed)
+    probes = rng.integers(0, 2 * args.size, args.probes)
+    print("%6s %-12s %12s %14s %8s" % ("m", "node", "search/s", "search_batch/s", "speedup"))
+    for m in args.orders:
+        for cls in (Node, CompactNode):
+            btree = cls.bulk_load(m, range(0, 2 * args.size, 2))
+            looped, _ = timed(lambda: [btree.search(probe) for probe in probes.tolist()])
+            batched, _ = timed(lambda: btree.search_batch(probes))
+            print("%6d %-12s %12.0f %14.0f %7.2fx"
+                  % (m, cls.__name__, len(probes) / looped, len(probes) / batched, looped / batched))
+
+
+def bench_static(args):
+    rng = random.Random(args.seed)
+    probes = [rng.randrange(2 * args.size) for _ in range(args.probes)]
+    btree = Node.bulk_load(args.m, range(0, 2 * args.size, 2))
+    print("%-22s %12s" % ("tree", "lookups/s"))
+    searched, _ = timed(lambda: [btree.search(probe) for probe in probes])
+    print("%-22s %12.0f" % ("Node m=%d" % args.m, len(probes) / searched))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "static.bin")
+        for block in args.blocks:
+            static = btree.freeze(block)
+            searched, _ = timed(lambda: [static.search(probe) for probe in probes])
+            print("%-22s %12.0f" % ("StaticBTree block=%d" % block, len(probes) / searched))
+            static.save(path)
+            with StaticBTree.open(path) as mapped:
+                searched, _ = timed(lambda: [mapped.search(probe) for probe in probes])
+                print("%-22s %12.0f" % ("  mapped", len(probes) / searched))
+
+
+def bench_bloom(args):
+    rng = random.Random(args.seed)
+    # even keys are stored, a miss probes an odd one
+    probes = [rng.randrange(args.size) * 2 + (rng.random() < args.misses) for _ in range(args.probes)]
+    print("%-8s %-8s %12s %10s %10s" % ("tree", "filter", "lookups/s", "saved", "false pos"))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "btree.db")
+        PagedBTree.bulk_load(path, args.m, range(0, 2 * args.size, 2)).close()
+        for name in ("Node", "paged"):
+            for filtered in (False, True):
+                btree = Node.bulk_load(args.m, range(0, 2 * args.size, 2)) if name == "Node" else \
+                    PagedBTree(path, pool_pages=args.pool)
+                tree = BloomBTree(btree, args.fp_rate) if filtered else btree
+                if filtered:
+                    # the first lookup builds the filter
+                    tree.get(0)
+                looked_up, _ = timed(lambda: [probe in tree for probe in probes])
+                print("%-8s %-8s %12.0f %10s %10s" % (name, "bloom" if filtered else "-", len(probes) / looked_up,
+                                                     tree.saved if filtered else "", tree.false_positives if filtered else ""))
+                if name == "paged":
+                    btree.close()
+
+
+def bench_sharded(args):
+    import numpy as np
+    rng = np.random.default_rng(args.seed)
+    keys = np.arange(0, 2 * args.size, 2)
+    probes = rng.integers(0, 2 * args.size, args.probes)
+    # fresh keys for every run, a repeated batch would only find them present
+    inserts = np.split(rng.choice(args.size, args.inserts * args.repeat, replace=False) * 2 + 1, args.repeat)
+    print("%d cores, median (min-max) of %d runs after a warm-up run" % (os.cpu_count(), args.repeat))
+    print("%-10s %30s %30s" % ("tree", "lookups/s", "inserts/s"))
+    for shards in [None] + args.shards:
+        if shards is None:
+            name, tree = "Node", Node.bulk_load(args.m, keys.tolist())
+        else:
+            name, tree = "%d shards" % shards, ShardedBTree.bulk_load(args.m, keys, shards=shards)
+        # the warm-up run starts the workers and imports numpy in them
+        tree.search_batch(probes[:1000])
+        searches = timed_runs(lambda: tree.search_batch(probes), args.repeat)
+        # a plain tree gets python ints, as it would from its callers
+        batches = iter(inserts if shards else [batch.tolist() for batch in inserts])
+        inserted = timed_runs(lambda: tree.insert_many(next(batches)), args.repeat)
+        print("%-10s %30s %30s" % (name, rate_spread(len(probes), searches), rate_spread(args.inserts, inserted)))
+        if shards is not None:
+            tree.close()
+
+
+def bench_split(args):
+    rng = random.Random(args.seed)
+    workloads = {"sequential": list(range(args.size)), "random": rng.sample(range(args.size), args.size)}
+    print("%-10s %-22s %4s %12s %8s %8s %9s %6s" % ("workload", "split", "m", "inserts/s", "splits", "nodes",
+                                                   "leaf fill", "height"))
+    for workload, keys in workloads.items():
+        for policy in (None, RightBiasedSplit(args.fraction)):
+            config = TreeConfig(args.m, args.node_bytes, split_policy=policy)
+            inserted, btree = timed(lambda: insert_each(config.new(), keys))
+            with TreeStats().enable(config.node_class) as stats:
+                insert_each(config.new(), keys)
+            report = fill_report(btree)
+            print("%-10s %-22s %4d %12.0f %8d %8d %9.2f %6d" % (workload, policy or "even", config.m, len(keys) / inserted,
+                                                             stats.splits, report['nodes'], report['leaf_fill'],
+                                                             report['height']))
+
+
+def bench_range(args):
+    rng = random.Random(args.seed)
+    keys = range(args.size)
+    starts = [rng.randrange(max(1, args.size - args.length)) for _ in range(args.scans)]
+    print("%6s %14s %14s" % ("m", "b-tree keys/s", "b+-tree keys/s"))
+    for m in args.orders:
+        rates = []
+        for cls in (Node, BPlusNode):
+            btree = cls.bulk_load(m, keys)
+            scanned, _ = timed(lambda: [sum(1 for _ in btree.range(lo, lo + args.length)) for lo in starts])
+            rates.append(args.scans * args.length / scanned)
+        print("%6d %14.0f %14.0f" % (m, rates[0], rates[1]))
+
+
+def traced_size(build: Callable) -> Tuple[int, object]:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        return tracemalloc.get_traced_memory()[0], result
+    finally:
+        tracemalloc.stop()
+
+
+def bench_memory(args):
+    rng = random.Random(args.seed)
+    # iterating a range or an array creates the key objects inside the traced build
+    keys = range(args.size)
+    shuffled = list(keys)
+    rng.shuffle(shuffled)
+    shuffled = array("q", shuffled)
+    raw = args.size * 8
+    print("%6s %-12s %-12s %14s %14s" % ("m", "build", "node", "bytes", "bytes/key"))
+    for m in args.orders:
+        for build in ("bulk_load", "insert"):
+            for cls in (Node, CompactNode):
+                if build == "bulk_load":
+                    size, btree = traced_size(lambda: cls.bulk_load(m, keys))
+                else:
+                    size, btree = traced_size(lambda: insert_each(cls(m, [], is_leaf=True), shuffled))
+                print("%6d %-12s %-12s %14d %14.1f" % (m, build, cls.__name__, size, size / args.size))
+                del btree
+    print("raw int64 keys: %d bytes, 8.0 bytes/key" % raw)
+
+
+def bench_paged(args):
+    rng = random.Random(args.seed)
+    probes = [rng.randrange(args.size) for _ in range(args.probes)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "btree.db")
+        built, btree = timed(lambda: PagedBTree.bulk_load(path, args.m, range(args.size)))
+        btree.close()
+        print("bulk_load %d keys, m=%d: %.2fs, %d bytes" % (args.size, args.m, built, os.path.getsize(path)))
+        opened, btree = timed(lambda: PagedBTree(path, pool_pages=args.pool))
+        print("open: %.3fms" % (opened * 1000))
+        cold, _ = timed(lambda: [btree.get(probe) for probe in probes])
+        print("cold lookups: %.0f/s, %.2f page reads per lookup" % (len(probes) / cold, btree.file.reads / len(probes)))
+        warm, _ = timed(lambda: [btree.get(probe) for probe in probes])
+        print("warm lookups: %.0f/s" % (len(probes) / warm))
+        pool = btree.store
+        print("buffer pool: %d resident, %d hits, %d misses, %d evictions, hit ratio %.3f"
+              % (len(pool.resident), pool.hits, pool.misses, pool.evictions, pool.hits / (pool.hits + pool.misses)))
+        btree.close()
+
+
+def bench_serialize(args):
+    print("%-12s %12s %12s %14s" % ("format", "encode s", "decode s", "bytes"))
+    btree = Node.bulk_load(args.m, range(args.size))
+    encoded, text = timed(lambda: jsonpickle.encode(btree))
+    decoded, _ = timed(lambda: jsonpickle.decode(text))
+    print("%-12s %12.3f %12.3f %14d" % ("jsonpickle", encoded, decoded, len(text)))
+    del text
+    for cls in (Node, CompactNode):
+        btree = cls.bulk_load(args.m, range(args.size))
+        fp = io.BytesIO()
+        encoded, _ = timed(lambda: btree.dump(fp))
+        fp.seek(0)
+        decoded, _ = timed(lambda: cls.load(fp))
+        print("%-12s %12.3f %12.3f %14d" % (cls.__name__, encoded, decoded, len(fp.getvalue())))
+
+
+def bench_wal(args):
+    print("%8s %8s %12s %10s" % ("threads", "group", "commits/s", "fsyncs"))
+    for threads in args.threads:
+        for group_size in args.groups:
+            with tempfile.TemporaryDirectory() as directory:
+                btree = LoggedBTree(directory, args.m, group_size=group_size)
+                per_thread = args.ops // threads
+
+                # group 1 commits every put, larger groups are synced by the log once they are full
+                def write(start):
+                    for key in range(start, start + per_thread):
+                        btree.put(key, key)
+                        if group_size == 1:
+                            btree.commit()
+
+                workers = [threading.Thread(target=write, args=(i * per_thread,)) for i in range(threads)]
+                elapsed, _ = timed(lambda: [worker.start() for worker in workers] + [worker.join() for worker in workers])
+                btree.close()
+                print("%8d %8d %12.0f %10d" % (threads, group_size, per_thread * threads / elapsed, btree.wal.syncs))
+
+
+# the baseline: a plain tree behind one lock, as callers had to do so far
+class GlobalLockBTree:
+    def __init__(self, m: int, keys):
+        self.root = Node.bulk_load(m, keys)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            return self.root.get(key)
+
+    def put(self, key, value):
+        with self.lock:
+            self.root = self.root.put(key, value)
+
+    def delete(self, key):
+        with self.lock:
+            self.root.delete(key)
+
+
+def bench_concurrent(args):
+    keys = range(0, 2 * args.size, 2)
+    print("%8s %8s %-16s %12s" % ("threads", "writes", "tree", "ops/s"))
+    for threads in args.threads:
+        for btree in (GlobalLockBTree(args.m, keys), ConcurrentBTree.bulk_load(args.m, keys)):
+            per_thread = args.ops // threads
+
+            # each thread owns the odd keys congruent to its index, so deletes always find their key
+            def work(index):
+                rng = random.Random(index)
+                own = []
+                for _ in range(per_thread):
+                    if rng.random() < args.writes:
+                        if own and rng.random() < 0.5:
+                            btree.delete(own.pop())
+                        else:
+                            own.append(2 * (len(own) * threads + index) + 1)
+                            btree.put(own[-1], index)
+                    else:
+                        btree.get(rng.randrange(2 * args.size))
+
+            workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+            elapsed, _ = timed(lambda: [worker.start() for worker in workers] + [worker.join() for worker in workers])
+            print("%8d %8.2f %-16s %12.0f" % (threads, args.writes, type(btree).__name__, per_thread * threads / elapsed))
+
+
+def bench_snapshot(args):
+    rng = random.Random(args.seed)
+    keys = range(0, 2 * args.size, 2)
+    writes = [rng.randrange(2 * args.size) | 1 for _ in range(args.writes)]
+    btree = Node.bulk_load(args.m, keys)
+    copied, _ = timed(lambda: copy.deepcopy(btree))
+    inserted, _ = timed(lambda: insert_each(btree, writes))
+    print("Node     deepcopy: %10.3fms   inserts: %10.0f/s" % (copied * 1000, len(writes) / inserted))
+    cow = CowBTree.bulk_load(args.m, keys)
+    snapshotted, _ = timed(cow.snapshot)
+    inserted, _ = timed(lambda: [cow.insert(key) for key in writes])
+    print("CowBTree snapshot: %10.3fms   inserts: %10.0f/s" % (snapshotted * 1000, len(writes) / inserted))
+
+
+# n draws from keys where the i-th most popular key has weight 1 / (i + 1) ** skew,
+# the popular keys are spread over the key space
+def zipfian(rng: random.Random, keys: List[int], n: int, skew: float) -> List[int]:
+    popularity = rng.sample(keys, len(keys))
+    weights = list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(len(keys))))
+    return rng.choices(popularity, cum_weights=weights, k=n)
+
+
+# the keys to insert, the keys to look up and the keys to delete of a workload;
+# mixed looks up or changes keys of the tree built by its inserts instead
+def workload(name: str, size: int, ops: int, rng: random.Random, skew: float) -> Tuple[List[int], List[int], List[int]]:
+    keys = list(range(0, 2 * size, 2))
+    if name == "sequential":
+        return keys, keys[:ops], keys
+    inserts = rng.sample(keys, size)
+    if name == "zipfian":
+        return inserts, zipfian(rng, keys, ops, skew), rng.sample(keys, size)
+    # half of the lookups miss
+    return inserts, [rng.randrange(2 * size) for _ in range(ops)], rng.sample(keys, size)
+
+
+def search_each(btree: Node, keys: List[int]) -> int:
+    search = btree.search
+    return sum(search(key)[0] for key in keys)
+
+
+# a stream of lookups with a fraction of writes, an even key is deleted and
+# inserted back, so the tree keeps its size
+def mixed_each(btree: Node, keys: List[int], writes: float, rng: random.Random) -> Node:
+    operations = [(rng.random() < writes, key) for key in keys]
+    deleted = []
+
+    def run():
+        root = btree
+        for write, key in operations:
+            if not write:
+                root.search(key)
+            elif deleted and (key & 1 or len(deleted) > 64):
+                root = root.insert(deleted.pop())
+            elif not key & 1 and root.search(key)[0]:
+                root.delete(key)
+                deleted.append(key)
+            else:
+                root.search(key)
+        return root
+
+    return timed(run)
+
+
+def measure(args, name: str, m: int, size: int) -> List[dict]:
+    rng = random.Random("%d/%s/%d" % (args.seed, name, size))
+    inserts, probes, deletes = workload(name, size, args.ops, rng, args.skew)
+    best = {}
+    stats = TreeStats().enable(Node) if args.stats else None
+    for _ in range(args.repeat):
+        seconds = {}
+        seconds["insert"], btree = timed(lambda: build_tree(m, inserts))
+        if name == "mixed":
+            seconds["mixed"], btree = mixed_each(btree, probes, args.writes, random.Random(args.seed))
+        else:
+            seconds["search"], _ = timed(lambda: search_each(btree, probes))
+            seconds["delete"], _ = timed(lambda: delete_each(btree, deletes))
+        del btree
+        for operation, elapsed in seconds.items():
+            best[operation] = min(best.get(operation, elapsed), elapsed)
+    counts = {"insert": len(inserts), "search": len(probes), "delete": len(deletes), "mixed": len(probes)}
+    results = [{"workload": name, "operation": operation, "m": m, "size": size, "ops": counts[operation],
+                "seconds": elapsed, "ops_per_s": counts[operation] / elapsed}
+               for operation, elapsed in best.items()]
+    if stats:
+        stats.disable()
+        # the counters cover all repeats of every operation of the workload
+        results[0]["stats"] = stats.report()
+    return results
+
+
+def bench_suite(args):
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as fp:
+            for result in json.load(fp)["results"]:
+                baseline[result["workload"], result["operation"], result["m"], result["size"]] = result["ops_per_s"]
+    results = []
+    print("%-10s %-8s %5s %9s %12s %9s" % ("workload", "op", "m", "size", "ops/s", "vs base"))
+    for size in args.sizes:
+        for name in args.workloads:
+            for m in args.orders:
+                for result in measure(args, name, m, size):
+                    results.append(result)
+                    before = baseline.get((name, result["operation"], m, size))
+                    change = "%+8.1f%%" % (100 * (result["ops_per_s"] / before - 1)) if before else ""
+                    print("%-10s %-8s %5d %9d %12.0f %9s" % (name, result["operation"], m, size, result["ops_per_s"], change))
+    report = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "settings": {key: getattr(args, key) for key in ("sizes", "orders", "workloads", "ops", "writes", "skew",
+                                                       "repeat", "seed", "stats")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="B-tree benchmarks")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    lookup = subcommands.add_parser("lookup", help="point lookups: linear key scan vs bisect descent")
+    lookup.add_argument("--size", type=int, default=1_000_000)
+    lookup.add_argument("--probes", type=int, default=200_000)
+    lookup.add_argument("--orders", type=int, nargs="+", default=ORDERS)
+    lookup.add_argument("--seed", type=int, default=0)
+    lookup.set_defaults(run=bench_lookup)
+
+    batch = subcommands.add_parser("batch", help="single-key insert/delete vs insert_many/delete_many")
+    batch.add_argument("--size", type=int, default=1_000_000)
+    batch.add_argument("--batch", type=int, default=100_000)
+    batch.add_argument("--orders", type=int, nargs="+", default=ORDERS)
+    batch.add_argument("--seed", type=int, default=0)
+    batch.set_defaults(run=bench_batch)
+
+    delete = subcommands.add_parser("delete", help="random deletes: sibling lookup by key scan vs bisect")
+    delete.add_argument("--size", type=int, default=1_000_000)
+    delete.add_argument("--deletes", type=int, default=500_000)
+    delete.add_argument("--fill-factor", type=float, default=0.5, help="half full nodes merge on almost every delete")
+    delete.add_argument("--orders", type=int, nargs="+", default=ORDERS)
+    delete.add_argument("--repeat", type=int, default=5)
+    delete.add_argument("--seed", type=int, default=0)
+    delete.set_defaults(run=bench_delete)
+
+    vector = subcommands.add_parser("vector", help="numpy probes: search per key vs search_batch, needs numpy")
+    vector.add_argument("--size", type=int, default=1_000_000)
+    vector.add_argument("--probes", type=int, default=2_000_000)
+    vector.add_argument("--orders", type=int, nargs="+", default=[16, 64, 256])
+    vector.add_argument("--seed", type=int, default=0)
+    vector.set_defaults(run=bench_vector)
+
+    static = subcommands.add_parser("static", help="lookups: mutable tree vs frozen static layout, in memory and mapped")
+    static.add_argument("--size", type=int, default=1_000_000)
+    static.add_argument("--probes", type=int, default=200_000)
+    static.add_argument("-m", type=int, default=64)
+    static.add_argument("--blocks", type=int, nargs="+", default=[64, 256, 1024])
+    static.add_argument("--seed", type=int, default=0)
+    static.set_defaults(run=bench_static)
+
+    bloom = subcommands.add_parser("bloom", help="lookups with mostly missing keys, with and without a bloom filter")
+    bloom.add_argument("--size", type=int, default=1_000_000)
+    bloom.add_argument("--probes", type=int, default=200_000)
+    bloom.add_argument("--misses", type=float, default=0.7, help="fraction of probes for missing keys")
+    bloom.add_argument("--fp-rate", type=float, default=0.01)
+    bloom.add_argument("-m", type=int, default=64)
+    bloom.add_argument("--pool", type=int, default=64, help="buffer pool pages of the paged tree")
+    bloom.add_argument("--seed", type=int, default=0)
+    bloom.set_defaults(run=bench_bloom)
+
+    sharded = subcommands.add_parser("sharded", help="batch lookups and inserts: one tree vs a shard per process, needs numpy")
+    sharded.add_argument("--size", type=int, default=1_000_000)
+    sharded.add_argument("--probes", type=int, default=2_000_000)
+    sharded.add_argument("--inserts", type=int, default=200_000)
+    sharded.add_argument("-m", type=int, default=64)
+    sharded.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8, os.cpu_count()])
+    sharded.add_argument("--repeat", type=int, default=5)
+    sharded.add_argument("--seed", type=int, default=0)
+    sharded.set_defaults(run=bench_sharded)
+
+    split = subcommands.add_parser("split", help="even vs right-biased splits: insert rate, splits and fill factor")
+    split.add_argument("--size", type=int, default=200_000)
+    split.add_argument("-m", type=int, default=None, help="order, chosen from --node-bytes if not given")
+    split.add_argument("--node-bytes", type=int, default=4096)
+    split.add_argument("--fraction", type=float, default=0.9, help="left part of a right-biased split")
+    split.add_argument("--seed", type=int, default=0)
+    split.set_defaults(run=bench_split)
+
+    scan = subcommands.add_parser("range", help="range scans: b-tree in-order walk vs b+-tree leaf chain")
+    scan.add_argument("--size", type=int, default=1_000_000)
+    scan.add_argument("--scans", type=int, default=2_000)
+    scan.add_argument("--length", type=int, default=1_000)
+    scan.add_argument("--orders", type=int, nargs="+", default=ORDERS)
+    scan.add_argument("--seed", type=int, default=0)
+    scan.set_defaults(run=bench_range)
+
+    memory = subcommands.add_parser("memory", help="traced memory of Node vs CompactNode trees")
+    memory.add_argument("--size", type=int, default=1_000_000)
+    memory.add_argument("--orders", type=int, nargs="+", default=[4, 16, 64, 256])
+    memory.add_argument("--seed", type=int, default=0)
+    memory.set_defaults(run=bench_memory)
+
+    paged = subcommands.add_parser("paged", help="open time and page reads of the mmap-backed tree")
+    paged.add_argument("--size", type=int, default=1_000_000)
+    paged.add_argument("--probes", type=int, default=10_000)
+    paged.add_argument("-m", type=int, default=128)
+    paged.add_argument("--pool", type=int, default=None, help="buffer pool budget in pages, unbounded by default")
+    paged.add_argument("--seed", type=int, default=0)
+    paged.set_defaults(run=bench_paged)
+
+    serialize = subcommands.add_parser("serialize", help="jsonpickle snapshots vs Node.dump/Node.load")
+    serialize.add_argument("--size", type=int, default=1_000_000)
+    serialize.add_argument("-m", type=int, default=4, help="order of the tree, the json fixtures use 4")
+    serialize.set_defaults(run=bench_serialize)
+
+    log = subcommands.add_parser("wal", help="write-ahead log throughput by group size and writer threads")
+    log.add_argument("--ops", type=int, default=20_000)
+    log.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    log.add_argument("--groups", type=int, nargs="+", default=[1, 16, 128, 1024])
+    log.add_argument("-m", type=int, default=64)
+    log.set_defaults(run=bench_wal)
+
+    stress = subcommands.add_parser("concurrent", help="multithreaded reads/writes: global lock vs latch crabbing")
+    stress.add_argument("--size", type=int, default=100_000)
+    stress.add_argument("--ops", type=int, default=200_000)
+    stress.add_argument("--writes", type=float, default=0.1, help="fraction of operations that write")
+    stress.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    stress.add_argument("-m", type=int, default=64)
+    stress.set_defaults(run=bench_concurrent)
+
+    snapshot = subcommands.add_parser("snapshot", help="deepcopy of a Node tree vs CowBTree.snapshot")
+    snapshot.add_argument("--size", type=int, default=200_000)
+    snapshot.add_argument("--writes", type=int, default=100_000)
+    snapshot.add_argument("-m", type=int, default=64)
+    snapshot.add_argument("--seed", type=int, default=0)
+    snapshot.set_defaults(run=bench_snapshot)
+
+    suite = subcommands.add_parser("suite", help="insert/search/delete throughput by workload, order and size")
+    suite.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                       help="tree sizes, up to 10_000_000 for the full run")
+    suite.add_argument("--orders", type=int, nargs="+", default=[2, 4, 8, 16, 32, 64, 128, 256, 512])
+    suite.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=WORKLOADS)
+    suite.add_argument("--ops", type=int, default=100_000, help="lookups, or operations of the mixed workload")
+    suite.add_argument("--writes", type=float, default=0.2, help="fraction of writes in the mixed workload")
+    suite.add_argument("--skew", type=float, default=0.99, help="exponent of the zipfian lookups")
+    suite.add_argument("--repeat", type=int, default=1, help="runs per measurement, the fastest one is kept")
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--stats", action="store_true", help="record tree stats, they slow every operation down")
+    suite.add_argument("--output", help="write the results as json to this file")
+    suite.add_argument("--baseline", help="json results of an earlier run to compare with")
+    suite.set_defaults(run=bench_suite)
+
+    args = parser.parse_args(argv)
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+from __future__ import annotations
+import math
+from typing import Any, Iterable, Iterator, Tuple
+
+from btree import BaseNode
+
+MASK64 = 2 ** 64 - 1
+
+
+def _mix(value: int) -> int:
+    # splitmix64 finalizer, spreads the bits of hash(), which is the int itself for small ints
+    value = (value ^ value >> 30) * 0xbf58476d1ce4e5b9 & MASK64
+    value = (value ^ value >> 27) * 0x94d049bb133111eb & MASK64
+    return value ^ value >> 31
+
+
+# A Bloom filter sized for capacity keys at false positive rate fp_rate. The
+# hash positions are h1 + i * h2 modulo the size, h1 and h2 being the two
+# halves of one mixed hash().
+class BloomFilter:
+    def __init__(self, capacity: int, fp_rate: float = 0.01):
+        if not 0 < fp_rate < 1:
+            raise ValueError("fp_rate must be between 0 and 1, got %r" % fp_rate)
+        self.capacity = max(capacity, 1)
+        self.fp_rate = fp_rate
+        self.size = max(64, math.ceil(-self.capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key) -> range:
+        mixed = _mix(hash(key) & MASK64)
+        first, step = mixed & 0xffffffff, mixed >> 32 | 1
+        return range(first, first + self.hashes * step, step)
+
+    def add(self, key):
+        bits, size = self.bits, self.size
+        for position in self._positions(key):
+            position %= size
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    # False means key was never added, True that it may have been
+    def __contains__(self, key) -> bool:
+        bits, size = self.bits, self.size
+        for position in self._positions(key):
+            position %= size
+            if not bits[position >> 3] & 1 << (position & 7):
+                return False
+        return True
+
+
+# Puts a Bloom filter in front of a tree, so most lookups of missing keys are
+# answered without a descent, and without page reads for a PagedBTree. tree
+# is a root node or any tree object with the same methods, e.g. a PagedBTree
+# or a KeyedBTree, whose filter holds the encoded keys its nodes hold, so a
+# rebuild sees the same keys lookups hash whatever decode gives back. Inserts
+# add to the filter as they go. A filter cannot
+# forget keys, so deletes only count up, and the next lookup after
+# rebuild_ratio of the filtered keys were deleted, or after the filter
+# outgrew its capacity, rebuilds it from a scan of the tree.
+class BloomBTree:
+    def __init__(self, tree, fp_rate: float = 0.01, capacity: int = 1024, rebuild_ratio: float = 0.25):
+        self.tree = tree
+        # set for a KeyedBTree
+        self.encode = getattr(tree, 'encode', None)
+        self.fp_rate = fp_rate
+        self.rebuild_ratio = rebuild_ratio
+        self.filter = BloomFilter(capacity, fp_rate)
+        self.deleted = 0
+        self.stale = True
+        self.lookups = 0
+        # lookups answered by the filter alone
+        self.saved = 0
+        # lookups the filter let through for a key that is not there
+        self.false_positives = 0
+        self.rebuilds = 0
+
+    # node methods return the new root, tree objects change in place
+    def _update(self, result):
+        if isinstance(result, BaseNode):
+            self.tree = result
+        return result
+
+    def _key(self, key):
+        return key if self.encode is None else self.encode(key)
+
+    def _rebuild(self):
+        keys = list(self.tree.range() if self.encode is None else self.tree.root.range())
+        self.filter = BloomFilter(max(2 * len(keys), self.filter.capacity), self.fp_rate)
+        for key in keys:
+            self.filter.add(key)
+        self.deleted = 0
+        self.stale = False
+        self.rebuilds += 1
+
+    def _may_contain(self, key) -> bool:
+        if (self.stale or self.filter.count > self.filter.capacity
+                or self.deleted > self.rebuild_ratio * self.filter.count):
+            self._rebuild()
+        self.lookups += 1
+        if self._key(key) in self.filter:
+            return True
+        self.saved += 1
+        return False
+
+    def __contains__(self, key) -> bool:
+        if not self._may_contain(key):
+            return False
+        found = key in self.tree
+        if not found:
+            self.false_positives += 1
+        return found
+
+    def get(self, key, default=None):
+        if not self._may_contain(key):
+            return default
+        # a sentinel tells a missing key from a stored default
+        value = self.tree.get(key, self)
+        if value is self:
+            self.false_positives += 1
+            return default
+        return value
+
+    def items(self, lo=None, hi=None) -> Iterator[Tuple[Any, Any]]:
+        return self.tree.items(lo, hi)
+
+    def range(self, lo=None, hi=None) -> Iterator:
+        return self.tree.range(lo, hi)
+
+    def insert(self, key, value=None):
+        self._update(self.tree.insert(key, value))
+        self.filter.add(self._key(key))
+
+    def put(self, key, value):
+        self._update(self.tree.put(key, value))
+        self.filter.add(self._key(key))
+
+    def insert_many(self, keys: Iterable, values: Iterable[Any] = None):
+        keys = list(keys)
+        self._update(self.tree.insert_many(keys, values))
+        for key in keys:
+            self.filter.add(self._key(key))
+
+    def delete(self, key):
+        self.tree.delete(key)
+        self.deleted += 1
+
+    def delete_many(self, keys: Iterable) -> int:
+        deleted = self.tree.delete_many(keys)
+        self.deleted += deleted
+        return deleted
+
+    def report(self) -> dict:
+        return {'lookups': self.lookups, 'saved': self.saved, 'false_positives': self.false_positives,
+                'rebuilds': self.rebuilds, 'capacity': self.filter.capacity, 'bits': self.filter.size,
+                'hashes': self.filter.hashes}
@@ -1,18 +1,79 @@
 from __future__ import annotations
 import bisect
-from typing import List, Tuple
+import heapq
+import itertools
+import pickle
+import struct
+import sys
+from array import array
+from functools import partial
+from operator import itemgetter
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Sized, Tuple
 
+from codec import BytesBlock, IntBlock
+
+# dump format: magic, version, flags, order m, number of levels, number of keys
+DUMP_HEADER = struct.Struct('<4sBBxxIIQ')
+DUMP_MAGIC = b'BTRE'
+DUMP_VERSION = 1
+DUMP_BPLUS = 1
+# the keys of every node are a codec.IntBlock instead of raw int64
+DUMP_PACKED = 2
+# bytes keys, always written as one codec.BytesBlock per node
+DUMP_BYTES = 4
+# how the values follow the levels: not at all, as int64 or as one pickle
+VALUES_NONE, VALUES_INT64, VALUES_PICKLE = 0, 1, 2
+# int64 values are stored in place, this one is reserved to mean None
+NO_VALUE = -2 ** 63
+
+
+def _little_endian(data: array) -> bytes:
+    if sys.byteorder == 'big':
+        data = array(data.typecode, data)
+        data.byteswap()
+    return data.tobytes()
+
+
+def _native(view: memoryview):
+    if sys.byteorder == 'big':
+        data = array(view.format, view)
+        data.byteswap()
+        return memoryview(data)
+    return view
+
+
+# values as given for keys, or None for every key; a count that differs from
+# the keys is an error rather than keys silently left out
+def _values_for(keys: Sized, values: Iterable[Any]) -> Iterable[Any]:
+    if values is None:
+        return itertools.repeat(None, len(keys))
+    if not isinstance(values, Sized):
+        values = list(values)
+    if len(values) != len(keys):
+        raise ValueError("got %d values for %d keys" % (len(values), len(keys)))
+    return values
+
+
+# The tree algorithms, shared by all node types. Subclasses decide how the
+# attributes are stored, _make_keys builds an empty or filled key container.
+class BaseNode:
+    __slots__ = ()
+    _make_keys = list
+    # called as split_policy(node, total, lo, hi) instead of an even split
+    split_policy: Callable = None
 
-class Node:
     parent: Node
-    keys = List[int]
+    keys: List[int]
+    values: List[Any]
     m: int
-    children = List['Node']
+    children: List[Node]
     is_leaf: bool
 
-    def __init__(self, m: int, keys: List[int]=[], children: List[Node]=[], parent: Node=None, is_leaf: bool = False):
+    def __init__(self, m: int, keys: List[int]=[], children: List[Node]=[], parent: Node=None, is_leaf: bool = False,
+                 values: List[Any]=None):
         self.parent = parent
-        self.keys = keys or []
+        self.keys = keys or self._make_keys()
+        self.values = values or [None] * len(self.keys)
         self.children = children or []
         if children:
             for child in children:
@@ -20,15 +81,15 @@ class Node:
         self.m = m
         self.is_leaf = is_leaf
 
-    def insert(self, key):
+    def insert(self, key, value=None):
         # Initial case
         if len(self.keys) == 0:
-            self.keys.append(key)
+            self._insert_key(key, value)
             return self
 
         # Case: Node is leaf => Insert Key
         if self.is_leaf:
-            self._insert_key(key)
+            self._insert_key(key, value)
             return self.parent or self
         
         # Case: Not LeafNode => traverse to child
@@ -36,73 +97,307 @@ class Node:
         if success:
             return self
         else:
-            entry_node._insert_key(key)
+            entry_node._insert_key(key, value)
             return self.parent or self
 
-    def rebalance(self):
+    # inserts key or replaces the value stored with it, returns the root like insert
+    def put(self, key, value):
+        success, node = self.search(key)
+        if success:
+            node.values[bisect.bisect_left(node.keys, key)] = value
+            return self
+        return self.insert(key, value)
+
+    def get(self, key, default=None):
+        success, node = self.search(key)
+        if success:
+            return node.values[bisect.bisect_left(node.keys, key)]
+        return default
+
+    # yields (key, value) with lo <= key < hi in key order, both bounds are optional
+    def items(self, lo=None, hi=None) -> Iterator[Tuple[int, Any]]:
+        # a frame (node, i) continues with node.keys[i - 1] and then node.children[i]
+        stack = []
+        node = self
+        start = 0 if lo is None else bisect.bisect_left(node.keys, lo)
+        while not node.is_leaf:
+            stack.append((node, start + 1))
+            node = node.children[start]
+            start = 0 if lo is None else bisect.bisect_left(node.keys, lo)
+        while True:
+            end = len(node.keys) if hi is None else bisect.bisect_left(node.keys, hi)
+            yield from zip(node.keys[start:end], node.values[start:end])
+            if end < len(node.keys):
+                return
+            while stack:
+                node, i = stack.pop()
+                if i <= len(node.keys):
+                    if hi is not None and not node.keys[i - 1] < hi:
+                        return
+                    yield node.keys[i - 1], node.values[i - 1]
+                    stack.append((node, i + 1))
+                    node = node.children[i]
+                    while not node.is_leaf:
+                        stack.append((node, 1))
+                        node = node.children[0]
+                    start = 0
+                    break
+            else:
+                return
+
+    # yields the keys with lo <= key < hi in key order
+    def range(self, lo=None, hi=None) -> Iterator[int]:
+        return map(itemgetter(0), self.items(lo, hi))
+
+    # the keys in runs, in key order or in reverse with order=reversed: every
+    # leaf as a whole and the key between two subtrees alone. A frame of the
+    # stack holds the keys and children of a node still to come
+    def _runs(self, order: Callable = iter) -> Iterator[Iterable[int]]:
+        stack = []
+        node = self
+        while True:
+            while not node.is_leaf:
+                children = order(node.children)
+                stack.append((order(node.keys), children))
+                node = next(children)
+            yield order(node.keys)
+            while stack:
+                keys, children = stack[-1]
+                for key in keys:
+                    yield key,
+                    node = next(children)
+                    break
+                else:
+                    stack.pop()
+                    continue
+                break
+            else:
+                return
+
+    # chain runs through the leaves at list iteration speed
+    def __iter__(self) -> Iterator[int]:
+        return itertools.chain.from_iterable(self._runs())
+
+    def __reversed__(self) -> Iterator[int]:
+        return itertools.chain.from_iterable(self._runs(reversed))
+
+    # counts the keys of the whole subtree
+    def __len__(self) -> int:
+        count = 0
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            count += len(node.keys)
+            stack.extend(node.children)
+        return count
+
+    # a node is true even without keys, nodes are tested in place of "is not None"
+    def __bool__(self) -> bool:
+        return True
+
+    def __contains__(self, key) -> bool:
+        return self.search(key)[0]
+
+    def insert_many(self, keys: Iterable[int], values: Iterable[Any]=None) -> Node:
+        if not isinstance(keys, Sized):
+            keys = list(keys)
+        # the last value given for a key wins
+        batch = sorted(dict(zip(keys, _values_for(keys, values))).items())
+        # internal nodes that grew past m, each one is split once at the end
+        overfull = {}
+        i = 0
+        while i < len(batch):
+            found, leaf, upper = self._descend(batch[i][0])
+            if found:
+                i += 1
+                continue
+            # every batch key below the leaf's upper separator belongs to this leaf
+            j = i + 1
+            while j < len(batch) and (upper is None or batch[j][0] < upper):
+                j += 1
+            present = set(leaf.keys)
+            merged = sorted([item for item in batch[i:j] if item[0] not in present] + list(zip(leaf.keys, leaf.values)),
+                            key=itemgetter(0))
+            leaf._resized(len(merged) - len(leaf.keys))
+            leaf.keys = leaf._make_keys(key for key, _ in merged)
+            leaf.values = [value for _, value in merged]
+            parent = leaf._split_off()
+            if parent and parent._overfull():
+                overfull[id(parent)] = parent
+            i = j
+
+        # split bottom-up so each node is split once even if several leaves grew into it
+        queue = [(-node._depth(), id(node), node) for node in overfull.values()]
+        heapq.heapify(queue)
+        while queue:
+            depth, _, node = heapq.heappop(queue)
+            parent = node._split_off()
+            if parent and parent._overfull() and id(parent) not in overfull:
+                overfull[id(parent)] = parent
+                heapq.heappush(queue, (depth + 1, id(parent), parent))
+
+        root = self
+        while root.parent:
+            root = root.parent
+        return root
+
+    def delete_many(self, keys: Iterable[int]) -> int:
+        batch = sorted(set(keys))
+        deleted = 0
+        # internal nodes that fell below m // 2, each one is rebalanced once at the end
+        underfull = {}
+        # The parent of the last leaf: the batch keys only grow, so one below
+        # its last separator is in its subtree and the descent can start there.
+        finger = None
+        i = 0
+        while i < len(batch):
+            start = finger if finger is not None and batch[i] < finger.keys[-1] else self
+            found, node, upper = start._descend(batch[i])
+            if found and not node.is_leaf:
+                node._delete_key(batch[i], underfull)
+                deleted += 1
+                i += 1
+                finger = None
+                continue
+            # remove every batch key of this leaf, then rebalance it once
+            j = i + 1
+            while j < len(batch) and (upper is None or batch[j] < upper):
+                j += 1
+            remove = set(batch[i:j])
+            remaining = [item for item in zip(node.keys, node.values) if item[0] not in remove]
+            deleted += len(node.keys) - len(remaining)
+            node._resized(len(remaining) - len(node.keys))
+            node.keys = node._make_keys(key for key, _ in remaining)
+            node.values = [value for _, value in remaining]
+            finger = node.parent
+            before = len(finger.keys) if finger is not None else 0
+            node.rebalance(underfull)
+            # a parent that lost its last key was rebalanced at once and may
+            # cover other keys now
+            if before < 2:
+                finger = None
+            i = j
+
+        # rebalance bottom-up, a merge below may still take keys from a node
+        # in the queue; the nodes merged away in the meantime are skipped
+        queue = [(-node._depth(), id(node), node) for node in underfull.values()]
+        heapq.heapify(queue)
+        while queue:
+            depth, _, node = heapq.heappop(queue)
+            if len(node.keys) >= node.m // 2 or node._detached():
+                continue
+            lost = {}
+            node.rebalance(lost)
+            for parent in lost.values():
+                heapq.heappush(queue, (depth + 1, id(parent), parent))
+        return deleted
+
+    # True if a merge took the node out of the tree. The children are compared
+    # as they are stored, so that no child page is loaded for it
+    def _detached(self) -> bool:
+        return self.parent is not None and all(child is not self for child in list.__iter__(self.parent.children))
+
+    # Refills a node that fell below m // 2 from a sibling or merges it into
+    # one. A merge takes a key from the parent, which is rebalanced in turn,
+    # unless deferred is given: then the parent goes there if it has to be
+    # rebalanced, so that a batch can do that once at its end.
+    def rebalance(self, deferred: Dict[int, Node] = None):
         if not self.parent:
+            # shrink tree: an empty root takes over its only child
+            if not self.keys and self.children:
+                child = self.children[0]
+                self.keys = child.keys
+                self.values = child.values
+                self.children = child.children
+                self.is_leaf = child.is_leaf
+                for grandchild in self.children:
+                    grandchild.parent = self
             return
         # enough keys
         if len(self.keys) >= self.m//2:
             return
         # not enough keys for removal
         else:
-            # CASE: sibling has enough keys
             # 1. Find left/right sibling
-            left_sibling = None
-            right_sibling = None
-            separation_key = None
-            for i,child in enumerate(self.parent.children):
-                if child.keys == self.keys:
-                    if i != 0 :
-                        left_sibling = self.parent.children[i-1]
-                        separation_key = self.parent.keys[i-1]
-                        break
-                    if i != len(self.parent.children):
-                        right_sibling = self.parent.children[i+1]
-                        separation_key = self.parent.keys[i]
-                        break
+            left_sibling, right_sibling, separation_index = self._siblings()
+            missing = self.m//2 - len(self.keys)
             # 2.A IF left_sibling AND left_sibling has enough keys
-            #       => roll right
-            if left_sibling and len(left_sibling.keys) > self.m//2:
-                new_separation_key = left_sibling.keys.pop()
-                self.parent.keys = [new_key if new_key != separation_key else new_separation_key for new_key in self.parent.keys]
-                self.keys = [separation_key] + self.keys
+            #       => roll right until self is filled up
+            if left_sibling and len(left_sibling.keys) - missing >= self.m//2:
+                for _ in range(missing):
+                    self.keys.insert(0, self.parent.keys[separation_index])
+                    self.values.insert(0, self.parent.values[separation_index])
+                    self.parent.keys[separation_index] = left_sibling.keys.pop()
+                    self.parent.values[separation_index] = left_sibling.values.pop()
+                    if left_sibling.children:
+                        transfer_child = left_sibling.children.pop()
+                        transfer_child.parent = self
+                        self.children.insert(0, transfer_child)
                 return
             # 2.B IF right_sibling AND right_sibling has enough keys
-            #       => roll left
-            if right_sibling and len(right_sibling.keys) > self.m//2:
-                new_separation_key = right_sibling.keys.pop(0)
-                self.parent.keys = [new_key if new_key != separation_key else new_separation_key for new_key in self.parent.keys]
-                self.keys = self.keys + [separation_key]
+            #       => roll left until self is filled up
+            if right_sibling and len(right_sibling.keys) - missing >= self.m//2:
+                for _ in range(missing):
+                    self.keys.append(self.parent.keys[separation_index])
+                    self.values.append(self.parent.values[separation_index])
+                    self.parent.keys[separation_index] = right_sibling.keys.pop(0)
+                    self.parent.values[separation_index] = right_sibling.values.pop(0)
+                    if right_sibling.children:
+                        transfer_child = right_sibling.children.pop(0)
+                        transfer_child.parent = self
+                        self.children.append(transfer_child)
                 return
             # 2.C neither left nor right sibling has enough keys
             # => has left child -> put everything to left and delete self
             if left_sibling:
-                left_sibling.keys.append(separation_key)
-                self.parent.keys.remove(separation_key)
-                self.parent._remove_child(self)
+                left_sibling.keys.append(self.parent.keys.pop(separation_index))
+                left_sibling.values.append(self.parent.values.pop(separation_index))
+                self.parent._remove_child(separation_index + 1)
                 for transfer_key in self.keys:
                     left_sibling.keys.append(transfer_key)
+                left_sibling.values += self.values
                 for transfer_child in self.children:
+                    transfer_child.parent = left_sibling
                     left_sibling.children.append(transfer_child)
             # => has right child -> put everything to self and delete right
             elif right_sibling:
-                self.keys.append(separation_key)
-                self.parent.keys.remove(separation_key)
-                self.parent._remove_child(right_sibling)
+                self.keys.append(self.parent.keys.pop(separation_index))
+                self.values.append(self.parent.values.pop(separation_index))
+                self.parent._remove_child(separation_index + 1)
                 for transfer_key in right_sibling.keys:
                     self.keys.append(transfer_key)
+                self.values += right_sibling.values
                 for transfer_child in right_sibling.children:
+                    transfer_child.parent = self
                     self.children.append(transfer_child)
-            self.parent.rebalance()
+            self._parent_lost_key(deferred)
 
-            # shrink tree if necessary
-            if len(self.parent.keys) == 0:
-                self.parent.children = self.children
-                self.parent.keys = self.keys
-            # is tree still balanced?
+    # parent lost a key, it shrinks the tree if it was the last one of the root.
+    # An emptied parent is rebalanced right away, its last child has no sibling
+    def _parent_lost_key(self, deferred: Dict[int, Node] = None):
+        parent = self.parent
+        if deferred is None or not parent.keys:
+            parent.rebalance()
+        elif parent.parent and len(parent.keys) < parent.m // 2:
+            deferred[id(parent)] = parent
 
+    # returns left_sibling, right_sibling, separation_index, only the left one if there is one
+    def _siblings(self) -> Tuple[Node, Node, int]:
+        i = self._child_index()
+        if i != 0:
+            return self.parent.children[i-1], None, i-1
+        if i != len(self.parent.children) - 1:
+            return None, self.parent.children[i+1], i
+        return None, None, None
+
+    # the position of this node among the children of its parent, found by its
+    # first key among the separators. A b+-tree leaf starts with its separator,
+    # so the key goes right of an equal one
+    def _child_index(self) -> int:
+        if self.keys:
+            return bisect.bisect_right(self.parent.keys, self.keys[0])
+        # an emptied node of a small order has no key to look for
+        return list.index(self.parent.children, self)
 
     def delete(self, key):
         has_key, node_with_key = self.search(key)
@@ -110,53 +405,244 @@ class Node:
             raise Exception("%s was not found", key)
         node_with_key._delete_key(key)
 
-    def _delete_key(self, delete_key):
-        # CASE 0 is root
-        if not self.parent and self.is_leaf:
-            self.keys = [x for x in self.keys if x != delete_key]
+    # deferred as in rebalance
+    def _delete_key(self, delete_key, deferred: Dict[int, Node] = None):
         # CASE I is leaf
+        i = bisect.bisect_left(self.keys, delete_key)
         if self.is_leaf:
-            self.keys.remove(delete_key)
-            self.rebalance()
-                # 2.D parent is shrinking
-        # CASE II is internal node
+            del self.keys[i]
+            del self.values[i]
+            self.rebalance(deferred)
+        # CASE II is internal node => replace by the max of the left subtree
         else:
-            leaf_with_max = None
-            max_in_left = None
-            for i, child in enumerate(self.children):
-                if delete_key > child.keys[-1]:
-                    leaf_with_max, max_in_left = Node.get_max(self.children[i])
-                    break
-            self.keys = [key if key != delete_key else max_in_left for key in self.keys]
-            leaf_with_max._delete_key(max_in_left)
-            self.rebalance()
+            leaf_with_max, max_in_left = self.get_max(self.children[i])
+            self.keys[i] = max_in_left
+            self.values[i] = leaf_with_max.values[-1]
+            leaf_with_max._delete_key(max_in_left, deferred)
+
+    # the batch operations call this when they add (delta > 0) or remove keys of a leaf at once
+    def _resized(self, delta: int):
+        pass
 
-    def _insert_key(self, key):
-        bisect.insort(self.keys, key)
+    def _insert_key(self, key, value=None):
+        i = bisect.bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.values.insert(i, value)
         self.split()
 
     def split(self):
-        if len(self.keys) <= self.m:
-            return
+        parent = self._split_off()
+        if parent:
+            parent.split()
+
+    # True if the node has to split, i.e. has more than m keys
+    def _overfull(self) -> bool:
+        return len(self.keys) > self.m
+
+    # moves every key above m into new right siblings and returns the parent
+    def _split_off(self) -> Node:
+        if not self._overfull():
+            return None
         if not self.parent:
-            self.parent = Node(self.m, [], [self], None, False)
-        new_right_node = Node(self.m, self.keys[self.m // 2+1:], self.children[self.m // 2+1:], self.parent,
-                              self.is_leaf)
-        self.children = self.children[:self.m//2+1]
-        middle_key = self.keys[self.m//2]
-        self.keys = self.keys[:self.m//2]
-        self.parent._add_child(new_right_node)
-        self.parent._insert_key(middle_key)
-
-    def _add_child(self, new_child: Node):
-        for i,child in enumerate(self.children):
-            if child and new_child.keys[-1] < child.keys[0]:
-                self.children.insert(i, new_child)
-                return
-        self.children.append(new_child)
+            self.parent = type(self)(self.m, [], [self], None, False)
+        keys, values, children = self.keys, self.values, self.children
+        sizes = [size - 1 for size in self._split_sizes(len(keys) + 1, self.m // 2 + 1, self.m + 1)]
+        self.keys = keys[:sizes[0]]
+        self.values = values[:sizes[0]]
+        self.children = children[:sizes[0] + 1]
+        start = sizes[0]
+        for size in sizes[1:]:
+            new_right_node = type(self)(self.m, keys[start + 1:start + 1 + size], children[start + 1:start + 2 + size],
+                                        self.parent, self.is_leaf, values[start + 1:start + 1 + size])
+            i = bisect.bisect_left(self.parent.keys, keys[start])
+            self.parent.keys.insert(i, keys[start])
+            self.parent.values.insert(i, values[start])
+            self.parent.children.insert(i + 1, new_right_node)
+            start += size + 1
+        return self.parent
+
+    # cuts total into the groups of a split, each within [lo, hi]: evenly, or
+    # as the split_policy of the class says, see tuning.py
+    def _split_sizes(self, total: int, lo: int, hi: int) -> List[int]:
+        if self.split_policy is None:
+            return self._group_sizes(total, lo, hi, hi)
+        return self.split_policy(self, total, lo, hi)
+
+    # removes and returns the child at index
+    def _remove_child(self, index: int) -> Node:
+        return self.children.pop(index)
+
+    @classmethod
+    def bulk_load(cls, m: int, keys: Iterable[int], fill_factor: float = 1.0, values: Iterable[Any]=None) -> Node:
+        return cls._stream_load(m, keys, fill_factor, values, lambda is_leaf, parent: cls(m, [], None, parent, is_leaf))
+
+    # The bulk load itself: new_node(is_leaf, parent) makes an empty node and
+    # closed(node) is told about every node whose keys are final, e.g. so that
+    # it can be written out and dropped while the load goes on.
+    @classmethod
+    def _stream_load(cls, m: int, keys: Iterable[int], fill_factor: float, values: Iterable[Any],
+                     new_node: Callable[[bool, Node], Node], closed: Callable[[Node], None] = None) -> Node:
+        if not isinstance(keys, Sized):
+            keys = list(keys)
+        fill = max(m // 2, min(m, round(m * fill_factor)))
+        # Plan the key count of every node before touching the input:
+        # level 0 holds the n keys in leaves, the key between two neighbouring
+        # nodes moves one level up, so level l+1 holds len(plan[l]) - 1 keys.
+        plan = []
+        count = len(keys)
+        while True:
+            sizes = [size - 1 for size in cls._group_sizes(count + 1, m // 2 + 1, m + 1, fill + 1)]
+            plan.append(sizes)
+            if len(sizes) == 1:
+                break
+            count = len(sizes) - 1
+
+        def open_node(level: int, parent: Node) -> Node:
+            node = new_node(level == 0, parent)
+            if parent is not None:
+                parent.children.append(node)
+            return node
+
+        # Stream the keys: a key goes to the lowest open node that still has
+        # room, every full node below it is closed and replaced by a new one.
+        nodes = [None] * len(plan)
+        for level in range(len(plan) - 1, -1, -1):
+            nodes[level] = open_node(level, nodes[level + 1] if level + 1 < len(plan) else None)
+        node_index = [0] * len(plan)
+        previous = None
+        for key, value in zip(keys, _values_for(keys, values)):
+            if previous is not None and not previous < key:
+                raise ValueError("bulk_load needs strictly increasing keys, got %r after %r" % (key, previous))
+            previous = key
+            level = 0
+            while len(nodes[level].keys) == plan[level][node_index[level]]:
+                level += 1
+            nodes[level].keys.append(key)
+            nodes[level].values.append(value)
+            for below in range(level - 1, -1, -1):
+                node_index[below] += 1
+                if closed is not None:
+                    closed(nodes[below])
+                nodes[below] = open_node(below, nodes[below + 1])
+        if closed is not None:
+            for node in nodes:
+                closed(node)
+        return nodes[-1]
 
-    def _remove_child(self, remove_child: Node):
-        self.children = [child for child in self.children if child.keys != remove_child.keys ]
+    # cuts total into as few groups as allowed near target, each within [lo, hi]
+    @staticmethod
+    def _group_sizes(total: int, lo: int, hi: int, target: int) -> List[int]:
+        groups = max(-(-total // target), -(-total // hi))
+        groups = max(1, min(groups, total // lo))
+        size, larger = divmod(total, groups)
+        return [size] * (groups - larger) + [size + 1] * larger
+
+    # Writes the tree level by level. Each level is length-prefixed with its
+    # node and key counts, then holds the key count of every node as uint32
+    # and all of its keys as int64, both little endian. With compress the keys
+    # are one delta/varint block per node instead, preceded by the block sizes.
+    # bytes keys are always written that way, as prefix compressed blocks.
+    def dump(self, fp: BinaryIO, compress: bool = False):
+        levels = [[self]]
+        while not levels[-1][0].is_leaf:
+            levels.append([child for node in levels[-1] for child in node.children])
+        total = sum(len(node.keys) for level in levels for node in level)
+        block = BytesBlock if self.keys and isinstance(self.keys[0], bytes) else IntBlock
+        flags = (DUMP_BPLUS if isinstance(self, BPlusNode) else 0) | (DUMP_PACKED if compress else 0)
+        if block is BytesBlock:
+            flags |= DUMP_PACKED | DUMP_BYTES
+        fp.write(DUMP_HEADER.pack(DUMP_MAGIC, DUMP_VERSION, flags, self.m, len(levels), total))
+        for level in levels:
+            counts = array('I', [len(node.keys) for node in level])
+            fp.write(struct.pack('<QQ', len(counts), sum(counts)))
+            fp.write(_little_endian(counts))
+            if flags & DUMP_PACKED:
+                blocks = [block.encode(node.keys) for node in level]
+                fp.write(_little_endian(array('I', map(len, blocks))))
+                fp.write(b''.join(blocks))
+            else:
+                fp.write(_little_endian(array('q', itertools.chain.from_iterable(node.keys for node in level))))
+
+        values = [value for level in levels for node in level for value in node.values]
+        if all(value is None for value in values):
+            fp.write(struct.pack('<BQ', VALUES_NONE, 0))
+        elif all(type(value) is int and NO_VALUE < value < 2 ** 63 or value is None for value in values):
+            data = _little_endian(array('q', [NO_VALUE if value is None else value for value in values]))
+            fp.write(struct.pack('<BQ', VALUES_INT64, len(data)))
+            fp.write(data)
+        else:
+            data = pickle.dumps(values, pickle.HIGHEST_PROTOCOL)
+            fp.write(struct.pack('<BQ', VALUES_PICKLE, len(data)))
+            fp.write(data)
+
+    @classmethod
+    def load(cls, fp: BinaryIO) -> Node:
+        view = memoryview(fp.read())
+        magic, version, flags, m, height, total = DUMP_HEADER.unpack_from(view)
+        if magic != DUMP_MAGIC or version != DUMP_VERSION:
+            raise ValueError("not a b-tree dump")
+        if bool(flags & DUMP_BPLUS) != issubclass(cls, BPlusNode):
+            raise ValueError("the dump was written by a %s tree" % ("b+" if flags & DUMP_BPLUS else "b"))
+        block = BytesBlock if flags & DUMP_BYTES else IntBlock
+        offset = DUMP_HEADER.size
+        levels = []
+        for _ in range(height):
+            node_count, key_count = struct.unpack_from('<QQ', view, offset)
+            offset += 16
+            counts = _native(view[offset:offset + 4 * node_count].cast('I'))
+            offset += 4 * node_count
+            node_keys = []
+            if flags & DUMP_PACKED:
+                sizes = _native(view[offset:offset + 4 * node_count].cast('I'))
+                offset += 4 * node_count
+                for size in sizes:
+                    node_keys.append(cls._make_keys(block(view[offset:offset + size])))
+                    offset += size
+            else:
+                keys = _native(view[offset:offset + 8 * key_count].cast('q'))
+                offset += 8 * key_count
+                start = 0
+                for count in counts:
+                    node_keys.append(cls._load_keys(keys[start:start + count]))
+                    start += count
+            levels.append((counts, key_count, node_keys))
+
+        mode, size = struct.unpack_from('<BQ', view, offset)
+        offset += 9
+        if mode == VALUES_INT64:
+            values = [None if value == NO_VALUE else value for value in _native(view[offset:offset + size].cast('q'))]
+        elif mode == VALUES_PICKLE:
+            values = pickle.loads(view[offset:offset + size])
+        else:
+            values = None
+
+        # build bottom up, node i of a level owns the next counts[i] + 1 nodes below
+        value_offset = total
+        below = None
+        for depth in range(height - 1, -1, -1):
+            counts, key_count, node_keys = levels[depth]
+            value_offset -= key_count
+            nodes = []
+            start = 0
+            child = 0
+            for count, keys in zip(counts, node_keys):
+                children = below[child:child + count + 1] if below is not None else []
+                child += count + 1 if below is not None else 0
+                node_values = values[value_offset + start:value_offset + start + count] if values else None
+                nodes.append(cls(m, keys, children, None, below is None, node_values))
+                start += count
+            if below is None:
+                cls._link_leaves(nodes)
+            below = nodes
+        return below[0]
+
+    @staticmethod
+    def _load_keys(keys: memoryview) -> List[int]:
+        return keys.tolist()
+
+    @staticmethod
+    def _link_leaves(leaves: List[Node]):
+        pass
 
     @classmethod
     def get_min(cls, node):
@@ -171,14 +657,307 @@ class Node:
             return_node = return_node.children[-1]
         return return_node, return_node.keys[-1]
 
+    # descends like search and also returns the separator bounding the node from above
+    def _descend(self, search_key) -> Tuple[bool, Node, int]:
+        node, upper = self, None
+        while True:
+            keys = node.keys
+            i = bisect.bisect_left(keys, search_key)
+            if i < len(keys) and keys[i] == search_key:
+                return True, node, upper
+            if node.is_leaf:
+                return False, node, upper
+            if i < len(keys):
+                upper = keys[i]
+            node = node.children[i]
+
+    # Looks up a numpy array of probe keys at once, returns the mask of the
+    # probes found and with values=True also an object array of their values
+    # (default for the others). The probes are sorted once, so the probes
+    # reaching a node are a contiguous slice: the node searchsorts its keys
+    # into that slice and hands every child the part between two separators.
+    def search_batch(self, probes, values: bool = False, default=None):
+        try:
+            import numpy as np
+        except ImportError:
+            raise ImportError("search_batch needs numpy") from None
+        probes = np.asarray(probes)
+        order = np.argsort(probes, kind='stable')
+        ordered = probes[order]
+        # b+-tree separators are copies, a probe equal to one goes right and
+        # only counts when it reaches the leaf
+        copies = isinstance(self, BPlusNode)
+        starts, ends, found_values = [], [], []
+        stack = [(self, 0, len(ordered))]
+        while stack:
+            node, lo, hi = stack.pop()
+            if lo == hi or not len(node.keys):
+                continue
+            keys = np.asarray(node.keys)
+            window = ordered[lo:hi]
+            left = lo + np.searchsorted(window, keys, 'left')
+            right = lo + np.searchsorted(window, keys, 'right')
+            if node.is_leaf or not copies:
+                hit = np.flatnonzero(right > left)
+                if len(hit):
+                    starts.append(left[hit])
+                    ends.append(right[hit])
+                    if values:
+                        node_values = np.empty(len(node.values), dtype=object)
+                        node_values[:] = node.values
+                        found_values.append(node_values[hit])
+            if not node.is_leaf:
+                child_lo = np.concatenate(([lo], left if copies else right))
+                child_hi = np.concatenate((left, [hi]))
+                for i in np.flatnonzero(child_lo < child_hi).tolist():
+                    stack.append((node.children[i], int(child_lo[i]), int(child_hi[i])))
+
+        # the ranges of found probes are disjoint, mark them with +1 and -1 steps
+        steps = np.zeros(len(ordered) + 1, dtype=np.int8)
+        if starts:
+            starts, ends = np.concatenate(starts), np.concatenate(ends)
+            steps[starts] = 1
+            steps[ends] -= 1
+        found = np.empty(len(ordered), dtype=bool)
+        found[order] = np.cumsum(steps[:-1]) > 0
+        if not values:
+            return found
+        result = np.full(len(ordered), default, dtype=object)
+        if len(starts):
+            counts = ends - starts
+            positions = np.arange(counts.sum()) + np.repeat(starts - np.cumsum(counts) + counts, counts)
+            ordered_values = np.full(len(ordered), default, dtype=object)
+            ordered_values[positions] = np.repeat(np.concatenate(found_values), counts)
+            result[order] = ordered_values
+        return found, result
+
+    # compiles the keys and values into a read-only static.StaticBTree, which
+    # holds int64 keys only; others raise TypeError
+    def freeze(self, block: int = 256) -> StaticBTree:
+        from static import StaticBTree
+        return StaticBTree.from_items(self.items(), block)
+
+    def _depth(self) -> int:
+        depth, node = 0, self
+        while node.parent:
+            depth, node = depth + 1, node.parent
+        return depth
+
     # returns key_found,node_which_should_have_key
     def search(self, search_key) -> Tuple[bool, Node]:
-        for i, key in enumerate(self.keys):
-            if search_key == self.keys[i]:
-                return True, self
-            if search_key < self.keys[i] and not self.is_leaf:
-                return self.children[i].search(search_key)
+        node = self
+        while True:
+            keys = node.keys
+            i = bisect.bisect_left(keys, search_key)
+            if i < len(keys) and keys[i] == search_key:
+                return True, node
+            if node.is_leaf:
+                return False, node
+            node = node.children[i]
+
+
+# the default node, its attributes live in the instance __dict__
+class Node(BaseNode):
+    # snapshots pickled before nodes held values restore without the
+    # attribute, jsonpickle sets it item by item and never calls
+    # __setstate__, so it is filled in on first use
+    def __getattr__(self, name: str):
+        if name == 'values' and 'keys' in self.__dict__:
+            self.values = [None] * len(self.keys)
+            return self.values
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+
+# a node without __dict__ that keeps its keys in a typed array of 64-bit ints
+class CompactNode(BaseNode):
+    __slots__ = ('parent', 'keys', 'values', 'm', 'children', 'is_leaf')
+    _make_keys = partial(array, 'q')
+
+    def __init__(self, m: int, keys: List[int]=(), children: List[Node]=None, parent: Node=None,
+                 is_leaf: bool = False, values: List[Any]=None):
+        super().__init__(m, keys if isinstance(keys, array) else array('q', keys or ()), children, parent, is_leaf,
+                         values)
+
+    # copies the buffer straight into the array, no int objects in between
+    @staticmethod
+    def _load_keys(keys: memoryview) -> array:
+        loaded = array('q')
+        loaded.frombytes(keys.cast('B'))
+        return loaded
+
+
+# B+-tree mode: every key and value lives in a leaf, the keys of internal nodes
+# are copies used for routing only and the leaves are chained left to right.
+class BPlusNode(Node):
+    next: BPlusNode
+
+    def __init__(self, m: int, keys: List[int]=[], children: List[Node]=[], parent: Node=None, is_leaf: bool = False,
+                 values: List[Any]=None):
+        super().__init__(m, keys, children, parent, is_leaf, values)
+        self.next = None
+
+    # returns key_found,leaf_which_should_have_key
+    def search(self, search_key) -> Tuple[bool, Node]:
+        node = self
+        while not node.is_leaf:
+            node = node.children[bisect.bisect_right(node.keys, search_key)]
+        keys = node.keys
+        i = bisect.bisect_left(keys, search_key)
+        return i < len(keys) and keys[i] == search_key, node
+
+    def _descend(self, search_key) -> Tuple[bool, Node, int]:
+        node, upper = self, None
+        while not node.is_leaf:
+            i = bisect.bisect_right(node.keys, search_key)
+            if i < len(node.keys):
+                upper = node.keys[i]
+            node = node.children[i]
+        keys = node.keys
+        i = bisect.bisect_left(keys, search_key)
+        return i < len(keys) and keys[i] == search_key, node, upper
+
+    def items(self, lo=None, hi=None) -> Iterator[Tuple[int, Any]]:
+        for leaf, start, end in self._leaf_slices(lo, hi):
+            yield from zip(leaf.keys[start:end], leaf.values[start:end])
+
+    def range(self, lo=None, hi=None) -> Iterator[int]:
+        for leaf, start, end in self._leaf_slices(lo, hi):
+            yield from leaf.keys[start:end]
+
+    # the internal keys are copies, only the keys of the leaves count
+    def _runs(self, order: Callable = iter) -> Iterator[Iterable[int]]:
+        stack = [order((self,))]
+        while stack:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+            elif node.is_leaf:
+                yield order(node.keys)
+            else:
+                stack.append(order(node.children))
+
+    def __len__(self) -> int:
+        count = 0
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.is_leaf:
+                count += len(node.keys)
+            else:
+                stack.extend(node.children)
+        return count
+
+    # descends once to lo, then follows the leaf chain until hi
+    def _leaf_slices(self, lo, hi) -> Iterator[Tuple[BPlusNode, int, int]]:
+        node = self
+        while not node.is_leaf:
+            node = node.children[0 if lo is None else bisect.bisect_right(node.keys, lo)]
+        start = 0 if lo is None else bisect.bisect_left(node.keys, lo)
+        while node:
+            keys = node.keys
+            if hi is not None and keys and not keys[-1] < hi:
+                yield node, start, bisect.bisect_left(keys, hi)
+                return
+            yield node, start, len(keys)
+            node, start = node.next, 0
+
+    def _split_off(self) -> Node:
         if not self.is_leaf:
-            return self.children[-1].search(search_key)
-        else:
-            return False, self
+            return super()._split_off()
+        if not self._overfull():
+            return None
+        if not self.parent:
+            self.parent = type(self)(self.m, [], [self], None, False)
+        # leaves keep all their keys, the first key of each new leaf is copied up
+        keys, values = self.keys, self.values
+        sizes = self._split_sizes(len(keys), self.m // 2, self.m)
+        self.keys = keys[:sizes[0]]
+        self.values = values[:sizes[0]]
+        previous, start = self, sizes[0]
+        for size in sizes[1:]:
+            new_right_node = type(self)(self.m, keys[start:start + size], [], self.parent, True,
+                                        values[start:start + size])
+            new_right_node.next, previous.next = previous.next, new_right_node
+            i = bisect.bisect_left(self.parent.keys, keys[start])
+            self.parent.keys.insert(i, keys[start])
+            self.parent.values.insert(i, None)
+            self.parent.children.insert(i + 1, new_right_node)
+            previous, start = new_right_node, start + size
+        return self.parent
+
+    def rebalance(self, deferred: Dict[int, Node] = None):
+        if not self.is_leaf or not self.parent:
+            return super().rebalance(deferred)
+        if len(self.keys) >= self.m//2:
+            return
+        left_sibling, right_sibling, separation_index = self._siblings()
+        missing = self.m//2 - len(self.keys)
+        # borrow from a sibling and route the new boundary through the parent
+        if left_sibling and len(left_sibling.keys) - missing >= self.m//2:
+            self.keys[:0] = left_sibling.keys[-missing:]
+            self.values[:0] = left_sibling.values[-missing:]
+            del left_sibling.keys[-missing:]
+            del left_sibling.values[-missing:]
+            self.parent.keys[separation_index] = self.keys[0]
+            return
+        if right_sibling and len(right_sibling.keys) - missing >= self.m//2:
+            self.keys += right_sibling.keys[:missing]
+            self.values += right_sibling.values[:missing]
+            del right_sibling.keys[:missing]
+            del right_sibling.values[:missing]
+            self.parent.keys[separation_index] = right_sibling.keys[0]
+            return
+        # merge two leaves, the separator between them is dropped
+        if left_sibling:
+            self.parent._remove_child(separation_index + 1)
+            left_sibling.keys += self.keys
+            left_sibling.values += self.values
+            left_sibling.next = self.next
+        elif right_sibling:
+            self.parent._remove_child(separation_index + 1)
+            self.keys += right_sibling.keys
+            self.values += right_sibling.values
+            self.next = right_sibling.next
+        del self.parent.keys[separation_index]
+        del self.parent.values[separation_index]
+        self._parent_lost_key(deferred)
+
+    @classmethod
+    def bulk_load(cls, m: int, keys: Iterable[int], fill_factor: float = 1.0, values: Iterable[Any]=None) -> Node:
+        if not isinstance(keys, Sized):
+            keys = list(keys)
+        fill = max(m // 2, min(m, round(m * fill_factor)))
+        leaf_sizes = iter(cls._group_sizes(len(keys), m // 2, m, fill))
+        leaf = cls(m, [], None, None, True)
+        # (first key, node) of every node of the level being built
+        level = [(None, leaf)]
+        size = next(leaf_sizes)
+        previous = None
+        for key, value in zip(keys, _values_for(keys, values)):
+            if previous is not None and not previous < key:
+                raise ValueError("bulk_load needs strictly increasing keys, got %r after %r" % (key, previous))
+            previous = key
+            if len(leaf.keys) == size:
+                leaf.next = cls(m, [], None, None, True)
+                leaf, size = leaf.next, next(leaf_sizes)
+                level.append((key, leaf))
+            leaf.keys.append(key)
+            leaf.values.append(value)
+
+        while len(level) > 1:
+            parents = []
+            start = 0
+            for size in cls._group_sizes(len(level), m // 2 + 1, m + 1, fill + 1):
+                group = level[start:start + size]
+                separators = [first_key for first_key, _ in group[1:]]
+                parents.append((group[0][0], cls(m, separators, [node for _, node in group], None, False,
+                                                 [None] * len(separators))))
+                start += size
+            level = parents
+        return level[0][1]
+
+
+    @staticmethod
+    def _link_leaves(leaves: List[BPlusNode]):
+        for leaf, following in zip(leaves, leaves[1:]):
+            leaf.next = following
@@ -0,0 +1,266 @@
+from __future__ import annotations
+import struct
+from typing import Iterator, List, Sequence, Tuple
+
+# A block of sorted keys, compressed against the previous key. Every
+# restart_interval-th key (a restart point) is stored in full so a search can
+# binary search the restart points and then decode a single run:
+#
+#   entries, restart offsets (uint32 each), restart interval, restart count, key count (uint32 each)
+#
+# int entries: a restart is the zigzag varint of the key, any other entry the
+# varint of the delta to the previous key. bytes entries: the varint length of
+# the prefix shared with the previous key (0 at restarts), the varint length of
+# the rest and the rest itself.
+TRAILER = struct.Struct('<III')
+RESTART_INTERVAL = 16
+
+
+def write_varint(out: bytearray, value: int):
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, offset: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+
+class KeyBlock:
+    def __init__(self, data):
+        self.data = memoryview(data)
+        end = len(self.data) - TRAILER.size
+        self.restart_interval, self.restart_count, self.count = TRAILER.unpack_from(self.data, end)
+        self.restarts = struct.unpack_from('<%dI' % self.restart_count, self.data, end - 4 * self.restart_count)
+        self._cached_run = None
+        self._cached: List = None
+
+    @classmethod
+    def encode(cls, keys: Sequence, restart_interval: int = RESTART_INTERVAL) -> bytes:
+        out = bytearray()
+        restarts = []
+        previous = None
+        for i, key in enumerate(keys):
+            if previous is not None and not previous < key:
+                raise ValueError("keys must be strictly increasing, got %r after %r" % (key, previous))
+            if i % restart_interval == 0:
+                restarts.append(len(out))
+                cls._write(out, key, None)
+            else:
+                cls._write(out, key, previous)
+            previous = key
+        out += struct.pack('<%dI' % len(restarts), *restarts)
+        out += TRAILER.pack(restart_interval, len(restarts), len(keys))
+        return bytes(out)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator:
+        for run in range(self.restart_count):
+            yield from self._run(run)
+
+    def __reversed__(self) -> Iterator:
+        return reversed(self.decode())
+
+    # a key by position decodes its run, which is kept for the next access;
+    # a slice decodes the whole block
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.decode()[index]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("key block index out of range")
+        run, position = divmod(index, self.restart_interval)
+        if self._cached_run != run:
+            self._cached = list(self._run(run))
+            self._cached_run = run
+        return self._cached[position]
+
+    def decode(self) -> List:
+        return list(self)
+
+    # the decoded keys of restart run number run, in order
+    def _run(self, run: int) -> Iterator:
+        offset = self.restarts[run]
+        previous = None
+        for _ in range(min(self.restart_interval, self.count - run * self.restart_interval)):
+            previous, offset = self._read(offset, previous)
+            yield previous
+
+    # the position of the first key >= key and that key, or None past the end;
+    # decodes the restart keys on a binary search path and a single run
+    def _locate(self, key) -> Tuple[int, object]:
+        if not self.count:
+            return 0, None
+        lo, hi = 0, self.restart_count
+        while lo < hi:
+            middle = (lo + hi) // 2
+            if self._read(self.restarts[middle], None)[0] < key:
+                lo = middle + 1
+            else:
+                hi = middle
+        # the last run starting below key holds the position, or else run 0
+        run = max(lo - 1, 0)
+        position = run * self.restart_interval
+        for decoded in self._run(run):
+            if not decoded < key:
+                return position, decoded
+            position += 1
+        if run + 1 < self.restart_count:
+            return position, self._read(self.restarts[run + 1], None)[0]
+        return position, None
+
+    # like bisect.bisect_left on the decoded keys
+    def bisect_left(self, key) -> int:
+        return self._locate(key)[0]
+
+    # returns key_found, position_of_the_first_key_not_below_it
+    def search(self, key) -> Tuple[bool, int]:
+        i, found = self._locate(key)
+        return found is not None and found == key, i
+
+    def __contains__(self, key) -> bool:
+        return self.search(key)[0]
+
+
+class IntBlock(KeyBlock):
+    @staticmethod
+    def _write(out: bytearray, key: int, previous: int):
+        write_varint(out, _zigzag(key) if previous is None else key - previous)
+
+    def _read(self, offset: int, previous: int) -> Tuple[int, int]:
+        value, offset = read_varint(self.data, offset)
+        return (_unzigzag(value) if previous is None else previous + value), offset
+
+    # the length of encode(keys), without encoding them
+    @staticmethod
+    def encoded_size(keys: Sequence[int], restart_interval: int = RESTART_INTERVAL) -> int:
+        size = 0
+        previous = None
+        for i, key in enumerate(keys):
+            value = _zigzag(key) if i % restart_interval == 0 else key - previous
+            size += (value.bit_length() + 6) // 7 or 1
+            previous = key
+        return size + 4 * -(-len(keys) // restart_interval) + TRAILER.size
+
+
+class BytesBlock(KeyBlock):
+    @staticmethod
+    def _write(out: bytearray, key: bytes, previous: bytes):
+        shared = 0
+        if previous is not None:
+            limit = min(len(key), len(previous))
+            while shared < limit and key[shared] == previous[shared]:
+                shared += 1
+        write_varint(out, shared)
+        write_varint(out, len(key) - shared)
+        out += key[shared:]
+
+    def _read(self, offset: int, previous: bytes) -> Tuple[bytes, int]:
+        shared, offset = read_varint(self.data, offset)
+        length, offset = read_varint(self.data, offset)
+        rest = self.data[offset:offset + length].tobytes()
+        return (previous[:shared] + rest if shared else rest), offset + length
+
+
+# Order preserving key encoding: encode_key(a) < encode_key(b) as bytes exactly
+# when a < b, so a tree of encoded keys compares them with a single memcmp.
+# Every key starts with a type code. bytes and str (as utf-8) escape their
+# 0x00 bytes as 0x00 0xff and end with 0x00. An int of n <= 8 bytes is coded
+# 0x14 + n followed by its big endian bytes, a negative one 0x14 - n followed
+# by the ones' complement, longer ints carry their length in a second byte.
+# A tuple is its encoded items followed by 0x00, which sorts below any item.
+BYTES_CODE, STR_CODE, TUPLE_CODE = 0x01, 0x02, 0x05
+INT_ZERO_CODE, INT_LONG_NEGATIVE_CODE, INT_LONG_POSITIVE_CODE = 0x14, 0x0b, 0x1d
+
+
+def encode_key(key) -> bytes:
+    out = bytearray()
+    _encode(out, key)
+    return bytes(out)
+
+
+def _encode(out: bytearray, key):
+    if isinstance(key, bytes):
+        out.append(BYTES_CODE)
+        out += key.replace(b'\x00', b'\x00\xff')
+        out.append(0)
+    elif isinstance(key, str):
+        out.append(STR_CODE)
+        out += key.encode('utf-8').replace(b'\x00', b'\x00\xff')
+        out.append(0)
+    elif isinstance(key, int):
+        size = (abs(key).bit_length() + 7) // 8
+        if size > 255:
+            raise ValueError("int key too large to encode: %d bytes" % size)
+        if key >= 0:
+            out += bytes([INT_ZERO_CODE + size]) if size <= 8 else bytes([INT_LONG_POSITIVE_CODE, size])
+            out += key.to_bytes(size, 'big')
+        else:
+            out += bytes([INT_ZERO_CODE - size]) if size <= 8 else bytes([INT_LONG_NEGATIVE_CODE, size ^ 0xff])
+            out += (key + (1 << 8 * size) - 1).to_bytes(size, 'big')
+    elif isinstance(key, tuple):
+        out.append(TUPLE_CODE)
+        for item in key:
+            _encode(out, item)
+        out.append(0)
+    else:
+        raise TypeError("cannot encode a key of type %s" % type(key).__name__)
+
+
+def decode_key(data: bytes):
+    key, offset = _decode(data, 0)
+    if offset != len(data):
+        raise ValueError("trailing bytes after the encoded key")
+    return key
+
+
+def _decode(data: bytes, offset: int) -> Tuple[object, int]:
+    code = data[offset]
+    offset += 1
+    if code == BYTES_CODE or code == STR_CODE:
+        end = offset
+        while True:
+            end = data.index(b'\x00', end)
+            if end + 1 < len(data) and data[end + 1] == 0xff:
+                end += 2
+            else:
+                break
+        raw = data[offset:end].replace(b'\x00\xff', b'\x00')
+        return (raw if code == BYTES_CODE else raw.decode('utf-8')), end + 1
+    if code == TUPLE_CODE:
+        items = []
+        while data[offset] != 0:
+            item, offset = _decode(data, offset)
+            items.append(item)
+        return tuple(items), offset + 1
+    if INT_LONG_NEGATIVE_CODE <= code <= INT_LONG_POSITIVE_CODE:
+        if code == INT_LONG_POSITIVE_CODE:
+            size, offset = data[offset], offset + 1
+        elif code == INT_LONG_NEGATIVE_CODE:
+            size, offset = data[offset] ^ 0xff, offset + 1
+        else:
+            size = abs(code - INT_ZERO_CODE)
+        value = int.from_bytes(data[offset:offset + size], 'big')
+        if code < INT_ZERO_CODE:
+            value -= (1 << 8 * size) - 1
+        return value, offset + size
+    raise ValueError("unknown key type code 0x%02x" % code)
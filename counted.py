@@ -0,0 +1,108 @@
+from __future__ import annotations
+import bisect
+from typing import Any, Dict, Iterable, List
+
+from btree import Node
+
+
+# A node that knows the number of keys in its subtree. The counts are kept up
+# to date on every change, which makes rank, select and count O(m log n)
+# instead of a scan of the tree.
+class CountedNode(Node):
+    def __init__(self, m: int, keys: List[int]=[], children: List[Node]=[], parent: Node=None, is_leaf: bool = False,
+                 values: List[Any]=None):
+        super().__init__(m, keys, children, parent, is_leaf, values)
+        self._recount()
+
+    def _recount(self):
+        self.size = len(self.keys) + sum(child.size for child in self.children)
+
+    # adds delta to the count of this node and every node above it
+    def _resized(self, delta: int):
+        node = self
+        while node:
+            node.size += delta
+            node = node.parent
+
+    def _insert_key(self, key, value=None):
+        self._resized(1)
+        super()._insert_key(key, value)
+
+    def _delete_key(self, delete_key, deferred: Dict[int, Node] = None):
+        # an internal node hands the deletion down to a leaf, which counts it
+        if self.is_leaf:
+            self._resized(-1)
+        super()._delete_key(delete_key, deferred)
+
+    def _split_off(self) -> Node:
+        # the new right siblings count themselves, the parent keeps its total
+        parent = super()._split_off()
+        if parent:
+            self._recount()
+        return parent
+
+    def rebalance(self, deferred: Dict[int, Node] = None):
+        if not self.parent or len(self.keys) >= self.m // 2:
+            return super().rebalance(deferred)
+        left_sibling, right_sibling, _ = self._siblings()
+        sibling = left_sibling or right_sibling
+        total = self.size + sibling.size
+        if len(sibling.keys) - (self.m // 2 - len(self.keys)) < self.m // 2:
+            # a merge takes the separator along, the survivor has to be counted
+            # before the parent rebalances in turn
+            (left_sibling or self).size = total + 1
+            super().rebalance(deferred)
+        else:
+            super().rebalance(deferred)
+            self._recount()
+            sibling.size = total - self.size
+
+    @classmethod
+    def bulk_load(cls, m: int, keys: Iterable[int], fill_factor: float = 1.0, values: Iterable[Any]=None) -> Node:
+        root = super().bulk_load(m, keys, fill_factor, values)
+        # the nodes are filled after they are created, count them bottom up
+        levels = [[root]]
+        while not levels[-1][0].is_leaf:
+            levels.append([child for node in levels[-1] for child in node.children])
+        for level in reversed(levels):
+            for node in level:
+                node._recount()
+        return root
+
+    def __len__(self) -> int:
+        return self.size
+
+    # the number of keys smaller than key
+    def rank(self, key) -> int:
+        rank, node = 0, self
+        while True:
+            i = bisect.bisect_left(node.keys, key)
+            found = i < len(node.keys) and node.keys[i] == key
+            rank += i + sum(child.size for child in node.children[:i + found])
+            if found or node.is_leaf:
+                return rank
+            node = node.children[i]
+
+    # the key at position index in key order, negative indexes count from the end
+    def select(self, index: int):
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("index out of range")
+        node = self
+        while not node.is_leaf:
+            for i, child in enumerate(node.children):
+                if index < child.size:
+                    node = child
+                    break
+                index -= child.size
+                if index == 0:
+                    return node.keys[i]
+                index -= 1
+        return node.keys[index]
+
+    # the number of keys with lo <= key < hi, both bounds are optional
+    def count(self, lo=None, hi=None) -> int:
+        upper = self.size if hi is None else self.rank(hi)
+        lower = 0 if lo is None else self.rank(lo)
+        return max(upper - lower, 0)
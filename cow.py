@@ -0,0 +1,161 @@
+from __future__ import annotations
+import bisect
+import threading
+from operator import itemgetter
+from typing import Any, Iterable, Iterator, Tuple
+
+from btree import BaseNode, Node
+
+
+# An immutable node. There are no parent pointers, so a node can be shared by
+# any number of tree versions and is freed with the last version using it.
+class FrozenNode:
+    __slots__ = ('keys', 'values', 'children', '__weakref__')
+
+    def __init__(self, keys: Tuple[int, ...] = (), values: Tuple[Any, ...] = None,
+                 children: Tuple[FrozenNode, ...] = ()):
+        self.keys = tuple(keys)
+        self.values = tuple(values) if values is not None else (None,) * len(self.keys)
+        self.children = tuple(children)
+
+    @property
+    def is_leaf(self) -> bool:
+        return not self.children
+
+
+def _from_node(node: Node) -> FrozenNode:
+    return FrozenNode(node.keys, node.values, [_from_node(child) for child in node.children])
+
+
+# A read-only version of a copy-on-write tree, safe to read from any thread
+# without locks while the tree it came from keeps changing.
+class Snapshot:
+    __slots__ = ('root', 'm')
+
+    def __init__(self, m: int, root: FrozenNode = None):
+        self.m = m
+        self.root = root or FrozenNode()
+
+    # frozen nodes have the attributes the read-only algorithms of BaseNode use
+    def search(self, key) -> Tuple[bool, FrozenNode]:
+        return BaseNode.search(self.root, key)
+
+    def get(self, key, default=None):
+        found, node = self.search(key)
+        return node.values[bisect.bisect_left(node.keys, key)] if found else default
+
+    def __contains__(self, key) -> bool:
+        return self.search(key)[0]
+
+    def items(self, lo=None, hi=None) -> Iterator[Tuple[int, Any]]:
+        return BaseNode.items(self.root, lo, hi)
+
+    def range(self, lo=None, hi=None) -> Iterator[int]:
+        return map(itemgetter(0), self.items(lo, hi))
+
+
+# A b-tree whose insert and delete copy the root-to-leaf path they change and
+# share everything else with the previous version. snapshot() is O(1).
+# Writers are serialized by a lock, readers never take one.
+class CowBTree(Snapshot):
+    __slots__ = ('lock',)
+
+    def __init__(self, m: int, root: FrozenNode = None):
+        super().__init__(m, root)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def bulk_load(cls, m: int, keys: Iterable[int], fill_factor: float = 1.0, values: Iterable[Any] = None) -> CowBTree:
+        return cls(m, _from_node(Node.bulk_load(m, keys, fill_factor, values)))
+
+    def snapshot(self) -> Snapshot:
+        return Snapshot(self.m, self.root)
+
+    def insert(self, key, value=None):
+        with self.lock:
+            self._set_root(self._insert(self.root, key, value, False))
+
+    def put(self, key, value):
+        with self.lock:
+            self._set_root(self._insert(self.root, key, value, True))
+
+    def delete(self, key):
+        with self.lock:
+            root = self._delete(self.root, key)
+            # shrink tree: an empty root is replaced by its only child
+            self.root = root.children[0] if not root.keys and root.children else root
+
+    def _set_root(self, pieces: tuple):
+        if len(pieces) == 1:
+            self.root = pieces[0]
+        else:
+            left, key, value, right = pieces
+            self.root = FrozenNode((key,), (value,), (left, right))
+
+    # returns the new version of node, or the two halves and the separator
+    # between them as (left, key, value, right) if it had to split
+    def _insert(self, node: FrozenNode, key, value, replace: bool) -> tuple:
+        i = bisect.bisect_left(node.keys, key)
+        if i < len(node.keys) and node.keys[i] == key:
+            if not replace:
+                return node,
+            return FrozenNode(node.keys, node.values[:i] + (value,) + node.values[i + 1:], node.children),
+        if node.is_leaf:
+            keys = node.keys[:i] + (key,) + node.keys[i:]
+            values = node.values[:i] + (value,) + node.values[i:]
+            children = ()
+        else:
+            pieces = self._insert(node.children[i], key, value, replace)
+            if len(pieces) == 1:
+                if pieces[0] is node.children[i]:
+                    return node,
+                return FrozenNode(node.keys, node.values, node.children[:i] + pieces + node.children[i + 1:]),
+            left, separator, separator_value, right = pieces
+            keys = node.keys[:i] + (separator,) + node.keys[i:]
+            values = node.values[:i] + (separator_value,) + node.values[i:]
+            children = node.children[:i] + (left, right) + node.children[i + 1:]
+        if len(keys) <= self.m:
+            return FrozenNode(keys, values, children),
+        middle = len(keys) // 2
+        return (FrozenNode(keys[:middle], values[:middle], children[:middle + 1]), keys[middle], values[middle],
+                FrozenNode(keys[middle + 1:], values[middle + 1:], children[middle + 1:]))
+
+    def _delete(self, node: FrozenNode, key) -> FrozenNode:
+        i = bisect.bisect_left(node.keys, key)
+        found = i < len(node.keys) and node.keys[i] == key
+        if node.is_leaf:
+            if not found:
+                raise Exception("%s was not found", key)
+            return FrozenNode(node.keys[:i] + node.keys[i + 1:], node.values[:i] + node.values[i + 1:])
+        keys, values = node.keys, node.values
+        if found:
+            # replace the key by its predecessor, the max of its left subtree
+            leaf = node.children[i]
+            while not leaf.is_leaf:
+                leaf = leaf.children[-1]
+            keys = keys[:i] + leaf.keys[-1:] + keys[i + 1:]
+            values = values[:i] + leaf.values[-1:] + values[i + 1:]
+            key = leaf.keys[-1]
+        child = self._delete(node.children[i], key)
+        children = node.children[:i] + (child,) + node.children[i + 1:]
+        if len(child.keys) < self.m // 2:
+            keys, values, children = self._refill(keys, values, children, i)
+        return FrozenNode(keys, values, children)
+
+    # child i has too few keys: pool it with a neighbour and the separator
+    # between them, then merge the pool into one node or split it evenly
+    def _refill(self, keys: tuple, values: tuple, children: tuple, i: int) -> tuple:
+        j = i - 1 if i > 0 else i
+        left, right = children[j], children[j + 1]
+        pool_keys = left.keys + keys[j:j + 1] + right.keys
+        pool_values = left.values + values[j:j + 1] + right.values
+        pool_children = left.children + right.children
+        if len(pool_keys) <= self.m:
+            merged = FrozenNode(pool_keys, pool_values, pool_children)
+            return keys[:j] + keys[j + 1:], values[:j] + values[j + 1:], children[:j] + (merged,) + children[j + 2:]
+        middle = len(pool_keys) // 2
+        left = FrozenNode(pool_keys[:middle], pool_values[:middle], pool_children[:middle + 1])
+        right = FrozenNode(pool_keys[middle + 1:], pool_values[middle + 1:], pool_children[middle + 1:])
+        return (keys[:j] + pool_keys[middle:middle + 1] + keys[j + 1:],
+                values[:j] + pool_values[middle:middle + 1] + values[j + 1:],
+                children[:j] + (left, right) + children[j + 2:])
@@ -0,0 +1,71 @@
+from __future__ import annotations
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, Tuple, Type
+
+from btree import Node
+from codec import decode_key, encode_key
+
+
+# A b-tree over bytes, str, int and tuple keys, e.g. (tenant_id, timestamp).
+# Every key is encoded once on the way in to bytes that sort like the key, so
+# the nodes only hold bytes and search and bisect compare them with memcmp.
+# encode and decode can be replaced, e.g. by a fixed width packing of a known
+# key layout; without decode the encoded bytes are handed out as keys.
+class KeyedBTree:
+    def __init__(self, m: int, node_class: Type[Node] = Node, encode: Callable[[Any], bytes] = encode_key,
+                 decode: Callable[[bytes], Any] = decode_key, root: Node = None):
+        self.m = m
+        self.encode = encode
+        self.decode = decode
+        self.root = root or node_class(m, [], is_leaf=True)
+
+    # keys must be given in increasing order
+    @classmethod
+    def bulk_load(cls, m: int, keys: Iterable, fill_factor: float = 1.0, values: Iterable[Any] = None,
+                  node_class: Type[Node] = Node, encode: Callable[[Any], bytes] = encode_key,
+                  decode: Callable[[bytes], Any] = decode_key) -> KeyedBTree:
+        return cls(m, node_class, encode, decode, node_class.bulk_load(m, map(encode, keys), fill_factor, values))
+
+    def get(self, key, default=None):
+        return self.root.get(self.encode(key), default)
+
+    def __contains__(self, key) -> bool:
+        return self.root.search(self.encode(key))[0]
+
+    def insert(self, key, value=None):
+        self.root = self.root.insert(self.encode(key), value)
+
+    def put(self, key, value):
+        self.root = self.root.put(self.encode(key), value)
+
+    def delete(self, key):
+        self.root.delete(self.encode(key))
+
+    def insert_many(self, keys: Iterable, values: Iterable[Any] = None):
+        self.root = self.root.insert_many(map(self.encode, keys), values)
+
+    def delete_many(self, keys: Iterable) -> int:
+        return self.root.delete_many(map(self.encode, keys))
+
+    def _bound(self, key) -> bytes:
+        return None if key is None else self.encode(key)
+
+    # yields (key, value) with lo <= key < hi in key order, both bounds are optional
+    def items(self, lo=None, hi=None) -> Iterator[Tuple[Any, Any]]:
+        items = self.root.items(self._bound(lo), self._bound(hi))
+        if self.decode is None:
+            return items
+        return ((self.decode(key), value) for key, value in items)
+
+    def range(self, lo=None, hi=None) -> Iterator:
+        keys = self.root.range(self._bound(lo), self._bound(hi))
+        return keys if self.decode is None else map(self.decode, keys)
+
+    # the nodes already hold bytes, they are written as prefix compressed blocks
+    def dump(self, fp: BinaryIO):
+        self.root.dump(fp)
+
+    @classmethod
+    def load(cls, fp: BinaryIO, node_class: Type[Node] = Node, encode: Callable[[Any], bytes] = encode_key,
+             decode: Callable[[bytes], Any] = decode_key) -> KeyedBTree:
+        root = node_class.load(fp)
+        return cls(root.m, node_class, encode, decode, root)
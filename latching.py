@@ -0,0 +1,217 @@
+from __future__ import annotations
+import bisect
+import threading
+from typing import Any, Callable, Dict, List, Tuple
+
+from btree import Node
+
+
+# A reader/writer latch: any number of readers or a single writer. Waiting
+# writers keep new readers out so a steady stream of lookups cannot starve them.
+class RWLatch:
+    __slots__ = ('_condition', '_readers', '_writer', '_waiting_writers')
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+
+class LatchedNode(Node):
+    def __init__(self, m: int, keys: List[int]=[], children: List[Node]=[], parent: Node=None, is_leaf: bool = False,
+                 values: List[Any]=None):
+        super().__init__(m, keys, children, parent, is_leaf, values)
+        self.latch = RWLatch()
+
+    # The writer holds the parent, so nobody can enter the sibling any more,
+    # but a thread that is already inside has to leave before we change it.
+    def rebalance(self, deferred: Dict[int, Node] = None):
+        if not self.parent or len(self.keys) >= self.m // 2:
+            return super().rebalance(deferred)
+        left_sibling, right_sibling, _ = self._siblings()
+        sibling = left_sibling or right_sibling
+        sibling.latch.acquire_write()
+        try:
+            super().rebalance(deferred)
+        finally:
+            sibling.latch.release_write()
+
+
+# A b-tree shared between threads. Readers crab down with read latches and hold
+# at most a parent and a child at a time. Writers crab down with write latches
+# and let go of everything above a node that cannot split (insert) or underflow
+# (delete), so they hold only the part of the path their change can reach.
+class ConcurrentBTree:
+    def __init__(self, m: int, root: LatchedNode = None):
+        self.m = m
+        self.root = root or LatchedNode(m, [], is_leaf=True)
+        # guards the root pointer, an insert that splits the root replaces it
+        self.root_latch = RWLatch()
+
+    @classmethod
+    def bulk_load(cls, m: int, keys, fill_factor: float = 1.0, values=None) -> ConcurrentBTree:
+        return cls(m, LatchedNode.bulk_load(m, keys, fill_factor, values))
+
+    def search(self, key) -> Tuple[bool, Any]:
+        self.root_latch.acquire_read()
+        node = self.root
+        node.latch.acquire_read()
+        self.root_latch.release_read()
+        while True:
+            i = bisect.bisect_left(node.keys, key)
+            if i < len(node.keys) and node.keys[i] == key:
+                value = node.values[i]
+                node.latch.release_read()
+                return True, value
+            if node.is_leaf:
+                node.latch.release_read()
+                return False, None
+            child = node.children[i]
+            child.latch.acquire_read()
+            node.latch.release_read()
+            node = child
+
+    def get(self, key, default=None):
+        found, value = self.search(key)
+        return value if found else default
+
+    def __contains__(self, key) -> bool:
+        return self.search(key)[0]
+
+    # the (key, value) pairs with lo <= key < hi, read latches are held along
+    # the walk so the result is a consistent view of the scanned subtrees
+    def items(self, lo=None, hi=None) -> List[Tuple[int, Any]]:
+        result = []
+
+        def walk(node: Node):
+            start = 0 if lo is None else bisect.bisect_left(node.keys, lo)
+            end = len(node.keys) if hi is None else bisect.bisect_left(node.keys, hi)
+            if node.is_leaf:
+                result.extend(zip(node.keys[start:end], node.values[start:end]))
+                return
+            for i in range(start, end + 1):
+                child = node.children[i]
+                child.latch.acquire_read()
+                try:
+                    walk(child)
+                finally:
+                    child.latch.release_read()
+                if i < end:
+                    result.append((node.keys[i], node.values[i]))
+
+        self.root_latch.acquire_read()
+        root = self.root
+        root.latch.acquire_read()
+        self.root_latch.release_read()
+        try:
+            walk(root)
+        finally:
+            root.latch.release_read()
+        return result
+
+    def range(self, lo=None, hi=None) -> List[int]:
+        return [key for key, _ in self.items(lo, hi)]
+
+    # Write-latches the path to key. Returns the node holding key or the leaf
+    # it belongs in, plus the latches still held, outermost first.
+    def _write_path(self, key, is_safe: Callable[[Node], bool]) -> Tuple[Node, List[Node], bool]:
+        self.root_latch.acquire_write()
+        held = [self]
+        node = self.root
+        node.latch.acquire_write()
+        if is_safe(node):
+            self._release(held)
+        held.append(node)
+        while True:
+            i = bisect.bisect_left(node.keys, key)
+            if i < len(node.keys) and node.keys[i] == key:
+                return node, held, True
+            if node.is_leaf:
+                return node, held, False
+            node = node.children[i]
+            node.latch.acquire_write()
+            if is_safe(node):
+                self._release(held)
+            held.append(node)
+
+    def _release(self, held: List):
+        for holder in held:
+            if holder is self:
+                self.root_latch.release_write()
+            else:
+                holder.latch.release_write()
+        held.clear()
+
+    def _upsert(self, key, value, replace: bool):
+        node, held, found = self._write_path(key, lambda node: len(node.keys) < node.m)
+        try:
+            if found:
+                if replace:
+                    node.values[bisect.bisect_left(node.keys, key)] = value
+                return
+            node._insert_key(key, value)
+            # only an unsafe root can have split, so the root latch is still held
+            while self.root.parent:
+                self.root = self.root.parent
+        finally:
+            self._release(held)
+
+    def insert(self, key, value=None):
+        self._upsert(key, value, False)
+
+    def put(self, key, value):
+        self._upsert(key, value, True)
+
+    def delete(self, key):
+        def is_safe(node: Node) -> bool:
+            if node.parent is None:
+                return node.is_leaf or len(node.keys) > 1
+            return len(node.keys) > node.m // 2
+
+        node, held, found = self._write_path(key, is_safe)
+        try:
+            if not found:
+                raise Exception("%s was not found", key)
+            if not node.is_leaf:
+                # the key is replaced by its predecessor, latch the way down to it and
+                # keep node itself latched since its key changes
+                owner = node
+                child = node.children[bisect.bisect_left(node.keys, key)]
+                while True:
+                    child.latch.acquire_write()
+                    if is_safe(child):
+                        self._release([holder for holder in held if holder is not owner])
+                        held[:] = [owner]
+                    held.append(child)
+                    if child.is_leaf:
+                        break
+                    child = child.children[-1]
+            node._delete_key(key)
+        finally:
+            self._release(held)
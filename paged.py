@@ -0,0 +1,672 @@
+from __future__ import annotations
+import bisect
+import heapq
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Set, Sized, Tuple
+
+from btree import NO_VALUE, BaseNode, Node, _values_for
+from codec import TRAILER, IntBlock, KeyBlock
+
+# page 0: magic, version, flags, page size, order m, root page, page count,
+# head of the free list
+HEADER = struct.Struct('<4sHBxIIQQQ')
+MAGIC = b'BTPG'
+VERSION = 1
+# the keys of every page are a codec.IntBlock
+FLAG_COMPRESSED = 1
+# every other page: kind, key count, size of the key block, then the keys, the
+# values and for internal nodes the child page ids, all as 64-bit little endian
+# integers. A compressed page has its keys as an IntBlock of the given size
+# instead of raw int64, a raw page has a key block size of 0
+PAGE_HEADER = struct.Struct('<BxHI')
+LEAF, INTERNAL, FREE = 1, 2, 3
+
+
+# The most keys a page can hold. m keys, m values and m + 1 children have to
+# fit next to the page header, and a compressed page takes at least a byte
+# per key plus a share of its restart offsets, so that only bounds the key
+# count: whether a compressed node fits depends on its keys.
+def max_order(page_size: int, compress: bool = False) -> int:
+    if compress:
+        return (page_size - PAGE_HEADER.size - 8 - TRAILER.size) // 18
+    return (page_size - PAGE_HEADER.size - 8) // 24
+
+
+# the most keys of a compressed page that always fit, at 10 bytes per key
+def _safe_order(page_size: int) -> int:
+    return (page_size - PAGE_HEADER.size - 8 - TRAILER.size) // 27
+
+
+# pages hold int64 keys and values, checked before they reach a node: a page
+# that cannot be encoded would only fail when written back, after the change
+# is done and with the file left without its header
+def check_entry(key, value=None):
+    for name, item in (('key', key), ('value', value)):
+        if item is None and name == 'value':
+            continue
+        if not isinstance(item, int):
+            raise TypeError("paged b-tree %ss must be int, got %s" % (name, type(item).__name__))
+        if not -2 ** 63 <= item < 2 ** 63:
+            raise OverflowError("paged b-tree %ss must fit into int64, got %d" % (name, item))
+    if value == NO_VALUE:
+        raise ValueError("%d is reserved to store None" % NO_VALUE)
+
+
+class PageFile:
+    def __init__(self, path: str, page_size: int = 4096, m: int = None, compress: bool = None):
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open(path, 'r+b' if exists else 'w+b')
+        if exists:
+            header = self.file.read(HEADER.size)
+            magic, version, flags, self.page_size, self.m, self.root, self.page_count, free_head = \
+                HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("%s is not a paged b-tree file" % path)
+            if m is not None and m != self.m:
+                raise ValueError("%s was created with m=%d, not %d" % (path, self.m, m))
+            self.compress = bool(flags & FLAG_COMPRESSED)
+            if compress is not None and compress != self.compress:
+                raise ValueError("%s was created with compress=%s" % (path, self.compress))
+        else:
+            self.compress = bool(compress)
+            limit = max_order(page_size, self.compress)
+            m = m or limit
+            if m > limit:
+                raise ValueError("m=%d does not fit into %d byte pages, at most %d" % (m, page_size, limit))
+            self.page_size, self.m, self.root, self.page_count, free_head = page_size, m, 0, 1, 0
+            self.file.truncate(page_size)
+        self.safe_order = self.m if not self.compress else min(self.m, _safe_order(self.page_size))
+        self.mmap = mmap.mmap(self.file.fileno(), 0)
+        self.free_pages = []
+        while free_head:
+            self.free_pages.append(free_head)
+            free_head = struct.unpack_from('<Q', self.mmap, free_head * self.page_size + PAGE_HEADER.size)[0]
+        self.reads = 0
+        self.writes = 0
+        # reads may come from other threads, the map must not be swapped under them
+        self.lock = threading.Lock()
+        if not exists:
+            # a new file gets its header right away, it opens even if never flushed
+            self.flush(sync=False)
+
+    def read(self, page_id: int) -> bytes:
+        offset = page_id * self.page_size
+        with self.lock:
+            self.reads += 1
+            return self.mmap[offset:offset + self.page_size]
+
+    def write(self, page_id: int, data: bytes):
+        offset = page_id * self.page_size
+        with self.lock:
+            self.writes += 1
+            self.mmap[offset:offset + len(data)] = data
+
+    def allocate(self) -> int:
+        if self.free_pages:
+            return self.free_pages.pop()
+        page_id = self.page_count
+        self.page_count += 1
+        if self.page_count * self.page_size > len(self.mmap):
+            # grow by doubling so appends stay amortized O(1)
+            with self.lock:
+                self.mmap.close()
+                self.file.truncate(2 * self.page_count * self.page_size)
+                self.mmap = mmap.mmap(self.file.fileno(), 0)
+        return page_id
+
+    def free(self, page_id: int):
+        self.free_pages.append(page_id)
+
+    def flush(self, sync: bool = True):
+        # the free list is chained through the free pages themselves
+        next_free = 0
+        for page_id in reversed(self.free_pages):
+            self.write(page_id, PAGE_HEADER.pack(FREE, 0, 0) + struct.pack('<Q', next_free))
+            next_free = page_id
+        with self.lock:
+            self.mmap[:HEADER.size] = HEADER.pack(MAGIC, VERSION, FLAG_COMPRESSED if self.compress else 0,
+                                                  self.page_size, self.m, self.root, self.page_count, next_free)
+        if sync:
+            self.sync()
+
+    # blocks until the written pages are on disk
+    def sync(self):
+        with self.lock:
+            self.mmap.flush()
+
+    def close(self):
+        self.mmap.close()
+        self.file.close()
+
+
+# the children of a paged node: page ids until an entry is first accessed,
+# then the decoded PagedNode that replaces the id
+class _Children(list):
+    __slots__ = ('owner',)
+
+    def __init__(self, owner: PagedNode, entries: Iterable = ()):
+        super().__init__(entries)
+        self.owner = owner
+
+    def __getitem__(self, index):
+        entry = list.__getitem__(self, index)
+        if isinstance(index, slice):
+            return entry
+        if isinstance(entry, int):
+            entry = self.owner.store.load(entry, self.owner)
+            list.__setitem__(self, index, entry)
+        else:
+            self.owner.store.access(entry)
+        return entry
+
+    def __iter__(self) -> Iterator[PagedNode]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __reversed__(self) -> Iterator[PagedNode]:
+        for i in range(len(self) - 1, -1, -1):
+            yield self[i]
+
+    def pop(self, index: int = -1) -> PagedNode:
+        entry = self[index]
+        list.pop(self, index)
+        return entry
+
+    def page_ids(self) -> List[int]:
+        return [entry if isinstance(entry, int) else entry.page_id for entry in list.__iter__(self)]
+
+
+class PagedNode(BaseNode):
+    __slots__ = ('parent', 'keys', 'values', 'm', '_children', 'is_leaf', 'store', 'page_id')
+
+    def __init__(self, m: int, keys: List[int]=[], children: List[Node]=[], parent: Node=None,
+                 is_leaf: bool = False, values: List[Any]=None, store: PagedStore=None, page_id: int=None):
+        # nodes created by split inherit the store from their parent or their first child
+        self.store = store or (parent or children[0]).store
+        self.parent = parent
+        self.keys = keys or []
+        self.values = values or [None] * len(self.keys)
+        self.m = m
+        self.is_leaf = is_leaf
+        self.children = children
+        created = page_id is None
+        self.page_id = self.store.file.allocate() if created else page_id
+        self.store.admit(self, created)
+
+    @property
+    def children(self) -> _Children:
+        return self._children
+
+    @children.setter
+    def children(self, children: Iterable):
+        if isinstance(children, _Children):
+            children = list.__iter__(children)
+        self._children = _Children(self, children or ())
+        for child in list.__iter__(self._children):
+            if not isinstance(child, int):
+                child.parent = self
+
+    # every change starts here: a compressed page keeps its keys as the
+    # IntBlock it was read as until the node is first changed
+    def _touch(self):
+        if not isinstance(self.keys, list):
+            self.keys = list(self.keys)
+        self.store.dirty[self.page_id] = self
+
+    # searches compressed keys within their block, without decoding it
+    def search(self, search_key) -> Tuple[bool, PagedNode]:
+        node = self
+        while True:
+            keys = node.keys
+            if isinstance(keys, list):
+                i = bisect.bisect_left(keys, search_key)
+                found = i < len(keys) and keys[i] == search_key
+            else:
+                found, i = keys.search(search_key)
+            if found:
+                return True, node
+            if node.is_leaf:
+                return False, node
+            node = node.children[i]
+
+    def get(self, key, default=None):
+        success, node = self.search(key)
+        if not success:
+            return default
+        keys = node.keys
+        return node.values[bisect.bisect_left(keys, key) if isinstance(keys, list) else keys.bisect_left(key)]
+
+    # a compressed page also splits once its keys no longer fit the page
+    def _overfull(self) -> bool:
+        count = len(self.keys)
+        if count <= self.store.file.safe_order:
+            return False
+        return count > self.m or self.store.page_size(self.keys, self.is_leaf) > self.store.file.page_size
+
+    # cuts a compressed page into more groups until each one fits
+    def _split_sizes(self, total: int, lo: int, hi: int) -> List[int]:
+        if self.store.fill < 1:
+            sizes = self._group_sizes(total, lo, hi, max(lo, round(hi * self.store.fill)))
+        else:
+            sizes = super()._split_sizes(total, lo, hi)
+        budget = self.store.file.page_size * self.store.fill
+        groups = len(sizes)
+        while self.store.file.compress and 2 * (groups + 1) <= total and not self._groups_fit(sizes, budget):
+            groups += 1
+            size, larger = divmod(total, groups)
+            sizes = [size] * (groups - larger) + [size + 1] * larger
+        return sizes
+
+    # sizes count the keys of a group and the separator after it, as in _split_off
+    def _groups_fit(self, sizes: List[int], budget: float) -> bool:
+        start = 0
+        for size in sizes:
+            if self.store.page_size(self.keys[start:start + size - 1], self.is_leaf) > budget:
+                return False
+            start += size
+        return True
+
+    def insert(self, key, value=None):
+        if len(self.keys) == 0:
+            self._touch()
+        return super().insert(key, value)
+
+    def put(self, key, value):
+        success, node = self.search(key)
+        if success:
+            node._touch()
+        return super().put(key, value)
+
+    def _insert_key(self, key, value=None):
+        self._touch()
+        super()._insert_key(key, value)
+
+    def _delete_key(self, delete_key, deferred: Dict[int, PagedNode] = None):
+        self._touch()
+        super()._delete_key(delete_key, deferred)
+
+    def _split_off(self) -> Node:
+        self._touch()
+        if not self._overfull():
+            return None
+        if self.parent:
+            self.parent._touch()
+        self.store.pin(self)
+        try:
+            parent = super()._split_off()
+        finally:
+            self.store.unpin(self)
+        if parent:
+            parent._touch()
+        return parent
+
+    def rebalance(self, deferred: Dict[int, PagedNode] = None):
+        self._touch()
+        if not self.parent:
+            # the root taking over its only child frees the child's page
+            if not self.keys and self.children:
+                absorbed = self.children[0]
+                super().rebalance()
+                self.store.free(absorbed)
+            return
+        if len(self.keys) >= self.m // 2:
+            return
+        self.store.pin(self)
+        try:
+            self.parent._touch()
+            for sibling in self._siblings()[:2]:
+                if sibling:
+                    sibling._touch()
+            super().rebalance(deferred)
+        finally:
+            self.store.unpin(self)
+
+    def _remove_child(self, index: int) -> Node:
+        removed = super()._remove_child(index)
+        self.store.free(removed)
+        return removed
+
+
+# raised instead of reading a page while the store does not allow blocking reads
+class PageFault(Exception):
+    def __init__(self, page_id: int):
+        super().__init__(page_id)
+        self.page_id = page_id
+
+
+# decodes pages into PagedNodes on first access and writes dirty nodes back on flush
+class PagedStore:
+    def __init__(self, file: PageFile):
+        self.file = file
+        self.dirty: Dict[int, PagedNode] = {}
+        # page contents read ahead of time, load takes them instead of reading
+        self.prefetched: Dict[int, bytes] = {}
+        self.raise_faults = False
+        # the share of a page a split fills, bulk_load lowers it for its fill factor
+        self.fill = 1.0
+
+    def admit(self, node: PagedNode, created: bool):
+        if created:
+            self.dirty[node.page_id] = node
+
+    def access(self, node: PagedNode):
+        pass
+
+    def pin(self, node: PagedNode):
+        pass
+
+    def unpin(self, node: PagedNode):
+        pass
+
+    def load(self, page_id: int, parent: PagedNode = None) -> PagedNode:
+        data = self.prefetched.pop(page_id, None)
+        if data is None:
+            if self.raise_faults:
+                raise PageFault(page_id)
+            data = self.file.read(page_id)
+        kind, count, block_size = PAGE_HEADER.unpack_from(data)
+        offset = PAGE_HEADER.size
+        if block_size:
+            keys = IntBlock(memoryview(data)[offset:offset + block_size])
+            offset += block_size
+        else:
+            keys = list(struct.unpack_from('<%dq' % count, data, offset))
+            offset += 8 * count
+        values = [None if value == NO_VALUE else value for value in struct.unpack_from('<%dq' % count, data, offset)]
+        offset += 8 * count
+        children = list(struct.unpack_from('<%dQ' % (count + 1), data, offset)) if kind == INTERNAL else []
+        return PagedNode(self.file.m, keys, children, parent, kind == LEAF, values, self, page_id)
+
+    def encode(self, node: PagedNode) -> bytes:
+        count = len(node.keys)
+        values = [NO_VALUE if value is None else value for value in node.values]
+        if NO_VALUE in node.values:
+            raise ValueError("%d is reserved to store None" % NO_VALUE)
+        if not self.file.compress:
+            keys = struct.pack('<%dq' % count, *node.keys)
+            data = PAGE_HEADER.pack(LEAF if node.is_leaf else INTERNAL, count, 0) + keys
+        else:
+            keys = node.keys.data.tobytes() if isinstance(node.keys, KeyBlock) else IntBlock.encode(node.keys)
+            data = PAGE_HEADER.pack(LEAF if node.is_leaf else INTERNAL, count, len(keys)) + keys
+        data += struct.pack('<%dq' % count, *values)
+        if not node.is_leaf:
+            data += struct.pack('<%dQ' % (count + 1), *node.children.page_ids())
+        if len(data) > self.file.page_size:
+            raise ValueError("page %d needs %d bytes, more than a page" % (node.page_id, len(data)))
+        return data
+
+    # the bytes of a page holding keys
+    def page_size(self, keys, is_leaf: bool) -> int:
+        count = len(keys)
+        if not self.file.compress:
+            keys_size = 8 * count
+        elif isinstance(keys, KeyBlock):
+            keys_size = len(keys.data)
+        else:
+            keys_size = IntBlock.encoded_size(keys)
+        return PAGE_HEADER.size + keys_size + 8 * count + (0 if is_leaf else 8 * (count + 1))
+
+    def free(self, node: PagedNode):
+        self.dirty.pop(node.page_id, None)
+        self.prefetched.pop(node.page_id, None)
+        self.file.free(node.page_id)
+
+    def write(self, page_id: int, node: PagedNode):
+        self.prefetched.pop(page_id, None)
+        self.file.write(page_id, self.encode(node))
+
+    def flush(self, sync: bool = True):
+        for page_id, node in self.dirty.items():
+            self.write(page_id, node)
+        self.dirty.clear()
+        self.file.flush(sync)
+
+
+# Keeps at most capacity decoded pages resident and evicts the least recently
+# used one beyond that, writing it back first if it is dirty. Only nodes whose
+# children are all unresolved can go, their parent entry reverts to the page id.
+class BufferPool(PagedStore):
+    def __init__(self, file: PageFile, capacity: int = None):
+        super().__init__(file)
+        self.capacity = capacity
+        self.resident: OrderedDict[int, PagedNode] = OrderedDict()
+        self.pins: Dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # page ids pinned by the running write operation
+        self._held: Set[int] = None
+
+    def admit(self, node: PagedNode, created: bool):
+        super().admit(node, created)
+        if not created:
+            self.misses += 1
+        self.resident[node.page_id] = node
+        self._hold(node)
+        self._evict(node)
+
+    def access(self, node: PagedNode):
+        self.hits += 1
+        if node.page_id in self.resident:
+            self.resident.move_to_end(node.page_id)
+            self._hold(node)
+
+    def pin(self, node: PagedNode):
+        self.pins[node.page_id] = self.pins.get(node.page_id, 0) + 1
+
+    def unpin(self, node: PagedNode):
+        self._unpin(node.page_id)
+
+    def _unpin(self, page_id: int):
+        count = self.pins.pop(page_id, 0) - 1
+        if count > 0:
+            self.pins[page_id] = count
+
+    def _hold(self, node: PagedNode):
+        if self._held is not None and node.page_id not in self._held:
+            self._held.add(node.page_id)
+            self.pin(node)
+
+    # Split and rebalance keep node references across loads of their siblings,
+    # so every page a write operation touches stays pinned until it is done.
+    @contextmanager
+    def pinned(self):
+        if self._held is not None:
+            yield
+            return
+        self._held = set()
+        try:
+            yield
+        finally:
+            held, self._held = self._held, None
+            for page_id in held:
+                self._unpin(page_id)
+            self._evict()
+
+    def _evict(self, loading: PagedNode = None):
+        if self.capacity is None or len(self.resident) <= self.capacity:
+            return
+        excess = len(self.resident) - self.capacity
+        victims = []
+        for page_id, node in self.resident.items():
+            if len(victims) == excess:
+                break
+            if node.parent is None or page_id in self.pins:
+                continue
+            # the node being loaded is not linked into its parent yet
+            if loading is not None and (node is loading or node is loading.parent):
+                continue
+            if any(not isinstance(child, int) for child in list.__iter__(node.children)):
+                continue
+            victims.append(node)
+        for node in victims:
+            self._drop(node)
+
+    def _drop(self, node: PagedNode):
+        if node.page_id in self.dirty:
+            self.write(node.page_id, self.dirty.pop(node.page_id))
+        del self.resident[node.page_id]
+        siblings = node.parent.children
+        for i, entry in enumerate(list.__iter__(siblings)):
+            if entry is node:
+                list.__setitem__(siblings, i, node.page_id)
+                break
+        self.evictions += 1
+
+    def free(self, node: PagedNode):
+        super().free(node)
+        self.resident.pop(node.page_id, None)
+        self.pins.pop(node.page_id, None)
+
+
+# A b-tree whose nodes live in fixed-size pages of a memory-mapped file. Opening
+# reads the header only, a lookup decodes the pages on its root-to-leaf path.
+class PagedBTree:
+    def __init__(self, path: str, m: int = None, page_size: int = 4096, pool_pages: int = None,
+                 compress: bool = None):
+        self.file = PageFile(path, page_size, m, compress)
+        self.store = BufferPool(self.file, pool_pages)
+        self.m = self.file.m
+        self._root = None
+        if not self.file.root:
+            self._root = PagedNode(self.m, [], [], None, True, store=self.store)
+            self.file.root = self._root.page_id
+
+    # Streams the keys into pages: only the node being filled on each level
+    # stays pinned, every finished one may be written out and evicted, so the
+    # tree can be larger than the buffer pool. How many keys fit a compressed
+    # page depends on the keys, so there they are appended in batches instead
+    # and the rightmost pages split once their keys fill fill_factor of a page.
+    @classmethod
+    def bulk_load(cls, path: str, m: int, keys: Iterable[int], fill_factor: float = 1.0,
+                  values: Iterable[Any] = None, page_size: int = 4096, pool_pages: int = None,
+                  compress: bool = False) -> PagedBTree:
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            raise FileExistsError("bulk_load writes a new file, %s exists" % path)
+        if not isinstance(keys, Sized):
+            keys = list(keys)
+        values = list(_values_for(keys, values))
+        previous = None
+        for key, value in zip(keys, values):
+            check_entry(key, value)
+            if previous is not None and not previous < key:
+                raise ValueError("bulk_load needs strictly increasing keys, got %r after %r" % (key, previous))
+            previous = key
+        tree = cls(path, m, page_size, pool_pages, compress)
+        store = tree.store
+        if compress:
+            store.fill = fill_factor
+            try:
+                batch = 16 * tree.m
+                for start in range(0, len(keys), batch):
+                    tree.insert_many(keys[start:start + batch], values[start:start + batch])
+            finally:
+                store.fill = 1.0
+            return tree
+        store.free(tree.root)
+
+        def new_node(is_leaf: bool, parent: PagedNode) -> PagedNode:
+            node = PagedNode(tree.m, [], [], parent, is_leaf, None, store)
+            store.pin(node)
+            return node
+
+        tree._set_root(PagedNode._stream_load(tree.m, keys, fill_factor, values, new_node, store.unpin))
+        store._evict()
+        return tree
+
+    @property
+    def root(self) -> PagedNode:
+        if self._root is None:
+            self._root = self.store.load(self.file.root)
+        else:
+            self.store.access(self._root)
+        return self._root
+
+    def _set_root(self, root: PagedNode):
+        self._root = root
+        self.file.root = root.page_id
+
+    def search(self, key) -> Tuple[bool, PagedNode]:
+        return self.root.search(key)
+
+    def __contains__(self, key) -> bool:
+        return self.root.search(key)[0]
+
+    def get(self, key, default=None):
+        return self.root.get(key, default)
+
+    def items(self, lo=None, hi=None) -> Iterator[Tuple[int, Any]]:
+        return self.root.items(lo, hi)
+
+    def range(self, lo=None, hi=None) -> Iterator[int]:
+        return self.root.range(lo, hi)
+
+    # Keeps every page a write touches pinned. On compressed pages the key
+    # count alone does not tell whether a node fits: a rotation or a merge on
+    # delete can grow a page past its size with m keys or less, so the pages
+    # the write touched are split afterwards where they no longer fit.
+    @contextmanager
+    def _writing(self):
+        with self.store.pinned():
+            yield
+            if self.file.compress:
+                self._fit_pages()
+
+    def _fit_pages(self):
+        store = self.store
+        nodes = [store.resident.get(page_id) for page_id in store._held]
+        queue = [(-node._depth(), node.page_id, node) for node in nodes if node is not None and node._overfull()]
+        heapq.heapify(queue)
+        while queue:
+            depth, _, node = heapq.heappop(queue)
+            parent = node._split_off()
+            if parent and parent._overfull():
+                heapq.heappush(queue, (depth + 1, parent.page_id, parent))
+        root = self._root
+        while root.parent is not None:
+            root = root.parent
+        self._set_root(root)
+
+    def insert(self, key, value=None):
+        check_entry(key, value)
+        with self._writing():
+            self._set_root(self.root.insert(key, value))
+
+    def put(self, key, value):
+        check_entry(key, value)
+        with self._writing():
+            self._set_root(self.root.put(key, value))
+
+    def insert_many(self, keys: Iterable[int], values: Iterable[Any] = None):
+        keys = list(keys)
+        values = list(_values_for(keys, values))
+        for key, value in zip(keys, values):
+            check_entry(key, value)
+        with self._writing():
+            self._set_root(self.root.insert_many(keys, values))
+
+    def delete(self, key):
+        with self._writing():
+            self.root.delete(key)
+
+    def delete_many(self, keys: Iterable[int]) -> int:
+        with self._writing():
+            return self.root.delete_many(keys)
+
+    def flush(self):
+        self.store.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self) -> PagedBTree:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
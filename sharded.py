@@ -0,0 +1,278 @@
+from __future__ import annotations
+import bisect
+import os
+from array import array
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple, Type
+
+from btree import BaseNode, Node
+
+# the shard roots of a worker process, by shard number
+_roots: Dict[int, BaseNode] = {}
+
+
+def _numpy():
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("the batch operations of ShardedBTree need numpy") from None
+    return np
+
+
+# the int64 keys start:stop of a shared block, read in a worker
+def _shared_keys(name: str, start: int, stop: int) -> List[int]:
+    block = SharedMemory(name)
+    try:
+        with block.buf[8 * start:8 * stop] as view, view.cast('q') as keys:
+            return keys.tolist()
+    finally:
+        block.close()
+
+
+def _create(shard: int, node_class: Type[BaseNode], m: int):
+    _roots[shard] = node_class(m, [], is_leaf=True)
+
+
+def _bulk_load(shard: int, node_class: Type[BaseNode], m: int, fill_factor: float, name: str, start: int,
+               stop: int, values: List[Any]):
+    _roots[shard] = node_class.bulk_load(m, _shared_keys(name, start, stop), fill_factor, values)
+
+
+def _call(shard: int, method: str, *args):
+    return getattr(_roots[shard], method)(*args)
+
+
+def _update(shard: int, method: str, *args):
+    _roots[shard] = getattr(_roots[shard], method)(*args)
+
+
+def _insert_many(shard: int, name: str, start: int, stop: int, values: List[Any]):
+    _roots[shard] = _roots[shard].insert_many(_shared_keys(name, start, stop), values)
+
+
+def _delete_many(shard: int, name: str, start: int, stop: int) -> int:
+    return _roots[shard].delete_many(_shared_keys(name, start, stop))
+
+
+# writes the found mask of probes start:stop into the found block at the same
+# positions, only the values, if asked for, travel back pickled
+def _search_batch(shard: int, probes_name: str, found_name: str, start: int, stop: int, values: bool,
+                  default) -> List[Any]:
+    np = _numpy()
+    probes_block, found_block = SharedMemory(probes_name), SharedMemory(found_name)
+    try:
+        probes = np.ndarray(stop - start, np.int64, probes_block.buf, 8 * start)
+        found = np.ndarray(stop - start, bool, found_block.buf, start)
+        result = _roots[shard].search_batch(probes, values, default)
+        if values:
+            found[:], result = result[0], result[1].tolist()
+        else:
+            found[:], result = result, None
+        # the arrays export the buffers, which have to be released before close
+        del probes, found
+        return result
+    finally:
+        probes_block.close()
+        found_block.close()
+
+
+# puts the keys lo <= key < hi in a shared block the caller unlinks, returns
+# its name and the number of keys
+def _range(shard: int, lo, hi) -> Tuple[str, int]:
+    keys = array('q', _roots[shard].range(lo, hi))
+    if not keys:
+        return None, 0
+    block = SharedMemory(create=True, size=8 * len(keys))
+    try:
+        with memoryview(keys) as view, view.cast('B') as data:
+            block.buf[:len(data)] = data
+        return block.name, len(keys)
+    finally:
+        block.close()
+
+
+def _items(shard: int, lo, hi) -> List[Tuple[int, Any]]:
+    return list(_roots[shard].items(lo, hi))
+
+
+# Range-partitioned int64 keys over one process per shard: shard i holds the
+# keys bounds[i - 1] <= key < bounds[i] in a tree of its own, which lives in
+# its worker and is built and changed by the usual node methods there, so the
+# shards run on as many cores and take no GIL from each other. Single key
+# operations go to one worker; the batch operations take numpy, split their
+# keys by shard and run on all shards at once, with the keys and the found
+# mask passed in shared memory instead of being pickled.
+class ShardedBTree:
+    def __init__(self, m: int, bounds: Sequence[int], node_class: Type[BaseNode] = Node):
+        bounds = list(bounds)
+        if any(not lo < hi for lo, hi in zip(bounds, bounds[1:])):
+            raise ValueError("bounds must be strictly increasing")
+        self.m = m
+        self.bounds = bounds
+        self.node_class = node_class
+        # the workers have to share the tracker of the shared blocks with us,
+        # one of their own would unlink the blocks it saw when they exit
+        resource_tracker.ensure_running()
+        # a single process each, so every shard always meets its own tree
+        self.executors = [ProcessPoolExecutor(1) for _ in range(len(bounds) + 1)]
+        self._all(_create, [(node_class, m)] * len(self.executors))
+
+    # keys must be given in increasing order, shards defaults to the number of cores
+    @classmethod
+    def bulk_load(cls, m: int, keys: Iterable[int], fill_factor: float = 1.0, values: Iterable[Any] = None,
+                  node_class: Type[BaseNode] = Node, shards: int = None) -> ShardedBTree:
+        np = _numpy()
+        keys = np.asarray(keys if isinstance(keys, np.ndarray) else list(keys), dtype=np.int64)
+        shards = max(1, min(shards or os.cpu_count(), len(keys)))
+        tree = cls(m, keys[[len(keys) * i // shards for i in range(1, shards)]].tolist(), node_class)
+        values = None if values is None else list(values)
+        with _SharedBlock(keys) as block:
+            starts = np.searchsorted(keys, tree.bounds).tolist()
+            cuts = list(zip([0] + starts, starts + [len(keys)]))
+            tree._all(_bulk_load, [(node_class, m, fill_factor, block.name, start, stop,
+                                    None if values is None else values[start:stop]) for start, stop in cuts])
+        return tree
+
+    @property
+    def shards(self) -> int:
+        return len(self.executors)
+
+    def _shard(self, key) -> int:
+        return bisect.bisect_right(self.bounds, key)
+
+    def _run(self, shard: int, function, *args):
+        return self.executors[shard].submit(function, shard, *args).result()
+
+    # runs function on every shard with its arguments at once
+    def _all(self, function, arguments: List[tuple]) -> List[Any]:
+        futures: List[Future] = [executor.submit(function, shard, *args) for shard, (executor, args)
+                                 in enumerate(zip(self.executors, arguments))]
+        return [future.result() for future in futures]
+
+    # the keys stably reordered by shard and the start and stop of every shard in them
+    def _partition(self, keys) -> Tuple[Any, Any, List[Tuple[int, int]]]:
+        np = _numpy()
+        keys = np.asarray(keys if isinstance(keys, np.ndarray) else list(keys), dtype=np.int64)
+        shard_of = np.searchsorted(np.asarray(self.bounds, dtype=np.int64), keys, 'right')
+        order = np.argsort(shard_of, kind='stable')
+        stops = np.cumsum(np.bincount(shard_of, minlength=self.shards)).tolist()
+        return keys[order], order, list(zip([0] + stops[:-1], stops))
+
+    def get(self, key, default=None):
+        return self._run(self._shard(key), _call, 'get', key, default)
+
+    def __contains__(self, key) -> bool:
+        return self._run(self._shard(key), _call, '__contains__', key)
+
+    def __len__(self) -> int:
+        return sum(self._all(_call, [('__len__',)] * self.shards))
+
+    def insert(self, key, value=None):
+        self._run(self._shard(key), _update, 'insert', key, value)
+
+    def put(self, key, value):
+        self._run(self._shard(key), _update, 'put', key, value)
+
+    def delete(self, key):
+        self._run(self._shard(key), _call, 'delete', key)
+
+    def insert_many(self, keys: Iterable[int], values: Iterable[Any] = None):
+        keys, order, cuts = self._partition(keys)
+        if values is not None:
+            values = list(values)
+            values = [values[i] for i in order.tolist()]
+        with _SharedBlock(keys) as block:
+            self._all(_insert_many, [(block.name, start, stop, None if values is None else values[start:stop])
+                                     for start, stop in cuts])
+
+    def delete_many(self, keys: Iterable[int]) -> int:
+        keys, _, cuts = self._partition(keys)
+        with _SharedBlock(keys) as block:
+            return sum(self._all(_delete_many, [(block.name, start, stop) for start, stop in cuts]))
+
+    # the same as BaseNode.search_batch, with every shard searching its own probes
+    def search_batch(self, probes, values: bool = False, default=None):
+        np = _numpy()
+        ordered, order, cuts = self._partition(probes)
+        found = np.empty(len(ordered), dtype=bool)
+        with _SharedBlock(ordered) as probes_block, _SharedBlock(size=len(ordered)) as found_block:
+            results = self._all(_search_batch, [(probes_block.name, found_block.name, start, stop, values, default)
+                                                for start, stop in cuts])
+            found[order] = np.ndarray(len(ordered), bool, found_block.buf)
+        if not values:
+            return found
+        result = np.empty(len(ordered), dtype=object)
+        result[order] = [value for shard_values in results for value in shard_values]
+        return found, result
+
+    # yields the keys lo <= key < hi in key order, both bounds are optional; all
+    # shards in the range collect their keys at once, and they are copied out
+    # of the shared blocks before this returns, so no block outlives the call
+    def range(self, lo=None, hi=None) -> Iterator[int]:
+        first = 0 if lo is None else self._shard(lo)
+        last = self.shards - 1 if hi is None else self._shard(hi)
+        futures = [self.executors[shard].submit(_range, shard, lo, hi) for shard in range(first, last + 1)]
+        return iter(self._collect(futures))
+
+    @staticmethod
+    def _collect(futures: List[Future]) -> array:
+        keys = array('q')
+        pending = iter(futures)
+        try:
+            for future in pending:
+                name, count = future.result()
+                if count:
+                    with _SharedBlock(name=name) as block, block.buf[:8 * count] as view:
+                        keys.frombytes(view)
+        finally:
+            # after a failure the blocks of the shards not read yet are unlinked unread
+            for future in pending:
+                if future.exception() is None and future.result()[1]:
+                    with _SharedBlock(name=future.result()[0]):
+                        pass
+        return keys
+
+    # yields (key, value) with lo <= key < hi in key order, the pairs are pickled
+    def items(self, lo=None, hi=None) -> Iterator[Tuple[int, Any]]:
+        first = 0 if lo is None else self._shard(lo)
+        last = self.shards - 1 if hi is None else self._shard(hi)
+        futures = [self.executors[shard].submit(_items, shard, lo, hi) for shard in range(first, last + 1)]
+        return (item for future in futures for item in future.result())
+
+    def close(self):
+        for executor in self.executors:
+            executor.shutdown()
+        self.executors = []
+
+    def __enter__(self) -> ShardedBTree:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# A shared memory block the parent owns for the length of a with statement:
+# created with size bytes or a copy of an int64 array, or taken over by name
+# from a worker. It is unlinked on the way out.
+class _SharedBlock:
+    def __init__(self, data=None, size: int = 0, name: str = None):
+        if name is not None:
+            self.block = SharedMemory(name)
+        else:
+            # a block cannot be empty
+            self.block = SharedMemory(create=True, size=max(1, size, 0 if data is None else data.nbytes))
+            if data is not None and len(data):
+                with memoryview(data) as view, view.cast('B') as source:
+                    self.block.buf[:len(source)] = source
+        self.name = self.block.name
+        self.buf = self.block.buf
+
+    def __enter__(self) -> _SharedBlock:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.buf = None
+        self.block.close()
+        self.block.unlink()
@@ -0,0 +1,174 @@
+from __future__ import annotations
+import bisect
+import mmap
+import pickle
+import struct
+from array import array
+from typing import Any, Iterable, Iterator, List, Tuple
+
+from btree import NO_VALUE, VALUES_INT64, VALUES_NONE, VALUES_PICKLE, _little_endian, _native
+
+# magic, version, how the values are stored, block size, number of keys, size
+# of the values section. The keys and the levels above them follow bottom up as
+# int64 arrays, then the values as in Node.dump
+HEADER = struct.Struct('<4sBBxxIQQ4x')
+MAGIC = b'BTST'
+VERSION = 1
+
+
+# A read-only tree as flat arrays, one per level: the sorted keys are the
+# bottom level and every level above holds every block-th key of the level
+# below it, up to a top level of at most block keys. Node i of a level is the
+# run of block keys starting at i * block, and key i of a level is the first
+# key of node i of the level below. A search bisects the top level and then
+# one node per level, finding the next node by index arithmetic instead of a
+# pointer, so a level is a single contiguous array that can be read straight
+# from a mapped file and a lookup touches one node per level. The arrays are
+# int64, so are the keys: a tree of bytes or any other keys cannot be frozen.
+class StaticBTree:
+    def __init__(self, block: int, keys, levels: List, values=None, value_mode: int = None):
+        self.block = block
+        self.keys = keys
+        # the levels above the keys, top level first
+        self.levels = levels
+        self._levels = [(level, len(level)) for level in levels]
+        self.values = values
+        self.value_mode = value_mode
+        self._mmap = None
+
+    # the lengths of the levels above size keys, bottom up
+    @staticmethod
+    def _level_sizes(block: int, size: int) -> List[int]:
+        sizes = []
+        while size > block:
+            size = -(-size // block)
+            sizes.append(size)
+        return sizes
+
+    # items are (key, value) pairs in increasing int64 key order
+    @classmethod
+    def from_items(cls, items: Iterable[Tuple[int, Any]], block: int = 256) -> StaticBTree:
+        if block < 2:
+            raise ValueError("block must be at least 2, got %d" % block)
+        keys, values = array('q'), []
+        for key, value in items:
+            if not isinstance(key, int):
+                raise TypeError("StaticBTree keys are int64, got a key of type %s" % type(key).__name__)
+            if not -2 ** 63 <= key < 2 ** 63:
+                raise OverflowError("StaticBTree keys are int64, %d is out of range" % key)
+            if keys and not keys[-1] < key:
+                raise ValueError("keys must be strictly increasing, got %r after %r" % (key, keys[-1]))
+            keys.append(key)
+            values.append(value)
+        levels = [keys]
+        for _ in cls._level_sizes(block, len(keys)):
+            levels.append(levels[-1][::block])
+        return cls(block, keys, levels[:0:-1], values)
+
+    def _value(self, i: int):
+        if self.value_mode == VALUES_INT64:
+            value = self.values[i]
+            return None if value == NO_VALUE else value
+        return self.values[i] if self.values is not None else None
+
+    # returns key_found, position_of_the_first_key_not_below_it
+    def search(self, key) -> Tuple[bool, int]:
+        block = self.block
+        i = 0
+        for level, size in self._levels:
+            lo = i * block
+            hi = lo + block
+            i = bisect.bisect_right(level, key, lo, hi if hi < size else size) - 1
+            if i < 0:
+                i = 0
+        keys, size = self.keys, len(self.keys)
+        lo = i * block
+        hi = lo + block
+        i = bisect.bisect_left(keys, key, lo, hi if hi < size else size)
+        return i < size and keys[i] == key, i
+
+    def _position(self, key) -> int:
+        return self.search(key)[1]
+
+    def get(self, key, default=None):
+        found, i = self.search(key)
+        return self._value(i) if found else default
+
+    def __contains__(self, key) -> bool:
+        return self.search(key)[0]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.keys)
+
+    def __reversed__(self) -> Iterator[int]:
+        return reversed(self.keys)
+
+    # yields (key, value) with lo <= key < hi in key order, both bounds are optional
+    def items(self, lo=None, hi=None) -> Iterator[Tuple[int, Any]]:
+        start = 0 if lo is None else self._position(lo)
+        end = len(self.keys) if hi is None else self._position(hi)
+        return ((self.keys[i], self._value(i)) for i in range(start, max(start, end)))
+
+    def range(self, lo=None, hi=None) -> Iterator[int]:
+        start = 0 if lo is None else self._position(lo)
+        end = len(self.keys) if hi is None else self._position(hi)
+        return iter(self.keys[start:max(start, end)])
+
+    def save(self, path: str):
+        values = [self._value(i) for i in range(len(self.keys))]
+        if all(value is None for value in values):
+            mode, values = VALUES_NONE, b''
+        elif all(type(value) is int and NO_VALUE < value < 2 ** 63 or value is None for value in values):
+            mode, values = VALUES_INT64, _little_endian(array('q', [NO_VALUE if value is None else value
+                                                                    for value in values]))
+        else:
+            mode, values = VALUES_PICKLE, pickle.dumps(values, pickle.HIGHEST_PROTOCOL)
+        with open(path, 'wb') as fp:
+            fp.write(HEADER.pack(MAGIC, VERSION, mode, self.block, len(self.keys), len(values)))
+            fp.write(_little_endian(array('q', self.keys)))
+            for level in reversed(self.levels):
+                fp.write(_little_endian(array('q', level)))
+            fp.write(values)
+
+    # maps the file read-only, the keys are never copied into the process
+    @classmethod
+    def open(cls, path: str) -> StaticBTree:
+        with open(path, 'rb') as fp:
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        magic, version, mode, block, size, values_size = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            mapped.close()
+            raise ValueError("%s is not a static b-tree file" % path)
+        offset = HEADER.size
+        keys = _native(view[offset:offset + 8 * size].cast('q'))
+        offset += 8 * size
+        levels = []
+        for count in cls._level_sizes(block, size):
+            levels.append(_native(view[offset:offset + 8 * count].cast('q')))
+            offset += 8 * count
+        if mode == VALUES_INT64:
+            values = _native(view[offset:offset + values_size].cast('q'))
+        elif mode == VALUES_PICKLE:
+            values = pickle.loads(view[offset:offset + values_size])
+        else:
+            values = None
+        tree = cls(block, keys, levels[::-1], values, mode)
+        tree._mmap = mapped
+        return tree
+
+    def close(self):
+        if self._mmap is not None:
+            # the views into the map have to go before the map can be closed
+            self.keys = self.levels = self._levels = self.values = None
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self) -> StaticBTree:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
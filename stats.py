@@ -0,0 +1,185 @@
+from __future__ import annotations
+import threading
+import time
+from typing import Callable, Dict, Type
+
+from btree import BaseNode
+
+# the operations whose latency is recorded, only the outermost one of nested
+# calls is timed, e.g. the search inside an insert is not an extra operation
+TIMED_OPERATIONS = ('search', 'get', 'insert', 'put', 'delete', 'insert_many', 'delete_many')
+# the operations whose descent is a lookup, recorded in TreeStats.visits
+LOOKUPS = ('search', 'get')
+
+# the enabled TreeStats by node class
+_enabled: Dict[type, TreeStats] = {}
+
+
+# Latencies in power of two nanosecond buckets: bucket i counts the
+# latencies that are i bits long, i.e. below 2 ** i ns.
+class Histogram:
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * 64
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int):
+        self.buckets[min(value.bit_length(), 63)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    # an upper bound of the p-th percentile, 0 < p <= 100
+    def percentile(self, p: float) -> int:
+        rank = p / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(2 ** i, self.max)
+        return 0
+
+    def summary(self) -> dict:
+        return {'count': self.count, 'mean': self.total / self.count if self.count else 0,
+                'p50': self.percentile(50), 'p99': self.percentile(99), 'max': self.max}
+
+
+# Opt-in counters and latency histograms of a node class. enable() swaps
+# instrumented versions of the methods into the class and disable() takes them
+# out again, so a disabled TreeStats costs nothing at all. A subclass that
+# overrides one of the methods needs a TreeStats of its own. A class and its
+# bases and subclasses share their methods, so at most one of them can be
+# enabled at a time, otherwise a split would count once per class. Nested
+# calls are told apart per thread, the counters themselves are not
+# synchronized, share a class between threads only for rough numbers.
+class TreeStats:
+    def __init__(self):
+        self.reset()
+        self.node_class: Type[BaseNode] = None
+        self._saved: Dict[str, Callable] = {}
+        # the outermost timed operation running in each thread
+        self._local = threading.local()
+
+    def reset(self):
+        self.latencies: Dict[str, Histogram] = {name: Histogram() for name in TIMED_OPERATIONS}
+        # nodes on the path of every lookup, by search or get; the descents
+        # of the writes are not lookups
+        self.visits = Histogram()
+        self.splits = 0
+        self.root_splits = 0
+        self.merges = 0
+        self.rotations = 0
+        self.root_shrinks = 0
+
+    # the change of the tree height while enabled
+    @property
+    def height_change(self) -> int:
+        return self.root_splits - self.root_shrinks
+
+    # returns self, so that "with TreeStats().enable(Node) as stats:" disables it again
+    def enable(self, node_class: Type[BaseNode]) -> TreeStats:
+        if self.node_class is not None:
+            raise ValueError("already enabled for %s" % self.node_class.__name__)
+        for enabled in _enabled:
+            if issubclass(node_class, enabled) or issubclass(enabled, node_class):
+                raise ValueError("%s shares methods with %s, which is enabled" % (node_class.__name__,
+                                                                                    enabled.__name__))
+        _enabled[node_class] = self
+        self.node_class = node_class
+        methods = {name: getattr(node_class, name) for name in TIMED_OPERATIONS}
+        methods['search'] = self._counted_search(methods['search'])
+        wrappers = {name: self._timed(name, method) for name, method in methods.items()}
+        wrappers['_split_off'] = self._counted_split(node_class._split_off)
+        wrappers['rebalance'] = self._counted_rebalance(node_class.rebalance)
+        for name, wrapper in wrappers.items():
+            self._saved[name] = node_class.__dict__.get(name)
+            setattr(node_class, name, wrapper)
+        return self
+
+    def disable(self):
+        for name, original in self._saved.items():
+            if original is None:
+                delattr(self.node_class, name)
+            else:
+                setattr(self.node_class, name, original)
+        _enabled.pop(self.node_class, None)
+        self._saved = {}
+        self.node_class = None
+
+    def __enter__(self) -> TreeStats:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+
+    def _timed(self, name: str, method: Callable) -> Callable:
+        histogram = self.latencies[name]
+        clock = time.perf_counter_ns
+
+        def timed(node, *args, **kwargs):
+            local = self._local
+            if getattr(local, 'operation', None):
+                return method(node, *args, **kwargs)
+            local.operation = name
+            start = clock()
+            try:
+                return method(node, *args, **kwargs)
+            finally:
+                histogram.record(clock() - start)
+                local.operation = None
+        return timed
+
+    def _counted_search(self, method: Callable) -> Callable:
+        def search(node, search_key):
+            found, last = method(node, search_key)
+            if self._local.operation not in LOOKUPS:
+                return found, last
+            visits, above = 1, last
+            while above is not node:
+                above = above.parent
+                visits += 1
+            self.visits.record(visits)
+            return found, last
+        return search
+
+    def _counted_split(self, method: Callable) -> Callable:
+        def split_off(node):
+            if node._overfull():
+                self.splits += 1
+                if node.parent is None:
+                    self.root_splits += 1
+            return method(node)
+        return split_off
+
+    def _counted_rebalance(self, method: Callable) -> Callable:
+        def rebalance(node, *args):
+            if node.parent is None:
+                if not node.keys and node.children:
+                    self.root_shrinks += 1
+            elif len(node.keys) < node.m // 2:
+                left_sibling, right_sibling, _ = node._siblings()
+                sibling = left_sibling or right_sibling
+                missing = node.m // 2 - len(node.keys)
+                if len(sibling.keys) - missing >= node.m // 2:
+                    self.rotations += 1
+                else:
+                    self.merges += 1
+            return method(node, *args)
+        return rebalance
+
+    def report(self) -> dict:
+        return {
+            'splits': self.splits,
+            'root_splits': self.root_splits,
+            'merges': self.merges,
+            'rotations': self.rotations,
+            'root_shrinks': self.root_shrinks,
+            'height_change': self.height_change,
+            'visits_per_search': self.visits.summary(),
+            'latency_ns': {name: histogram.summary() for name, histogram in self.latencies.items()
+                           if histogram.count},
+        }
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import random
+import tempfile
+import threading
+from unittest import IsolatedAsyncioTestCase
+
+from asynctree import AsyncBTree
+from paged import PagedBTree
+from test_btree import assert_valid
+
+
+class TestAsyncBTree(IsolatedAsyncioTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "btree.db")
+        PagedBTree.bulk_load(self.path, 8, range(0, 10000, 2), values=range(0, 10000, 2)).close()
+
+    async def test_get_put_delete(self):
+        async with AsyncBTree.open(self.path, pool_pages=16) as btree:
+            assert await btree.get(1234) == 1234
+            assert await btree.get(1235, "missing") == "missing"
+            await btree.put(1235, -1235)
+            await btree.delete(1234)
+            await btree.insert_many([1, 3, 5])
+            assert await btree.delete_many([0, 2, 4]) == 3
+            assert await btree.contains(1235)
+            assert not await btree.contains(1234)
+        with PagedBTree(self.path) as btree:
+            assert btree.get(1235) == -1235
+            assert list(btree.range(0, 7)) == [1, 3, 5, 6]
+            assert_valid(btree.root)
+
+    async def test_pages_are_read_off_the_loop(self):
+        async with AsyncBTree.open(self.path) as btree:
+            threads = set()
+            read = btree.tree.file.read
+
+            def record(page_id):
+                threads.add(threading.current_thread())
+                return read(page_id)
+
+            btree.tree.file.read = record
+            await btree.get(4000)
+            assert threads and threading.main_thread() not in threads
+
+    async def test_concurrent_lookups_share_page_reads(self):
+        async with AsyncBTree.open(self.path) as btree:
+            values = await asyncio.gather(*[btree.get(4000) for _ in range(20)])
+            assert values == [4000] * 20
+            # one read per page on the path, however many lookups faulted on it
+            reads = btree.tree.file.reads
+            assert btree.faults > reads
+            assert reads <= assert_valid(btree.tree.root) + 1
+
+    def test_mixed_puts_and_gets_with_a_small_pool(self):
+        reference = dict((key, key) for key in range(0, 10000, 2))
+
+        async def worker(btree, seed):
+            rng = random.Random(seed)
+            for _ in range(300):
+                key = rng.randrange(10000)
+                if rng.random() < 0.3:
+                    await btree.put(key, -key)
+                    reference[key] = -key
+                else:
+                    assert await btree.get(key) == reference.get(key)
+
+        async def run():
+            async with AsyncBTree.open(self.path, pool_pages=6) as btree:
+                await asyncio.gather(*[worker(btree, seed) for seed in range(8)])
+
+        # a fault spinning on the loop would never return, so the loop runs in
+        # a thread of its own that the test can give up on
+        errors = []
+
+        def loop():
+            try:
+                asyncio.run(run())
+            except BaseException as error:
+                errors.append(error)
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        thread.join(60)
+        assert not thread.is_alive() and errors == []
+        with PagedBTree(self.path) as btree:
+            assert list(btree.items()) == sorted(reference.items())
+            assert_valid(btree.root)
+
+    async def test_async_for(self):
+        async with AsyncBTree.open(self.path, pool_pages=8) as btree:
+            keys = [key async for key in btree.range(100, 3000)]
+            assert keys == list(range(100, 3000, 2))
+            items = [item async for item in btree.items(hi=10)]
+            assert items == [(0, 0), (2, 2), (4, 4), (6, 6), (8, 8)]
@@ -0,0 +1,85 @@
+import os
+import random
+import tempfile
+from unittest import TestCase
+
+import pytest
+
+from bloom import BloomBTree, BloomFilter
+from btree import Node
+from keyed import KeyedBTree
+from paged import PagedBTree
+
+
+class TestBloomFilter(TestCase):
+    def test_no_false_negatives_and_rate(self):
+        bloom = BloomFilter(10000, 0.01)
+        for key in range(0, 20000, 2):
+            bloom.add(key)
+        assert all(key in bloom for key in range(0, 20000, 2))
+        false_positives = sum(key in bloom for key in range(1, 200000, 2))
+        assert false_positives < 100000 * 0.02
+
+    def test_bad_rate_should_throw(self):
+        with pytest.raises(ValueError):
+            BloomFilter(100, 1.5)
+
+
+class TestBloomBTree(TestCase):
+    def test_node_tree(self):
+        btree = BloomBTree(Node.bulk_load(8, range(0, 2000, 2), values=range(1000)), capacity=100)
+        assert btree.get(10) == 5
+        assert btree.rebuilds == 1 and btree.filter.capacity == 2000
+        misses = [key for key in range(1, 2000, 2) if key in btree]
+        assert misses == []
+        assert btree.saved > 900
+        assert btree.saved + btree.false_positives == 1000
+        for key in range(2001, 3000, 2):
+            btree.insert(key, -key)
+        assert btree.get(2001) == -2001 and 2003 in btree
+        assert btree.get(2002, "missing") == "missing"
+        assert list(btree.range(1996, 2004)) == [1996, 1998, 2001, 2003]
+
+    def test_deletes_rebuild_lazily(self):
+        btree = BloomBTree(Node.bulk_load(4, range(1000)), rebuild_ratio=0.1)
+        assert 5 in btree
+        btree.delete_many(range(0, 1000, 2))
+        assert btree.rebuilds == 1
+        assert 4 not in btree
+        assert btree.rebuilds == 2
+        saved = btree.saved
+        assert not any(key in btree for key in range(0, 1000, 2))
+        assert btree.saved - saved > 450
+
+    def test_paged_tree_saves_page_reads(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "btree.db")
+            PagedBTree.bulk_load(path, 32, range(0, 20000, 2)).close()
+            paged = PagedBTree(path, pool_pages=4)
+            btree = BloomBTree(paged)
+            assert 2 in btree
+            reads = paged.file.reads
+            assert not any(key in btree for key in random.Random(0).sample(range(1, 20000, 2), 500))
+            assert btree.saved > 480
+            # only the false positives descend, through at most 3 levels
+            assert paged.file.reads - reads <= 3 * btree.false_positives
+            btree.insert(3)
+            assert 3 in btree
+            paged.close()
+
+    def test_keyed_tree(self):
+        btree = BloomBTree(KeyedBTree(4))
+        btree.insert(("tenant", 1), "a")
+        assert btree.get(("tenant", 1)) == "a"
+        assert ("tenant", 2) not in btree
+
+    def test_keyed_tree_without_decode(self):
+        btree = BloomBTree(KeyedBTree(4, decode=None), capacity=4)
+        btree.insert_many([(1, key) for key in range(10)])
+        # past its capacity the filter is rebuilt from the keys in the tree
+        assert btree.get((1, 7), "missing") is None
+        assert btree.rebuilds == 1
+        assert (1, 7) in btree and (1, 10) not in btree
+        btree.delete((1, 7))
+        btree.put((2, 0), "b")
+        assert (1, 7) not in btree and btree.get((2, 0)) == "b"
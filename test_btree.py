@@ -2,7 +2,11 @@ from unittest import TestCase
 
 import pytest as pytest
 
-from btree import Node
+import io
+import random
+from array import array
+
+from btree import BPlusNode, CompactNode, Node
 import jsonpickle
 
 
@@ -15,6 +19,55 @@ def is_equal(btree_one: Node, btree_two: Node):
             raise Exception("nodes have not the same size of children")
 
 
+def in_order(btree: Node):
+    if btree.is_leaf:
+        return list(btree.keys)
+    keys = []
+    for i, child in enumerate(btree.children):
+        keys += in_order(child)
+        if i < len(btree.keys):
+            keys.append(btree.keys[i])
+    return keys
+
+
+def leaves(btree: Node):
+    if btree.is_leaf:
+        return [btree]
+    return [leaf for child in btree.children for leaf in leaves(child)]
+
+
+# checks the b-tree invariants and returns the depth of the leaves
+# minimum relaxes the m // 2 keys every node but the root needs, e.g. for
+# split policies that leave thinner nodes behind
+def assert_valid(btree: Node, lower=None, upper=None, is_root=True, minimum: int = None) -> int:
+    assert list(btree.keys) == sorted(set(btree.keys))
+    assert len(btree.values) == len(btree.keys)
+    if not is_root:
+        assert (btree.m // 2 if minimum is None else minimum) <= len(btree.keys) <= btree.m
+    # a B+-tree leaf starts with a copy of the separator on its left
+    bplus = isinstance(btree, BPlusNode)
+    assert all((lower is None or lower < key or bplus and lower == key) and (upper is None or key < upper)
+               for key in btree.keys)
+    if bplus and is_root:
+        chain = [leaves(btree)[0]]
+        while chain[-1].next:
+            chain.append(chain[-1].next)
+        assert chain == leaves(btree)
+    if btree.is_leaf:
+        assert btree.children == []
+        return 0
+    assert len(btree.children) == len(btree.keys) + 1
+    depths = set()
+    for i, child in enumerate(btree.children):
+        assert child.parent is btree
+        depths.add(assert_valid(child,
+                                btree.keys[i - 1] if i > 0 else lower,
+                                btree.keys[i] if i < len(btree.keys) else upper,
+                                False, minimum))
+    assert len(depths) == 1
+    return depths.pop() + 1
+
+
 class TestNode(TestCase):
     # insert 4 into empty tree
     # => [4, 5]
@@ -223,6 +276,17 @@ class TestNode(TestCase):
 
         is_equal(btree, btree_from_json)
 
+    # written before nodes held values, the test suite does not rewrite it
+    def test_desirialize_before_values(self):
+        btree = jsonpickle.decode(open("data/btree_before_values.json", "r").read())
+        assert list(btree.items()) == [(key, None) for key in range(1, 10)]
+        assert btree.get(5) is None and 5 in btree
+        btree = btree.insert(10, "ten")
+        btree.delete(5)
+        assert btree.get(10) == "ten"
+        assert [key for key, _ in btree.items()] == [1, 2, 3, 4, 6, 7, 8, 9, 10]
+        assert_valid(btree)
+
     # insert 10,9,8,7.6.5.4
     # =>    [7]
     #     /    \
@@ -514,5 +578,363 @@ class TestNode(TestCase):
         assert btree.children[1].keys == [8]
         assert btree.children[2].keys == [10]
 
-
+    def test_search_matches_inserted_keys(self):
+        for m in [2, 3, 4, 7, 32]:
+            btree = Node(m, [], is_leaf=True)
+            for key in range(0, 400, 2):
+                btree = btree.insert(key)
+            for key in range(-1, 402):
+                success, node = btree.search(key)
+                assert success == (key % 2 == 0 and 0 <= key < 400)
+                if success:
+                    assert key in node.keys
+                else:
+                    assert node.is_leaf
+
+    def test_bulk_load(self):
+        for m in [2, 3, 4, 5, 16]:
+            for size in [0, 1, 2, m, m + 1, 50, 333]:
+                for fill_factor in [0.5, 0.75, 1.0]:
+                    btree = Node.bulk_load(m, range(size), fill_factor)
+                    assert_valid(btree)
+                    assert in_order(btree) == list(range(size))
+
+    def test_bulk_load_fill_factor(self):
+        full = leaves(Node.bulk_load(10, range(1000)))
+        half = leaves(Node.bulk_load(10, range(1000), fill_factor=0.5))
+        assert all(len(leaf.keys) >= 9 for leaf in full)
+        assert all(len(leaf.keys) <= 6 for leaf in half)
+        assert len(full) < len(half)
+
+    def test_bulk_load_then_insert(self):
+        btree = Node.bulk_load(4, iter(range(0, 100, 2)))
+        for key in range(1, 100, 2):
+            btree = btree.insert(key)
+        assert_valid(btree)
+        assert in_order(btree) == list(range(100))
+
+    def test_bulk_load_unsorted_should_throw(self):
+        with pytest.raises(ValueError):
+            Node.bulk_load(4, [1, 3, 2])
+        with pytest.raises(ValueError):
+            Node.bulk_load(4, [1, 2, 2])
+
+    def test_bulk_load_values_count_should_match(self):
+        for node_class in (Node, BPlusNode):
+            with pytest.raises(ValueError):
+                node_class.bulk_load(4, range(100), values=range(50))
+            with pytest.raises(ValueError):
+                node_class.bulk_load(4, range(10), values=iter(range(11)))
+            btree = node_class.bulk_load(4, iter(range(10)), values=iter(range(10, 20)))
+            assert btree.get(9) == 19
+
+    def test_insert_many_values_count_should_match(self):
+        btree = Node(4, [], is_leaf=True)
+        with pytest.raises(ValueError):
+            btree.insert_many([1, 2, 3], [9])
+        with pytest.raises(ValueError):
+            btree.insert_many(iter([1, 2]), iter([9, 8, 7]))
+        assert len(btree.keys) == 0
+        btree = btree.insert_many(iter([1, 2, 1]), iter([9, 8, 7]))
+        assert list(btree.items()) == [(1, 7), (2, 8)]
+
+    def test_insert_many(self):
+        for m in [2, 3, 4, 9]:
+            btree = Node(m, [], is_leaf=True)
+            btree = btree.insert_many(range(0, 300, 3))
+            btree = btree.insert_many([299, 5, 4, 3, 3, 150, 1000])
+            assert_valid(btree)
+            assert in_order(btree) == sorted(set(range(0, 300, 3)) | {299, 5, 4, 150, 1000})
+
+    # insert 1..9 as one batch into a leaf with m=4
+    # => the leaf is split once into two full nodes
+    #        [5]
+    #      /     \
+    # [1,2,3,4] [6,7,8,9]
+    def test_insert_many_splits_once(self):
+        btree = Node(4, [], is_leaf=True).insert_many(range(1, 10))
+        assert btree.keys == [5]
+        assert len(btree.children) == 2
+        assert btree.children[0].keys == [1, 2, 3, 4]
+        assert btree.children[1].keys == [6, 7, 8, 9]
+
+    def test_delete_many(self):
+        for m in [2, 3, 4, 9]:
+            btree = Node.bulk_load(m, range(300))
+            deleted = btree.delete_many(list(range(0, 300, 2)) + [1000])
+            assert deleted == 150
+            assert_valid(btree)
+            assert in_order(btree) == list(range(1, 300, 2))
+            btree.delete_many(range(300))
+            assert btree.keys == []
+            assert btree.is_leaf
+
+    def test_delete_many_rebalances_internal_nodes_once(self):
+        rng = random.Random(6)
+        keys = range(0, 40000, 2)
+        for node_class in (Node, CompactNode, BPlusNode):
+            for m in (8, 16):
+                rebalanced = []
+
+                class Counting(node_class):
+                    def rebalance(self, deferred=None):
+                        if not self.is_leaf and self.parent and len(self.keys) < self.m // 2:
+                            rebalanced.append(self)
+                        super().rebalance(deferred)
+
+                btree = Counting.bulk_load(m, keys)
+                removed = set(rng.sample(keys, 15000))
+                assert btree.delete_many(sorted(removed) + [1, 3]) == 15000
+                assert_valid(btree)
+                assert list(btree.range()) == sorted(set(keys) - removed)
+                assert rebalanced and len(set(map(id, rebalanced))) == len(rebalanced)
+
+    def test_delete_root_leaf(self):
+        btree = Node(4, [1, 2, 3], is_leaf=True)
+        btree.delete(2)
+        assert btree.keys == [1, 3]
+
+    def test_delete_internal_key_takes_predecessor_of_its_own_subtree(self):
+        btree = Node.bulk_load(2, range(1, 12))
+        for key in [9, 7, 3]:
+            btree.delete(key)
+            assert_valid(btree)
+        assert in_order(btree) == [1, 2, 4, 5, 6, 8, 10, 11]
+
+    def test_put_get(self):
+        btree = Node(2, [], is_leaf=True)
+        for key in range(20):
+            btree = btree.put(key, "v%d" % key)
+        btree = btree.put(7, "seven")
+        assert btree.get(7) == "seven"
+        assert btree.get(12) == "v12"
+        assert btree.get(20) is None
+        assert btree.get(20, "missing") == "missing"
+
+    def test_values_follow_keys(self):
+        btree = Node.bulk_load(3, range(40), values=[key * 10 for key in range(40)])
+        btree = btree.insert_many(range(40, 60), [key * 10 for key in range(40, 60)])
+        btree.delete_many(range(0, 60, 3))
+        for key in [13, 25, 31]:
+            btree.delete(key)
+        assert_valid(btree)
+        assert all(value == key * 10 for key, value in btree.items())
+        assert [key for key, _ in btree.items()] == in_order(btree)
+
+    def test_items(self):
+        btree = Node(4, [], is_leaf=True)
+        for key in [5, 3, 9, 1, 7]:
+            btree = btree.insert(key, -key)
+        assert list(btree.items()) == [(1, -1), (3, -3), (5, -5), (7, -7), (9, -9)]
+
+    def test_range(self):
+        btree = Node.bulk_load(3, range(0, 100, 2))
+        assert list(btree.range(10, 20)) == [10, 12, 14, 16, 18]
+        assert list(btree.range(11, 21)) == [12, 14, 16, 18, 20]
+        assert list(btree.range(95)) == [96, 98]
+        assert list(btree.range(hi=5)) == [0, 2, 4]
+        assert list(btree.range(50, 50)) == []
+        assert list(btree.items(6, 9)) == [(6, None), (8, None)]
+
+    def test_iteration(self):
+        for cls in (Node, CompactNode):
+            btree = cls(2, [], is_leaf=True)
+            assert list(btree) == [] and len(btree) == 0 and btree
+            keys = random.Random(3).sample(range(5000), 2000)
+            for key in keys:
+                btree = btree.insert(key)
+            for key in keys[:500]:
+                btree.delete(key)
+            assert list(btree) == sorted(keys[500:])
+            assert list(reversed(btree)) == sorted(keys[500:], reverse=True)
+            assert len(btree) == 1500
+            assert keys[600] in btree and keys[400] not in btree
+            assert list(btree.children[0]) == list(btree.range(hi=btree.keys[0]))
+
+    def test_iteration_is_not_recursive(self):
+        btree = Node.bulk_load(2, range(50000))
+        assert sum(1 for _ in btree) == len(btree) == 50000
+
+    def test_dump_load(self):
+        btree = Node(4, [], is_leaf=True)
+        for key in range(1, 10):
+            btree = btree.insert(key)
+        fp = io.BytesIO()
+        btree.dump(fp)
+        fp.seek(0)
+        loaded = Node.load(fp)
+        is_equal(btree, loaded)
+        assert_valid(loaded)
+
+    def test_dump_load_values(self):
+        for values in ([key * 2 if key % 3 else None for key in range(100)], [str(key) for key in range(100)]):
+            btree = Node.bulk_load(5, range(100), values=values)
+            fp = io.BytesIO()
+            btree.dump(fp)
+            fp.seek(0)
+            assert list(Node.load(fp).items()) == list(zip(range(100), values))
+
+    def test_dump_load_compressed(self):
+        btree = Node.bulk_load(64, range(-500, 10000, 3))
+        raw, packed = io.BytesIO(), io.BytesIO()
+        btree.dump(raw)
+        btree.dump(packed, compress=True)
+        assert len(packed.getvalue()) < len(raw.getvalue()) / 3
+        packed.seek(0)
+        loaded = Node.load(packed)
+        is_equal(btree, loaded)
+        assert_valid(loaded)
+
+    def test_load_other_format_should_throw(self):
+        with pytest.raises(ValueError):
+            Node.load(io.BytesIO(open("data/btree_test.json", "rb").read()))
+
+
+class TestSearchBatch(TestCase):
+    def test_matches_search(self):
+        np = pytest.importorskip("numpy")
+        rng = random.Random(4)
+        for cls in (Node, BPlusNode, CompactNode):
+            for m in (2, 3, 16):
+                btree = cls.bulk_load(m, range(0, 3000, 3), values=range(0, 6000, 6))
+                btree = btree.insert_many(range(1, 3000, 9), range(1, 3000, 9))
+                btree.delete_many(range(0, 3000, 12))
+                probes = [rng.randrange(-10, 3010) for _ in range(2000)] + [3, 3, 3]
+                found, values = btree.search_batch(np.array(probes), values=True, default=-1)
+                assert found.tolist() == [btree.search(probe)[0] for probe in probes]
+                assert values.tolist() == [btree.get(probe, -1) for probe in probes]
+
+    def test_empty(self):
+        np = pytest.importorskip("numpy")
+        assert Node(4, [], is_leaf=True).search_batch(np.array([1, 2])).tolist() == [False, False]
+        assert len(Node.bulk_load(4, range(10)).search_batch(np.array([], dtype=np.int64))) == 0
+
+
+class TestBPlusNode(TestCase):
+    # insert 4,5,6 with m=2
+    # => [5]
+    #   /   \
+    # [4] -> [5, 6]
+    def test_insert_split_copies_key_up(self):
+        btree = BPlusNode(2, [4, 5], None, None, True)
+        btree = btree.insert(6)
+        assert btree.keys == [5]
+        assert btree.children[0].keys == [4]
+        assert btree.children[1].keys == [5, 6]
+        assert btree.children[0].next is btree.children[1]
+        assert btree.children[1].next is None
+
+    def test_search_finds_keys_in_leaves(self):
+        btree = BPlusNode(3, [], is_leaf=True)
+        for key in range(50):
+            btree = btree.put(key, key * 2)
+        assert_valid(btree)
+        for key in range(50):
+            success, node = btree.search(key)
+            assert success
+            assert node.is_leaf
+            assert btree.get(key) == key * 2
+        assert not btree.search(50)[0]
+
+    def test_range(self):
+        btree = BPlusNode.bulk_load(4, range(0, 1000, 3), values=range(0, 1000, 3))
+        assert_valid(btree)
+        assert list(btree.range(10, 30)) == [12, 15, 18, 21, 24, 27]
+        assert list(btree.range(990)) == [990, 993, 996, 999]
+        assert list(btree.range()) == list(range(0, 1000, 3))
+        assert list(btree.items(3, 7)) == [(3, 3), (6, 6)]
+
+    def test_iteration_skips_copied_keys(self):
+        btree = BPlusNode.bulk_load(3, range(0, 600, 2))
+        btree = btree.insert_many(range(1, 600, 4))
+        btree.delete_many(range(0, 600, 6))
+        keys = list(btree.range())
+        assert list(btree) == keys
+        assert list(reversed(btree)) == keys[::-1]
+        assert len(btree) == len(keys)
+        assert 2 in btree and 6 not in btree
+
+    #     [3, 5]
+    #   /   |    \
+    # [1,2] [3,4] [5,6]
+    # delete 3, 4 => borrow 2 from the left leaf
+    #     [2, 5]
+    #   /   |   \
+    # [1]  [2]  [5,6]
+    def test_delete_borrows_from_left_leaf(self):
+        btree = BPlusNode.bulk_load(2, range(1, 7))
+        assert btree.keys == [3, 5]
+        btree.delete(3)
+        btree.delete(4)
+        assert btree.keys == [2, 5]
+        assert [leaf.keys for leaf in leaves(btree)] == [[1], [2], [5, 6]]
+        assert_valid(btree)
+
+    def test_delete_merges_leaves(self):
+        btree = BPlusNode.bulk_load(4, range(1, 11))
+        btree.delete_many([1, 2, 3, 7, 8, 9, 10])
+        assert_valid(btree)
+        assert list(btree.range()) == [4, 5, 6]
+        btree.delete_many([4, 5, 6])
+        assert btree.is_leaf
+        assert btree.keys == []
+
+    def test_batches(self):
+        btree = BPlusNode(5, [], is_leaf=True)
+        btree = btree.insert_many(range(0, 500, 2))
+        btree = btree.insert_many(range(1, 500, 2))
+        assert btree.delete_many(range(100, 400)) == 300
+        assert_valid(btree)
+        assert list(btree.range()) == list(range(100)) + list(range(400, 500))
+
+    def test_dump_load_links_leaves(self):
+        btree = BPlusNode.bulk_load(4, range(500), values=range(500))
+        fp = io.BytesIO()
+        btree.dump(fp)
+        fp.seek(0)
+        loaded = BPlusNode.load(fp)
+        assert_valid(loaded)
+        assert list(loaded.items(100, 300)) == list(btree.items(100, 300))
+        fp.seek(0)
+        with pytest.raises(ValueError):
+            Node.load(fp)
+
+
+class TestCompactNode(TestCase):
+    def test_has_no_dict(self):
+        btree = CompactNode(4, [1, 2], is_leaf=True)
+        assert not hasattr(btree, "__dict__")
+        assert isinstance(btree.keys, array)
+
+    def test_operations_keep_typed_keys(self):
+        def nodes(btree):
+            return [btree] + [node for child in btree.children for node in nodes(child)]
+
+        btree = CompactNode(3, [], is_leaf=True)
+        for key in range(0, 200, 2):
+            btree = btree.insert(key)
+        btree = btree.insert_many(range(1, 200, 2), range(1, 200, 2))
+        btree.delete_many(range(0, 200, 3))
+        for key in [1, 5, 7, 101]:
+            btree.delete(key)
+        assert_valid(btree)
+        assert list(btree.range()) == [key for key in range(200) if key % 3 and key not in (1, 5, 7, 101)]
+        assert btree.get(11) == 11
+        assert all(isinstance(node.keys, array) for node in nodes(btree))
+
+    def test_bulk_load(self):
+        btree = CompactNode.bulk_load(8, range(1000), values=range(1000))
+        assert_valid(btree)
+        assert in_order(btree) == list(range(1000))
+        assert btree.get(500) == 500
+
+    def test_dump_load(self):
+        btree = CompactNode.bulk_load(8, range(1000))
+        fp = io.BytesIO()
+        btree.dump(fp)
+        fp.seek(0)
+        loaded = CompactNode.load(fp)
+        assert_valid(loaded)
+        assert isinstance(loaded.keys, array)
+        assert in_order(loaded) == list(range(1000))
 
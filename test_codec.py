@@ -0,0 +1,57 @@
+import bisect
+import random
+from unittest import TestCase
+
+import pytest
+
+from codec import BytesBlock, IntBlock
+
+
+class TestIntBlock(TestCase):
+    def test_round_trip(self):
+        keys = [-2 ** 63, -5, 0, 1, 1000, 2 ** 40, 2 ** 63 - 1]
+        assert IntBlock(IntBlock.encode(keys, 2)).decode() == keys
+        assert IntBlock(IntBlock.encode([])).decode() == []
+
+    def test_close_keys_take_a_byte(self):
+        keys = list(range(10 ** 6, 10 ** 6 + 1600))
+        assert len(IntBlock.encode(keys)) < 1600 * 1.5
+
+    def test_search_matches_bisect(self):
+        rng = random.Random(0)
+        keys = sorted(rng.sample(range(100000), 1000))
+        block = IntBlock(IntBlock.encode(keys))
+        assert len(block) == 1000
+        for probe in keys[::7] + [rng.randrange(-10, 100010) for _ in range(500)]:
+            assert block.search(probe) == (probe in keys, bisect.bisect_left(keys, probe))
+        assert keys[10] in block
+
+    def test_unsorted_should_throw(self):
+        with pytest.raises(ValueError):
+            IntBlock.encode([1, 3, 2])
+
+    def test_encoded_size(self):
+        rng = random.Random(1)
+        for keys in ([], [0], list(range(100)), sorted({rng.randrange(-2 ** 63, 2 ** 63) for _ in range(300)})):
+            for interval in (1, 16):
+                assert IntBlock.encoded_size(keys, interval) == len(IntBlock.encode(keys, interval))
+
+    def test_sequence(self):
+        keys = list(range(0, 1000, 7))
+        block = IntBlock(IntBlock.encode(keys, 4))
+        assert [block[i] for i in range(len(keys))] == keys
+        assert block[-1] == keys[-1] and block[10:20] == keys[10:20] and list(reversed(block)) == keys[::-1]
+        assert bisect.bisect_left(block, 500) == bisect.bisect_left(keys, 500)
+        with pytest.raises(IndexError):
+            block[len(keys)]
+
+
+class TestBytesBlock(TestCase):
+    def test_round_trip_and_search(self):
+        keys = sorted({b"tenant-%03d/%06d" % (tenant, ts) for tenant in range(20) for ts in range(0, 5000, 97)})
+        data = BytesBlock.encode(keys, 8)
+        assert len(data) < sum(map(len, keys)) // 2
+        block = BytesBlock(data)
+        assert block.decode() == keys
+        for probe in keys[::13] + [b"", b"tenant-", b"tenant-005", b"tenant-019/999999", b"u"]:
+            assert block.search(probe) == (probe in keys, bisect.bisect_left(keys, probe))
@@ -0,0 +1,64 @@
+import bisect
+import io
+import random
+from unittest import TestCase
+
+import pytest
+
+from counted import CountedNode
+from test_btree import assert_valid
+
+
+def assert_counted(node: CountedNode) -> int:
+    assert node.size == len(node.keys) + sum(assert_counted(child) for child in node.children)
+    return node.size
+
+
+class TestCountedNode(TestCase):
+    def test_counts_follow_changes(self):
+        rng = random.Random(0)
+        for m in [2, 3, 4, 7]:
+            btree = CountedNode(m, [], is_leaf=True)
+            reference = set()
+            for _ in range(1500):
+                key = rng.randrange(400)
+                if key not in reference and rng.random() < 0.6:
+                    btree = btree.insert(key)
+                    reference.add(key)
+                elif key in reference:
+                    btree.delete(key)
+                    reference.discard(key)
+                assert_counted(btree)
+            assert btree.size == len(reference)
+            assert_valid(btree)
+
+    def test_batches(self):
+        btree = CountedNode.bulk_load(5, range(0, 1000, 2))
+        assert_counted(btree)
+        btree = btree.insert_many(range(500, 1500))
+        assert_counted(btree)
+        assert btree.delete_many(range(0, 2000, 3)) == 417
+        assert_counted(btree)
+        assert btree.size == len(list(btree.range()))
+
+    def test_rank_select_count(self):
+        keys = sorted(random.Random(1).sample(range(10 ** 6), 3000))
+        btree = CountedNode.bulk_load(8, keys)
+        for probe in keys[::97] + [-1, 10 ** 6, 123457]:
+            assert btree.rank(probe) == bisect.bisect_left(keys, probe)
+        for i in range(0, 3000, 89):
+            assert btree.select(i) == keys[i]
+        assert btree.select(-1) == keys[-1]
+        assert btree.count() == 3000
+        assert btree.count(keys[100], keys[2000]) == 1900
+        assert btree.count(500, 400) == 0
+        with pytest.raises(IndexError):
+            btree.select(3000)
+
+    def test_load_counts(self):
+        fp = io.BytesIO()
+        CountedNode.bulk_load(4, range(300)).dump(fp)
+        fp.seek(0)
+        btree = CountedNode.load(fp)
+        assert_counted(btree)
+        assert btree.select(150) == 150
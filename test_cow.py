@@ -0,0 +1,102 @@
+import gc
+import random
+import threading
+import weakref
+from unittest import TestCase
+
+import pytest
+
+from cow import CowBTree
+
+
+def assert_valid(node, m, lower=None, upper=None, is_root=True) -> int:
+    assert list(node.keys) == sorted(set(node.keys))
+    assert len(node.values) == len(node.keys)
+    if not is_root:
+        assert m // 2 <= len(node.keys) <= m
+    assert all((lower is None or lower < key) and (upper is None or key < upper) for key in node.keys)
+    if node.is_leaf:
+        return 0
+    assert len(node.children) == len(node.keys) + 1
+    depths = {assert_valid(child, m, node.keys[i - 1] if i > 0 else lower,
+                           node.keys[i] if i < len(node.keys) else upper, False)
+              for i, child in enumerate(node.children)}
+    assert len(depths) == 1
+    return depths.pop() + 1
+
+
+class TestCowBTree(TestCase):
+    def test_insert_delete(self):
+        btree = CowBTree(3)
+        for key in range(100):
+            btree.put(key, -key)
+        for key in range(0, 100, 3):
+            btree.delete(key)
+        btree.insert(1, "ignored")
+        assert_valid(btree.root, 3)
+        assert list(btree.items()) == [(key, -key) for key in range(100) if key % 3]
+        assert list(btree.range(10, 15)) == [10, 11, 13, 14]
+        assert btree.get(4) == -4
+        assert 3 not in btree
+        with pytest.raises(Exception):
+            btree.delete(3)
+
+    def test_snapshot_does_not_change(self):
+        btree = CowBTree.bulk_load(4, range(100))
+        snapshot = btree.snapshot()
+        for key in range(0, 100, 2):
+            btree.delete(key)
+        btree.put(1, "one")
+        btree.insert(1000)
+        assert list(snapshot.range()) == list(range(100))
+        assert snapshot.get(1) is None
+        assert list(btree.range()) == list(range(1, 100, 2)) + [1000]
+
+    def test_writes_copy_only_their_path(self):
+        btree = CowBTree.bulk_load(4, range(1000))
+        before = btree.root
+        btree.put(500, "x")
+        shared = set(map(id, before.children)) & set(map(id, btree.root.children))
+        assert len(shared) == len(before.children) - 1
+
+    def test_old_versions_are_freed(self):
+        btree = CowBTree.bulk_load(4, range(100))
+        snapshot = btree.snapshot()
+        leaf = snapshot.root
+        while not leaf.is_leaf:
+            leaf = leaf.children[0]
+        old_leaf = weakref.ref(leaf)
+        del leaf
+        btree.delete(0)
+        gc.collect()
+        assert old_leaf() is not None
+        del snapshot
+        assert old_leaf() is None
+
+    def test_readers_see_consistent_snapshots(self):
+        btree = CowBTree.bulk_load(5, range(0, 2000, 2))
+        errors = []
+
+        def write():
+            rng = random.Random(0)
+            for _ in range(2000):
+                key = rng.randrange(2000)
+                if key in btree:
+                    btree.delete(key)
+                else:
+                    btree.insert(key)
+
+        def read():
+            for _ in range(50):
+                snapshot = btree.snapshot()
+                keys = list(snapshot.range())
+                if keys != sorted(keys) or any(key not in snapshot for key in keys[::50]):
+                    errors.append(keys)
+
+        threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors
+        assert_valid(btree.root, 5)
@@ -0,0 +1,75 @@
+import io
+import random
+from unittest import TestCase
+
+import pytest
+
+from btree import BPlusNode
+from codec import decode_key, encode_key
+from keyed import KeyedBTree
+from test_btree import assert_valid
+
+
+class TestKeyEncoding(TestCase):
+    def test_order_is_preserved(self):
+        keys = [-2 ** 80, -2 ** 64, -256, -255, -1, 0, 1, 255, 256, 2 ** 64, 2 ** 80]
+        assert sorted(keys, key=encode_key) == keys
+        strings = ["", "\x00", "\x00\x00", "a", "a\x00", "ab", "é", "中", "\U0001f600"]
+        assert sorted(strings, key=encode_key) == sorted(strings)
+        tuples = [(), (1,), (1, b""), (1, b"\x00"), (1, b"a"), (1, b"a", 0), (1, b"b"), (2,), (2, (0, "x"))]
+        assert sorted(tuples, key=encode_key) == tuples
+
+    def test_round_trip(self):
+        for key in [0, -1, 2 ** 100, -2 ** 100, b"\x00\xff\x00", "z\x00é", (7, ("a", b"\x00"), ()), ()]:
+            assert decode_key(encode_key(key)) == key
+
+    def test_unsupported_type_should_throw(self):
+        with pytest.raises(TypeError):
+            encode_key(1.5)
+
+
+class TestKeyedBTree(TestCase):
+    def test_composite_keys(self):
+        rng = random.Random(0)
+        keys = [(tenant, timestamp) for tenant in range(10) for timestamp in range(0, 1000, 7)]
+        btree = KeyedBTree(5)
+        for key in rng.sample(keys, len(keys)):
+            btree.insert(key, key[1])
+        assert_valid(btree.root)
+        assert list(btree.range()) == keys
+        assert btree.get((3, 14)) == 14
+        assert (3, 15) not in btree
+        assert list(btree.range((4,), (5,))) == [key for key in keys if key[0] == 4]
+        for key in keys[::2]:
+            btree.delete(key)
+        assert_valid(btree.root)
+        assert list(btree.range()) == keys[1::2]
+
+    def test_bytes_and_str_keys(self):
+        words = sorted({"%x" % (i * 7919 % 10007) for i in range(2000)})
+        btree = KeyedBTree.bulk_load(8, words, values=range(len(words)), node_class=BPlusNode)
+        btree.put(words[3], -1)
+        assert btree.get(words[3]) == -1
+        assert list(btree.range(words[10], words[20])) == words[10:20]
+        raw = KeyedBTree(4)
+        raw.insert_many([b"b\x00", b"a", b"b", b"\x00"])
+        assert list(raw.range()) == [b"\x00", b"a", b"b", b"b\x00"]
+        assert raw.delete_many([b"a", b"c"]) == 1
+
+    def test_encoding_hook(self):
+        btree = KeyedBTree(4, encode=lambda key: key.lower().encode(), decode=None)
+        btree.insert("B")
+        btree.insert("a")
+        assert "b" in btree
+        assert list(btree.range()) == [b"a", b"b"]
+
+    def test_dump_load(self):
+        keys = [("tenant-0001", i) for i in range(500)]
+        btree = KeyedBTree.bulk_load(16, keys)
+        fp = io.BytesIO()
+        btree.dump(fp)
+        assert len(fp.getvalue()) < sum(map(len, map(encode_key, keys))) / 2
+        fp.seek(0)
+        loaded = KeyedBTree.load(fp)
+        assert_valid(loaded.root)
+        assert list(loaded.range()) == keys
@@ -0,0 +1,86 @@
+import random
+import threading
+from unittest import TestCase
+
+import pytest
+
+from latching import ConcurrentBTree, RWLatch
+from test_btree import assert_valid
+
+
+class TestRWLatch(TestCase):
+    def test_readers_share_writers_exclude(self):
+        latch = RWLatch()
+        latch.acquire_read()
+        latch.acquire_read()
+        acquired = threading.Event()
+
+        def write():
+            latch.acquire_write()
+            acquired.set()
+            latch.release_write()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        assert not acquired.wait(0.05)
+        latch.release_read()
+        latch.release_read()
+        writer.join()
+        assert acquired.is_set()
+
+
+class TestConcurrentBTree(TestCase):
+    def test_single_thread(self):
+        btree = ConcurrentBTree(3)
+        for key in range(100):
+            btree.put(key, -key)
+        for key in range(0, 100, 3):
+            btree.delete(key)
+        btree.insert(1, "ignored")
+        assert_valid(btree.root)
+        assert btree.items() == [(key, -key) for key in range(100) if key % 3]
+        assert btree.range(10, 20) == [10, 11, 13, 14, 16, 17, 19]
+        assert btree.get(4) == -4
+        assert 3 not in btree
+        with pytest.raises(Exception):
+            btree.delete(3)
+
+    def test_threads(self):
+        btree = ConcurrentBTree.bulk_load(4, range(0, 4000, 2))
+        errors = []
+
+        def write(seed):
+            try:
+                rng = random.Random(seed)
+                own = list(range(10000 + seed * 1000, 10000 + seed * 1000 + 500))
+                for key in own:
+                    btree.put(key, seed)
+                rng.shuffle(own)
+                for key in own[:300]:
+                    btree.delete(key)
+                for key in range(seed * 2, 4000, 16):
+                    btree.delete(key)
+            except Exception as error:
+                errors.append(error)
+
+        def read(seed):
+            try:
+                rng = random.Random(seed)
+                for _ in range(2000):
+                    key = rng.randrange(0, 4000, 2)
+                    assert btree.get(key, "deleted") in (None, "deleted")
+                keys = btree.range(1000, 2000)
+                assert keys == sorted(keys)
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=write, args=(seed,)) for seed in range(8)]
+        threads += [threading.Thread(target=read, args=(seed,)) for seed in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors
+        assert_valid(btree.root)
+        assert len(btree.range(10000)) == 8 * 200
+        assert btree.range(hi=4000) == []
@@ -0,0 +1,227 @@
+import os
+import random
+import tempfile
+from unittest import TestCase
+
+import pytest
+
+from codec import IntBlock
+from paged import PagedBTree, max_order
+from test_btree import assert_valid
+
+
+# checks order, parent links and leaf depth like assert_valid, but compressed
+# pages split by size, so only the encoded page has a bound, not the key
+# count. Returns the number of levels
+def assert_fits(node, lower=None, upper=None) -> int:
+    keys = list(node.keys)
+    assert keys == sorted(set(keys)) and len(node.values) == len(keys) <= node.m
+    assert all((lower is None or lower < key) and (upper is None or key < upper) for key in keys)
+    assert len(node.store.encode(node)) <= node.store.file.page_size
+    if node.is_leaf:
+        return 1
+    assert len(node.children) == len(keys) + 1
+    depths = set()
+    for i, child in enumerate(node.children):
+        assert child.parent is node
+        depths.add(assert_fits(child, keys[i - 1] if i else lower, keys[i] if i < len(keys) else upper))
+    assert len(depths) == 1
+    return depths.pop() + 1
+
+
+class TestPagedBTree(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "btree.db")
+
+    def test_reopen_keeps_keys_and_values(self):
+        with PagedBTree(self.path, m=4) as btree:
+            for key in range(100):
+                btree.put(key, key * 10)
+            btree.delete(50)
+        with PagedBTree(self.path) as btree:
+            assert btree.m == 4
+            assert list(btree.items()) == [(key, key * 10) for key in range(100) if key != 50]
+            assert_valid(btree.root)
+
+    def test_open_reads_header_only_and_lookup_reads_one_page_per_level(self):
+        PagedBTree.bulk_load(self.path, 8, range(10000)).close()
+        btree = PagedBTree(self.path)
+        assert btree.file.reads == 0
+        assert 1234 in btree
+        depth = assert_valid(btree.root)
+        btree.close()
+        btree = PagedBTree(self.path)
+        btree.get(4321)
+        assert btree.file.reads == depth
+        btree.close()
+
+    def test_freed_pages_are_reused(self):
+        with PagedBTree(self.path, m=4) as btree:
+            btree.insert_many(range(1000))
+            btree.delete_many(range(1000))
+        with PagedBTree(self.path) as btree:
+            page_count = btree.file.page_count
+            btree.insert_many(range(1000))
+            assert btree.file.page_count == page_count
+
+    def test_random_operations(self):
+        rng = random.Random(0)
+        reference = {}
+        for _ in range(5):
+            with PagedBTree(self.path, m=6) as btree:
+                for _ in range(300):
+                    key = rng.randrange(500)
+                    if key in reference and rng.random() < 0.4:
+                        btree.delete(key)
+                        del reference[key]
+                    else:
+                        btree.put(key, -key)
+                        reference[key] = -key
+                assert list(btree.items()) == sorted(reference.items())
+        with PagedBTree(self.path) as btree:
+            assert list(btree.items()) == sorted(reference.items())
+            assert_valid(btree.root)
+
+    def test_order_has_to_fit_the_page(self):
+        with pytest.raises(ValueError):
+            PagedBTree(self.path, m=max_order(4096) + 1)
+
+    def test_values_are_int64(self):
+        with PagedBTree(self.path, m=4) as btree:
+            btree.put(1, None)
+            btree.put(2, -2 ** 62)
+        with PagedBTree(self.path) as btree:
+            assert list(btree.items()) == [(1, None), (2, -2 ** 62)]
+
+    def test_rejected_entries_leave_the_file_readable(self):
+        with PagedBTree(self.path, m=4) as btree:
+            btree.insert_many(range(20))
+            with pytest.raises(TypeError):
+                btree.put(3, 'three')
+            with pytest.raises(TypeError):
+                btree.insert('x')
+            with pytest.raises(OverflowError):
+                btree.insert(2 ** 63)
+            with pytest.raises(OverflowError):
+                btree.insert_many([30, 31], [1, -2 ** 64])
+            with pytest.raises(ValueError):
+                btree.put(4, -2 ** 63)
+        with PagedBTree(self.path) as btree:
+            assert list(btree.items()) == [(key, None) for key in range(20)]
+            assert_valid(btree.root)
+
+    def test_new_file_opens_without_flush(self):
+        btree = PagedBTree(self.path, m=4)
+        btree.file.close()
+        with PagedBTree(self.path) as btree:
+            assert btree.m == 4 and list(btree.range()) == []
+
+    def test_compressed_pages_hold_more_keys(self):
+        # clustered keys, small deltas compress to a byte or two each
+        keys = [key * 3 for key in range(20000)]
+        raw = PagedBTree.bulk_load(self.path, max_order(4096), keys)
+        raw_pages, raw_levels = raw.file.page_count, assert_fits(raw.root)
+        raw.close()
+        os.remove(self.path)
+        with PagedBTree.bulk_load(self.path, max_order(4096, True), keys, compress=True) as btree:
+            assert list(btree.range()) == keys
+            assert btree.file.page_count < raw_pages and assert_fits(btree.root) <= raw_levels
+        with PagedBTree(self.path) as btree:
+            assert btree.file.compress
+            assert btree.get(3000) is None and 3001 not in btree
+            assert isinstance(btree.root.keys, IntBlock)
+        with pytest.raises(ValueError):
+            PagedBTree(self.path, compress=False)
+
+    def test_compressed_lookup_searches_the_block(self):
+        PagedBTree.bulk_load(self.path, 64, range(0, 40000, 2), values=range(20000), compress=True).close()
+        with PagedBTree(self.path) as btree:
+            assert btree.get(12346) == 6173 and btree.get(12347, -1) == -1
+            levels = assert_fits(btree.root)
+        with PagedBTree(self.path) as btree:
+            assert btree.get(4322) == 2161
+            assert btree.file.reads == levels
+            found, node = btree.search(4322)
+            assert found and isinstance(node.keys, IntBlock)
+
+    def test_compressed_random_operations(self):
+        rng = random.Random(4)
+        reference = {}
+        for round in range(4):
+            with PagedBTree(self.path, m=max_order(1024, True), page_size=1024, compress=True) as btree:
+                # random 64-bit keys barely compress, clustered ones do
+                for _ in range(1500):
+                    key = rng.randrange(-2 ** 63, 2 ** 63) if round % 2 else rng.randrange(5000)
+                    if reference and rng.random() < 0.3:
+                        key = rng.choice(sorted(reference))
+                        btree.delete(key)
+                        del reference[key]
+                    else:
+                        btree.put(key, key // 2)
+                        reference[key] = key // 2
+                removed = rng.sample(sorted(reference), len(reference) // 3)
+                assert btree.delete_many(removed) == len(removed)
+                for key in removed:
+                    del reference[key]
+                btree.insert_many(range(10000, 12000), range(2000))
+                reference.update(zip(range(10000, 12000), range(2000)))
+                assert list(btree.items()) == sorted(reference.items())
+        with PagedBTree(self.path) as btree:
+            assert list(btree.items()) == sorted(reference.items())
+            assert_fits(btree.root)
+
+
+class TestBufferPool(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "btree.db")
+        PagedBTree.bulk_load(self.path, 8, range(10000)).close()
+
+    def test_resident_pages_stay_within_budget(self):
+        with PagedBTree(self.path, pool_pages=16) as btree:
+            assert list(btree.range()) == list(range(10000))
+            assert len(btree.store.resident) <= 16
+            assert btree.store.evictions > 0
+
+    def test_bulk_load_streams_through_the_pool(self):
+        path = self.path + ".bulk"
+        with PagedBTree.bulk_load(path, 8, range(20000), values=range(0, -20000, -1), pool_pages=16) as btree:
+            assert len(btree.store.resident) <= 16
+            assert btree.store.evictions > 1000
+        with PagedBTree(path) as btree:
+            assert list(btree.items()) == [(key, -key) for key in range(20000)]
+            assert_valid(btree.root)
+        with pytest.raises(TypeError):
+            PagedBTree.bulk_load(path + "2", 8, [1, 2, 3], values=[1, 'two', 3])
+        assert not os.path.exists(path + "2")
+
+    def test_repeated_lookups_hit(self):
+        with PagedBTree(self.path, pool_pages=16) as btree:
+            btree.get(1234)
+            misses = btree.store.misses
+            hits = btree.store.hits
+            btree.get(1234)
+            assert btree.store.misses == misses
+            assert btree.store.hits > hits
+
+    def test_dirty_pages_are_written_back_on_eviction(self):
+        with PagedBTree(self.path, pool_pages=8) as btree:
+            for key in range(0, 10000, 7):
+                btree.put(key, -key)
+            assert len(btree.store.resident) <= 8
+        with PagedBTree(self.path) as btree:
+            assert list(btree.items()) == [(key, -key if key % 7 == 0 else None) for key in range(10000)]
+            assert_valid(btree.root)
+
+    def test_pinned_pages_are_not_evicted(self):
+        with PagedBTree(self.path, pool_pages=4) as btree:
+            leaf = btree.search(0)[1]
+            btree.store.pin(leaf)
+            list(btree.range())
+            assert btree.store.resident[leaf.page_id] is leaf
+            btree.store.unpin(leaf)
+            list(btree.range())
+            assert leaf.page_id not in btree.store.resident
@@ -0,0 +1,66 @@
+import os
+import random
+from unittest import TestCase
+
+import pytest
+
+from btree import BPlusNode, Node
+from sharded import ShardedBTree
+
+
+class TestShardedBTree(TestCase):
+    def test_single_key_operations(self):
+        with ShardedBTree(4, [100, 200]) as tree:
+            assert tree.shards == 3
+            for key in (150, 5, 250, 100, 199, 200):
+                tree.insert(key, str(key))
+            tree.put(5, "five")
+            assert len(tree) == 6
+            assert tree.get(5) == "five" and tree.get(100) == "100" and tree.get(6, "missing") == "missing"
+            assert 199 in tree and 198 not in tree
+            tree.delete(100)
+            assert list(tree.range()) == [5, 150, 199, 200, 250]
+            assert list(tree.items(150, 201)) == [(150, "150"), (199, "199"), (200, "200")]
+            assert list(tree.range(300)) == [] and list(tree.range(None, 5)) == []
+
+    def test_batches_match_a_single_tree(self):
+        np = pytest.importorskip("numpy")
+        rng = random.Random(3)
+        keys = sorted(rng.sample(range(-10 ** 6, 10 ** 6), 5000))
+        for node_class in (Node, BPlusNode):
+            reference = node_class.bulk_load(8, keys, values=[key * 2 for key in keys])
+            with ShardedBTree.bulk_load(8, keys, values=[key * 2 for key in keys], node_class=node_class,
+                                        shards=3) as tree:
+                assert tree.shards == 3 and len(tree) == 5000
+                assert tree.bounds == sorted(tree.bounds) and keys[0] < tree.bounds[0]
+                probes = np.array(keys[::7] + [rng.randrange(-10 ** 6, 10 ** 6) for _ in range(2000)])
+                found, values = tree.search_batch(probes, values=True, default=-1)
+                expected_found, expected_values = reference.search_batch(probes, values=True, default=-1)
+                assert (found == expected_found).all()
+                assert list(values) == list(expected_values)
+
+                added = [key for key in rng.sample(range(-10 ** 6, 10 ** 6), 3000) if key not in reference]
+                tree.insert_many(added, [-key for key in added])
+                reference = reference.insert_many(added, [-key for key in added])
+                removed = keys[::3] + [10 ** 7]
+                assert tree.delete_many(removed) == reference.delete_many(removed) == len(keys[::3])
+                assert list(tree.range()) == list(reference.range())
+                assert list(tree.range(-1000, 400000)) == list(reference.range(-1000, 400000))
+                assert list(tree.items(0, 10000)) == list(reference.items(0, 10000))
+
+    def test_range_leaves_no_shared_blocks(self):
+        if not os.path.isdir("/dev/shm"):
+            pytest.skip("shared memory blocks are not listed in /dev/shm here")
+        before = set(os.listdir("/dev/shm"))
+        with ShardedBTree(4, [100, 200]) as tree:
+            for key in range(0, 300, 3):
+                tree.insert(key)
+            # dropped unread and abandoned after the first key
+            tree.range()
+            assert next(tree.range(50)) == 51
+            assert list(tree.range(90, 210)) == list(range(90, 210, 3))
+        assert set(os.listdir("/dev/shm")) <= before
+
+    def test_bad_bounds(self):
+        with pytest.raises(ValueError):
+            ShardedBTree(4, [10, 10])
@@ -0,0 +1,61 @@
+import bisect
+import os
+import random
+import tempfile
+from unittest import TestCase
+
+import pytest
+
+from btree import BPlusNode, Node
+from static import StaticBTree
+
+
+class TestStaticBTree(TestCase):
+    def test_search_matches_bisect(self):
+        rng = random.Random(0)
+        for block in (2, 3, 5, 128):
+            for size in (0, 1, 5, 6, 36, 37, 2000):
+                keys = sorted(rng.sample(range(-10 ** 6, 10 ** 6), size))
+                static = StaticBTree.from_items(((key, None) for key in keys), block)
+                for probe in keys[::3] + [rng.randrange(-10 ** 6 - 2, 10 ** 6 + 2) for _ in range(200)]:
+                    i = bisect.bisect_left(keys, probe)
+                    assert static.search(probe) == (i < size and keys[i] == probe, i)
+                assert list(static) == keys
+
+    def test_freeze(self):
+        btree = BPlusNode.bulk_load(4, range(0, 1000, 2), values=[str(key) for key in range(0, 1000, 2)])
+        static = btree.freeze(8)
+        assert len(static) == 500
+        assert static.get(10) == "10" and static.get(11, "missing") == "missing"
+        assert 998 in static and 999 not in static
+        assert list(static.range(10, 20)) == [10, 12, 14, 16, 18]
+        assert list(static.items(995)) == [(996, "996"), (998, "998")]
+        assert list(reversed(static))[:2] == [998, 996]
+        assert list(static.range(20, 10)) == []
+
+    def test_largest_key(self):
+        static = StaticBTree.from_items([(1, None), (2, None), (2 ** 63 - 1, None)], 2)
+        assert 2 ** 63 - 1 in static
+
+    def test_save_open(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "static.bin")
+            for values in (None, range(0, 3000, 3), ["x"] * 1000):
+                btree = Node.bulk_load(16, range(0, 3000, 3), values=values)
+                btree.freeze(16).save(path)
+                with StaticBTree.open(path) as static:
+                    assert list(static.items()) == list(btree.items())
+                    assert static.get(300) == btree.get(300)
+                    assert static.get(301) is None
+
+    def test_keys_are_int64(self):
+        with pytest.raises(TypeError):
+            Node.bulk_load(4, [b"a", b"b", b"c"]).freeze()
+        with pytest.raises(TypeError):
+            StaticBTree.from_items([(1, None), (2.5, None)])
+        with pytest.raises(OverflowError):
+            StaticBTree.from_items([(1, None), (2 ** 63, None)])
+
+    def test_unsorted_should_throw(self):
+        with pytest.raises(ValueError):
+            StaticBTree.from_items([(2, None), (1, None)])
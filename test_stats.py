@@ -0,0 +1,96 @@
+import threading
+from unittest import TestCase
+
+import pytest
+
+from btree import BaseNode, BPlusNode, Node
+from stats import Histogram, TreeStats
+from test_btree import assert_valid
+from tuning import fill_report
+
+
+class TestHistogram(TestCase):
+    def test_percentiles(self):
+        histogram = Histogram()
+        for value in [1, 2, 3, 100, 1000]:
+            histogram.record(value)
+        assert histogram.count == 5
+        assert histogram.percentile(50) == 4
+        assert histogram.percentile(100) == 1000
+        assert histogram.summary()['mean'] == 1106 / 5
+
+
+class TestTreeStats(TestCase):
+    def test_counts_structure_changes(self):
+        with TreeStats().enable(Node) as stats:
+            btree = Node(2, [], is_leaf=True)
+            for key in range(100):
+                btree = btree.insert(key)
+            assert stats.splits > 0
+            assert stats.root_splits > 1
+            for key in range(100):
+                btree.delete(key)
+            assert stats.merges > 0 and stats.rotations > 0
+            assert stats.root_shrinks == stats.root_splits
+            assert stats.height_change == 0
+            report = stats.report()
+        assert report['latency_ns']['insert']['count'] == 100
+        assert report['latency_ns']['delete']['count'] == 100
+        # the searches inside insert and delete are neither operations nor lookups
+        assert 'search' not in report['latency_ns']
+        assert report['visits_per_search']['count'] == 0
+
+    def test_visits(self):
+        btree = Node.bulk_load(4, range(1000))
+        depth = assert_valid(btree)
+        with TreeStats().enable(Node) as stats:
+            assert btree.search(10 ** 6) == (False, btree.search(10 ** 6)[1])
+            assert stats.visits.max == depth + 1
+            btree.get(500)
+            btree.insert(5000)
+            btree.put(7, 'seven')
+            assert stats.visits.count == 3
+
+    def test_related_classes_are_not_enabled_twice(self):
+        with TreeStats().enable(Node):
+            with pytest.raises(ValueError):
+                TreeStats().enable(BPlusNode)
+            with pytest.raises(ValueError):
+                TreeStats().enable(BaseNode)
+        with TreeStats().enable(BPlusNode) as stats:
+            with pytest.raises(ValueError):
+                TreeStats().enable(Node)
+            btree = BPlusNode(4, [], is_leaf=True)
+            for key in range(100):
+                btree = btree.insert(key)
+        # internal splits go through BaseNode._split_off and count once; every
+        # split adds a node, a root split also the new root
+        assert fill_report(btree)['nodes'] == 1 + stats.splits + stats.root_splits
+
+    def test_threads_time_their_own_operations(self):
+        btree = Node.bulk_load(8, range(0, 20000, 2))
+        with TreeStats().enable(Node) as stats:
+            def run(start):
+                for key in range(start, 20000, 4):
+                    btree.search(key)
+            threads = [threading.Thread(target=run, args=(start,)) for start in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        # the counters are not synchronized, but no thread skips a call as nested
+        assert stats.latencies['search'].count > 15000 and stats.visits.count > 15000
+
+    def test_disable_restores_methods(self):
+        stats = TreeStats().enable(BPlusNode)
+        assert 'insert' in BPlusNode.__dict__
+        with pytest.raises(ValueError):
+            stats.enable(Node)
+        btree = BPlusNode.bulk_load(3, range(50))
+        btree.insert_many(range(50, 100))
+        assert stats.latencies['insert_many'].count == 1
+        stats.disable()
+        assert 'insert' not in BPlusNode.__dict__
+        assert BPlusNode.__dict__['search'] is not None
+        assert 'visits' not in repr(BPlusNode.search)
+        assert list(btree.range()) == list(range(100))
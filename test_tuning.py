@@ -0,0 +1,135 @@
+import random
+from unittest import TestCase
+
+import pytest
+
+from btree import BPlusNode, CompactNode, Node
+from paged import max_order
+from stats import TreeStats
+from test_btree import assert_valid
+from tuning import EvenSplit, RightBiasedSplit, TreeConfig, fill_report, is_rightmost, order_for, with_split_policy
+
+
+# checks order, parent links and leaf depth; nodes below m // 2 are allowed
+# only where the appends happen, on the right edge of the tree
+def assert_appended(node, depth=0, lower=None) -> int:
+    assert list(node.keys) == sorted(set(node.keys))
+    assert all(lower is None or lower <= key for key in node.keys)
+    if node.parent is not None and len(node.keys) < node.m // 2:
+        assert is_rightmost(node)
+    if node.is_leaf:
+        return depth
+    assert len(node.children) == len(node.keys) + 1
+    depths = set()
+    for i, child in enumerate(node.children):
+        assert child.parent is node
+        depths.add(assert_appended(child, depth + 1, node.keys[i - 1] if i else lower))
+    assert len(depths) == 1
+    return depths.pop()
+
+
+# the nodes of the right edge, from the root down
+def right_edge(node) -> list:
+    edge = [node]
+    while not edge[-1].is_leaf:
+        edge.append(edge[-1].children[-1])
+    return edge
+
+
+class TestTuning(TestCase):
+    def test_order_for(self):
+        assert order_for(4096) == 170
+        assert order_for(64 * 1024, key_size=16) == 2048
+        assert order_for(16) == 4
+        assert TreeConfig(node_bytes=4096).m == 170 >= max_order(4096)
+        assert TreeConfig(m=32).m == 32
+
+    def test_right_biased_appends_fill_the_leaves(self):
+        for node_class in (Node, CompactNode, BPlusNode):
+            fills = {}
+            for policy in (None, EvenSplit(), RightBiasedSplit(0.9)):
+                config = TreeConfig(16, node_class=node_class, split_policy=policy)
+                btree = config.new()
+                for key in range(3000):
+                    btree = btree.insert(key, -key)
+                assert_appended(btree)
+                assert list(btree.range()) == list(range(3000))
+                assert btree.get(1234) == -1234
+                fills[repr(policy)] = fill_report(btree)['leaf_fill']
+            assert fills['None'] == fills['EvenSplit()'] < 0.6
+            assert fills['RightBiasedSplit(0.9)'] > 0.85
+
+    def test_right_biased_random_inserts_and_deletes(self):
+        rng = random.Random(5)
+        for node_class in (Node, BPlusNode):
+            btree = TreeConfig(8, node_class=node_class, split_policy=RightBiasedSplit()).new()
+            reference = set()
+            # appends with some random inserts, then random deletes
+            for key in list(range(0, 4000, 2)) + rng.sample(range(1, 4000, 2), 500):
+                btree = btree.insert(key)
+                reference.add(key)
+            btree = btree.insert_many(range(4000, 6000))
+            reference.update(range(4000, 6000))
+            assert_appended(btree)
+            for key in rng.sample(sorted(reference), 3000):
+                btree.delete(key)
+                reference.remove(key)
+            assert list(btree.range()) == sorted(reference)
+            assert all(key in btree for key in reference)
+
+    def test_right_biased_load_then_deletes(self):
+        rng = random.Random(8)
+        for node_class in (Node, CompactNode, BPlusNode):
+            config = TreeConfig(8, node_class=node_class, split_policy=RightBiasedSplit(0.9))
+            with TreeStats().enable(config.node_class) as stats:
+                btree = config.new()
+                for key in range(0, 6066, 2):
+                    btree = btree.insert(key, -key)
+                reference = set(range(0, 6066, 2))
+                # the last append split the right edge, which is left with a single key
+                assert_valid(btree, minimum=1)
+                assert min(len(node.keys) for node in right_edge(btree)[1:]) == 1
+                # deletes in the middle, then the thin nodes on the right edge
+                for key in rng.sample(range(0, 5000, 2), 800):
+                    btree.delete(key)
+                    reference.remove(key)
+                assert_valid(btree, minimum=1)
+                assert_appended(btree)
+                removed = [key for key in range(5000, 6066, 2) if rng.random() < 0.7]
+                assert btree.delete_many(removed) == len(removed)
+                reference.difference_update(removed)
+                for key in sorted(reference)[-20:]:
+                    btree.delete(key)
+                    reference.remove(key)
+                assert_valid(btree, minimum=1)
+                assert_appended(btree)
+                assert list(btree.range()) == sorted(reference)
+                assert all(btree.get(key) == -key for key in list(reference)[::50])
+                assert stats.merges > 0 and stats.rotations > 0
+
+    def test_fewer_splits(self):
+        splits = {}
+        for policy in (None, RightBiasedSplit(0.9)):
+            node_class = with_split_policy(Node, policy)
+            with TreeStats().enable(node_class) as stats:
+                btree = node_class(32, [], is_leaf=True)
+                for key in range(5000):
+                    btree = btree.insert(key)
+                splits[policy is None] = stats.splits
+        assert splits[False] < 0.6 * splits[True]
+
+    def test_fill_report(self):
+        report = fill_report(Node.bulk_load(10, range(1000)))
+        assert report['m'] == 10 and report['leaf_fill'] == 1.0
+        assert sum(level['keys'] for level in report['levels']) == 1000
+        assert report['levels'][0]['nodes'] == 1 and report['height'] == len(report['levels'])
+        half = fill_report(TreeConfig(10, fill_factor=0.5).bulk_load(range(1000)))
+        assert half['leaf_fill'] == pytest.approx(0.5, abs=0.05) and half['nodes'] > report['nodes']
+
+    def test_with_split_policy(self):
+        policy = RightBiasedSplit(0.8)
+        node_class = with_split_policy(BPlusNode, policy)
+        assert with_split_policy(BPlusNode, policy) is node_class and issubclass(node_class, BPlusNode)
+        assert with_split_policy(BPlusNode, None) is BPlusNode and BPlusNode.split_policy is None
+        with pytest.raises(ValueError):
+            RightBiasedSplit(0.3)
@@ -0,0 +1,132 @@
+import os
+import tempfile
+import threading
+from unittest import TestCase
+
+import pytest
+
+from btree import BPlusNode
+from wal import INSERT, LoggedBTree
+
+
+class TestLoggedBTree(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_recover_replays_the_log(self):
+        with LoggedBTree(self.directory, m=4) as btree:
+            for key in range(100):
+                btree.put(key, key * 2)
+            btree.delete_many(range(0, 100, 3))
+            btree.insert_many([1000, 1001], ["a", "b"])
+        btree = LoggedBTree(self.directory)
+        expected = [(key, key * 2) for key in range(100) if key % 3] + [(1000, "a"), (1001, "b")]
+        assert btree.items() == expected
+
+    def test_uncommitted_changes_are_lost_in_a_crash(self):
+        btree = LoggedBTree(self.directory, group_size=1000)
+        btree.put(1, 1)
+        btree.commit()
+        btree.put(2, 2)
+        # no close: the second put never left the process
+        recovered = LoggedBTree(self.directory)
+        assert recovered.items() == [(1, 1)]
+
+    def test_full_groups_are_synced_together(self):
+        with LoggedBTree(self.directory, group_size=10) as btree:
+            for key in range(95):
+                btree.insert(key)
+            assert btree.wal.syncs == 9
+        assert LoggedBTree(self.directory).items() == [(key, None) for key in range(95)]
+
+    def test_torn_tail_is_ignored(self):
+        with LoggedBTree(self.directory) as btree:
+            btree.put(1, "one")
+        with open(os.path.join(self.directory, "wal"), "ab") as fp:
+            fp.write(b"\x07\x00\x00half a record")
+        with LoggedBTree(self.directory) as btree:
+            assert btree.items() == [(1, "one")]
+            btree.put(2, "two")
+        assert LoggedBTree(self.directory).items() == [(1, "one"), (2, "two")]
+
+    def test_checkpoint_truncates_the_log(self):
+        with LoggedBTree(self.directory, m=3, node_class=BPlusNode) as btree:
+            btree.insert_many(range(50))
+            btree.checkpoint()
+            assert os.path.getsize(os.path.join(self.directory, "wal")) == 0
+            btree.delete(10)
+        btree = LoggedBTree(self.directory, node_class=BPlusNode)
+        assert btree.recover() == 1
+        assert btree.items() == [(key, None) for key in range(50) if key != 10]
+
+    def test_keys_other_than_int64(self):
+        with LoggedBTree(self.directory, m=3) as btree:
+            btree.insert_many([b"b", b"a\x00", b"c"], [1, 2, 3])
+            btree.put(b"d", "four")
+            btree.delete(b"b")
+            btree.delete_many([b"c", b"missing"])
+            btree.checkpoint()
+            btree.insert(b"e")
+        btree = LoggedBTree(self.directory)
+        assert btree.recover() == 1
+        assert btree.items() == [(b"a\x00", 2), (b"d", "four"), (b"e", None)]
+        btree.close()
+
+        tuples, ints = os.path.join(self.directory, "tuples"), os.path.join(self.directory, "ints")
+        with LoggedBTree(tuples) as btree:
+            btree.put(("tenant", 7), 1)
+            btree.put(("tenant", 10), 2)
+            # a key codec cannot encode is refused before anything is logged
+            with pytest.raises(TypeError):
+                btree.insert_many([("tenant", 8), ("tenant", 1.5)])
+            assert btree.wal.lsn == 2
+        with LoggedBTree(ints) as btree:
+            btree.put(2 ** 70, "large")
+            btree.put(-3, "small")
+        assert LoggedBTree(tuples).items() == [(("tenant", 7), 1), (("tenant", 10), 2)]
+        assert LoggedBTree(ints).items() == [(-3, "small"), (2 ** 70, "large")]
+
+    def test_rejected_changes_are_not_logged(self):
+        with LoggedBTree(self.directory) as btree:
+            btree.insert_many(range(10))
+            with pytest.raises(TypeError):
+                btree.insert("x", 1)
+            with pytest.raises(TypeError):
+                btree.put("y", 2)
+            with pytest.raises(TypeError):
+                btree.insert_many(["z"])
+            assert btree.wal.lsn == 10
+            btree.commit()
+        btree = LoggedBTree(self.directory)
+        assert btree.items() == [(key, None) for key in range(10)]
+        btree.close()
+
+    def test_recover_skips_records_the_tree_refuses(self):
+        with LoggedBTree(self.directory) as btree:
+            btree.insert_many(range(3))
+            # as a log written before changes were applied first could hold
+            btree.wal.append(INSERT, "x", 1)
+            btree.insert(3)
+        btree = LoggedBTree(self.directory)
+        assert btree.skipped == 1
+        assert btree.items() == [(key, None) for key in range(4)]
+        btree.close()
+
+    def test_concurrent_commits_share_fsyncs(self):
+        btree = LoggedBTree(self.directory, group_size=1000)
+
+        def write(start):
+            for key in range(start, start + 50):
+                btree.put(key, key)
+                btree.commit()
+
+        threads = [threading.Thread(target=write, args=(start,)) for start in range(0, 400, 50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        btree.close()
+        assert btree.wal.syncs <= 400
+        assert LoggedBTree(self.directory).items() == [(key, key) for key in range(400)]
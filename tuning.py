@@ -0,0 +1,108 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Tuple, Type
+
+from btree import BaseNode, Node
+
+
+# m for nodes of about node_bytes: every key comes with a value and a child
+# reference, 8 bytes each, like in a page of paged.py
+def order_for(node_bytes: int, key_size: int = 8, value_size: int = 8, child_size: int = 8) -> int:
+    return max(4, node_bytes // (key_size + value_size + child_size))
+
+
+# True if node is the last one of its level, where a tree growing by appends
+# splits. Only the keys are compared, so no child is loaded or even looked up.
+def is_rightmost(node: BaseNode) -> bool:
+    while node.parent is not None:
+        if node.keys and node.parent.keys and node.keys[0] < node.parent.keys[-1]:
+            return False
+        node = node.parent
+    return True
+
+
+# Splits evenly, as a node class without a split_policy does.
+class EvenSplit:
+    def __call__(self, node: BaseNode, total: int, lo: int, hi: int) -> List[int]:
+        return node._group_sizes(total, lo, hi, hi)
+
+    def __repr__(self) -> str:
+        return "EvenSplit()"
+
+
+# Splits the last node of a level so that the left part keeps fraction of hi
+# and the new right node only the rest, instead of cutting it in half. Under
+# appends the left nodes are never touched again, so they stay that full and
+# every split leaves one fuller node behind; the right node may start out
+# below m // 2 until the appends fill it. Other nodes split evenly, random
+# inserts would otherwise keep splitting the left parts again.
+class RightBiasedSplit:
+    def __init__(self, fraction: float = 0.9):
+        if not 0.5 <= fraction <= 1:
+            raise ValueError("fraction must be between 0.5 and 1, got %r" % fraction)
+        self.fraction = fraction
+
+    def __call__(self, node: BaseNode, total: int, lo: int, hi: int) -> List[int]:
+        if not is_rightmost(node):
+            return node._group_sizes(total, lo, hi, hi)
+        # the last group needs at least 2, one key and for b-trees the separator
+        full = max(lo, min(hi - 1, round(hi * self.fraction)))
+        groups = (total - 2) // full
+        return [full] * groups + [total - full * groups]
+
+    def __repr__(self) -> str:
+        return "RightBiasedSplit(%r)" % self.fraction
+
+
+_policy_classes: Dict[Tuple[type, Any], type] = {}
+
+
+# node_class with split_policy, one subclass per pair. The subclasses are made
+# on the fly, so pickle cannot find them by name.
+def with_split_policy(node_class: Type[BaseNode], policy) -> Type[BaseNode]:
+    if policy is None or node_class.split_policy is policy:
+        return node_class
+    key = (node_class, policy)
+    if key not in _policy_classes:
+        _policy_classes[key] = type(node_class.__name__, (node_class,), {'__slots__': (), 'split_policy': policy})
+    return _policy_classes[key]
+
+
+# The settings of a tree in one place: m, given or chosen for nodes of about
+# node_bytes, the node class, the split policy and the bulk load fill factor.
+# new() and bulk_load() make roots that keep using them, since the nodes
+# carry m and their class splits by the policy.
+class TreeConfig:
+    def __init__(self, m: int = None, node_bytes: int = 4096, key_size: int = 8,
+                 node_class: Type[BaseNode] = Node, split_policy=None, fill_factor: float = 1.0):
+        self.m = m or order_for(node_bytes, key_size)
+        self.split_policy = split_policy
+        self.node_class = with_split_policy(node_class, split_policy)
+        self.fill_factor = fill_factor
+
+    def new(self) -> BaseNode:
+        return self.node_class(self.m, [], is_leaf=True)
+
+    # keys must be given in increasing order
+    def bulk_load(self, keys: Iterable, values: Iterable[Any] = None) -> BaseNode:
+        return self.node_class.bulk_load(self.m, keys, self.fill_factor, values)
+
+    def __repr__(self) -> str:
+        return "TreeConfig(m=%d, node_class=%s, split_policy=%r, fill_factor=%r)" % (
+            self.m, self.node_class.__name__, self.split_policy, self.fill_factor)
+
+
+# How full the nodes of the tree under root are, by level from the root down:
+# the node and key counts and the fill, keys per node over m, on average and
+# of the emptiest and the fullest node. fill and leaf_fill are the averages of
+# all nodes and of the leaves.
+def fill_report(root: BaseNode) -> dict:
+    levels, level = [], [root]
+    while level:
+        sizes = [len(node.keys) for node in level]
+        levels.append({'nodes': len(level), 'keys': sum(sizes), 'fill': sum(sizes) / (len(level) * root.m),
+                       'min_fill': min(sizes) / root.m, 'max_fill': max(sizes) / root.m})
+        level = [] if level[0].is_leaf else [child for node in level for child in node.children]
+    nodes = sum(stats['nodes'] for stats in levels)
+    return {'m': root.m, 'height': len(levels), 'nodes': nodes,
+            'fill': sum(stats['keys'] for stats in levels) / (nodes * root.m),
+            'leaf_fill': levels[-1]['fill'], 'levels': levels}
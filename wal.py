@@ -0,0 +1,285 @@
+from __future__ import annotations
+import os
+import pickle
+import struct
+import threading
+import zlib
+from typing import Any, Iterable, Iterator, List, Sized, Tuple, Type
+
+from btree import Node, _values_for
+from codec import decode_key, encode_key
+
+# every record: crc32 of the rest, value length, lsn, operation, key, then the
+# pickled value. A value length of 0 stands for None. An int64 key is stored
+# in the record itself; any other key, e.g. bytes, is encoded by
+# codec.encode_key and follows the record instead, with its length in place
+# of the key and ENCODED_KEY set in the operation.
+RECORD_CRC = struct.Struct('<I')
+RECORD = struct.Struct('<IQBq')
+INSERT, PUT, DELETE = 1, 2, 3
+ENCODED_KEY = 0x80
+# the snapshot starts with the lsn of the last record it contains
+SNAPSHOT_LSN = struct.Struct('<Q')
+
+
+# An append-only log of logical operations. Records are buffered in memory and
+# written with one fsync per group: sync() makes the first waiting thread the
+# leader, which writes out everything buffered so far while later callers wait
+# for it instead of issuing their own fsync.
+class WriteAheadLog:
+    def __init__(self, path: str, group_size: int = 128):
+        self.path = path
+        self.group_size = group_size
+        self.file = open(path, 'a+b')
+        self.lock = threading.Lock()
+        self.synced = threading.Condition(self.lock)
+        self.pending: List[bytes] = []
+        self.syncing = False
+        self.lsn = 0
+        self.durable_lsn = 0
+        self.syncs = 0
+
+    # yields (lsn, operation, key, value) of every complete record, a torn or
+    # corrupt tail left by a crash is cut off
+    def replay(self) -> Iterator[Tuple[int, int, Any, Any]]:
+        self.file.seek(0)
+        data = self.file.read()
+        offset = 0
+        while offset + RECORD_CRC.size + RECORD.size <= len(data):
+            crc, = RECORD_CRC.unpack_from(data, offset)
+            length, lsn, operation, key = RECORD.unpack_from(data, offset + RECORD_CRC.size)
+            start = offset + RECORD_CRC.size + RECORD.size
+            key_length = key if operation & ENCODED_KEY else 0
+            end = start + key_length + length
+            if key_length < 0 or end > len(data) or zlib.crc32(data[offset + RECORD_CRC.size:end]) != crc:
+                break
+            if key_length:
+                key = decode_key(data[start:start + key_length])
+                operation &= ~ENCODED_KEY
+            value = pickle.loads(data[end - length:end]) if length else None
+            offset = end
+            self.lsn = self.durable_lsn = lsn
+            yield lsn, operation, key, value
+        if offset < len(data):
+            self.file.truncate(offset)
+
+    def append(self, operation: int, key, value: Any = None) -> int:
+        return self.append_many(operation, [(key, value)])
+
+    # appends a record for every (key, value), returns the lsn of the last one.
+    # All of them are encoded first, a key or value that cannot be leaves the
+    # log as it was
+    def append_many(self, operation: int, items: Iterable[Tuple[Any, Any]]) -> int:
+        return self.append_records(self.encode(operation, items))
+
+    # the records of operation on every (key, value), ready for append_records;
+    # raises for a key or value that cannot be logged
+    def encode(self, operation: int, items: Iterable[Tuple[Any, Any]]) -> List[Tuple[int, int, bytes, bytes]]:
+        records = []
+        for key, value in items:
+            data = b'' if value is None else pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            if isinstance(key, int) and -2 ** 63 <= key < 2 ** 63:
+                records.append((operation, key, b'', data))
+            else:
+                encoded = encode_key(key)
+                records.append((operation | ENCODED_KEY, len(encoded), encoded, data))
+        return records
+
+    def append_records(self, records: List[Tuple[int, int, bytes, bytes]]) -> int:
+        with self.lock:
+            for record_operation, key, encoded, data in records:
+                self.lsn += 1
+                body = RECORD.pack(len(data), self.lsn, record_operation, key) + encoded + data
+                self.pending.append(RECORD_CRC.pack(zlib.crc32(body)) + body)
+            return self.lsn
+
+    @property
+    def group_full(self) -> bool:
+        return len(self.pending) >= self.group_size
+
+    # returns once every record up to lsn, by default all appended ones, is on disk
+    def sync(self, lsn: int = None):
+        with self.lock:
+            lsn = self.lsn if lsn is None else lsn
+            while self.durable_lsn < lsn:
+                if self.syncing:
+                    self.synced.wait()
+                    continue
+                batch, self.pending = self.pending, []
+                target = self.lsn
+                self.syncing = True
+                self.lock.release()
+                try:
+                    self.file.write(b''.join(batch))
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                finally:
+                    self.lock.acquire()
+                    self.syncing = False
+                    self.synced.notify_all()
+                self.durable_lsn = target
+                self.syncs += 1
+
+    # drops every record, the caller has saved their effect elsewhere
+    def reset(self):
+        with self.lock:
+            self.pending = []
+            self.durable_lsn = self.lsn
+            self.file.truncate(0)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+
+def _apply(root: Node, operation: int, key: int, value: Any) -> Node:
+    if operation == PUT:
+        return root.put(key, value)
+    found = root.search(key)[0]
+    if operation == INSERT and not found:
+        return root.insert(key, value)
+    if operation == DELETE and found:
+        root.delete(key)
+    return root
+
+
+# An in-memory tree made durable by a snapshot plus a write-ahead log in
+# directory. Every change is logged once the tree took it, a change is durable
+# once commit() returns or its group has been synced. Opening the directory
+# recovers the tree from the last snapshot and the log written after it.
+# Keys can be int or anything else codec.encode_key takes, e.g. the bytes of
+# a KeyedBTree; a snapshot holds int64 or bytes keys, as Node.dump does.
+class LoggedBTree:
+    def __init__(self, directory: str, m: int = 4, node_class: Type[Node] = Node, group_size: int = 128):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, 'snapshot')
+        self.m = m
+        self.node_class = node_class
+        self.lock = threading.RLock()
+        self.wal = WriteAheadLog(os.path.join(directory, 'wal'), group_size)
+        self.root: Node = None
+        # log records recover() could not apply, see there
+        self.skipped = 0
+        self.recover()
+
+    # loads the last snapshot and replays the log records newer than it,
+    # returns the number of replayed records. Only changes the tree took are
+    # logged, but a record it refuses on replay, e.g. from a log written
+    # before that, is skipped and counted in skipped rather than leaving the
+    # directory impossible to open
+    def recover(self) -> int:
+        with self.lock:
+            snapshot_lsn = 0
+            if os.path.exists(self.snapshot_path):
+                with open(self.snapshot_path, 'rb') as fp:
+                    snapshot_lsn, = SNAPSHOT_LSN.unpack(fp.read(SNAPSHOT_LSN.size))
+                    self.root = self.node_class.load(fp)
+                self.m = self.root.m
+            else:
+                self.root = self.node_class(self.m, [], is_leaf=True)
+            replayed = 0
+            self.skipped = 0
+            for lsn, operation, key, value in self.wal.replay():
+                if lsn > snapshot_lsn:
+                    try:
+                        self.root = _apply(self.root, operation, key, value)
+                    except Exception:
+                        self.skipped += 1
+                        continue
+                    replayed += 1
+            self.wal.lsn = self.wal.durable_lsn = max(snapshot_lsn, self.wal.lsn)
+            return replayed
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self.root.get(key, default)
+
+    def __contains__(self, key) -> bool:
+        with self.lock:
+            return self.root.search(key)[0]
+
+    def items(self, lo=None, hi=None) -> List[Tuple[int, Any]]:
+        with self.lock:
+            return list(self.root.items(lo, hi))
+
+    def insert(self, key, value=None):
+        with self.lock:
+            records = self.wal.encode(INSERT, [(key, value)])
+            self.root = _apply(self.root, INSERT, key, value)
+            self.wal.append_records(records)
+        self._sync_full_group()
+
+    def put(self, key, value):
+        with self.lock:
+            records = self.wal.encode(PUT, [(key, value)])
+            self.root = self.root.put(key, value)
+            self.wal.append_records(records)
+        self._sync_full_group()
+
+    def delete(self, key):
+        with self.lock:
+            if not self.root.search(key)[0]:
+                # nothing to log, the tree raises its not found error
+                self.root.delete(key)
+            records = self.wal.encode(DELETE, [(key, None)])
+            self.root.delete(key)
+            self.wal.append_records(records)
+        self._sync_full_group()
+
+    def insert_many(self, keys: Iterable[int], values: Iterable[Any] = None):
+        # the last value given for a key wins, as in Node.insert_many
+        if not isinstance(keys, Sized):
+            keys = list(keys)
+        batch = dict(zip(keys, _values_for(keys, values)))
+        with self.lock:
+            records = self.wal.encode(INSERT, batch.items())
+            self.root = self.root.insert_many(batch.keys(), batch.values())
+            self.wal.append_records(records)
+        self._sync_full_group()
+
+    def delete_many(self, keys: Iterable[int]) -> int:
+        with self.lock:
+            batch = [key for key in set(keys) if self.root.search(key)[0]]
+            records = self.wal.encode(DELETE, ((key, None) for key in batch))
+            deleted = self.root.delete_many(batch)
+            self.wal.append_records(records)
+        self._sync_full_group()
+        return deleted
+
+    def _sync_full_group(self):
+        if self.wal.group_full:
+            self.wal.sync()
+
+    # makes every change made so far durable
+    def commit(self):
+        self.wal.sync()
+
+    # writes a new snapshot and empties the log
+    def checkpoint(self):
+        with self.lock:
+            self.wal.sync()
+            temporary = self.snapshot_path + '.tmp'
+            with open(temporary, 'wb') as fp:
+                fp.write(SNAPSHOT_LSN.pack(self.wal.lsn))
+                self.root.dump(fp)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(temporary, self.snapshot_path)
+            directory = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+            self.wal.reset()
+
+    def close(self):
+        self.wal.close()
+
+    def __enter__(self) -> LoggedBTree:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()